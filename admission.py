@@ -0,0 +1,209 @@
+
+# Python
+import os
+import time
+import asyncio
+import multiprocessing
+from threading import Lock
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+# AnyIO
+from anyio.to_thread import current_default_thread_limiter
+
+# Starlette
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Threads running the sync path operations and dependencies in every worker (AnyIO default: 40)
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", 40))
+
+
+class Overloaded(Exception):
+    pass
+
+
+# Limits
+class ConcurrencyLimit:
+    """At most `max_concurrency` requests of a class at once, the others wait in line up to `max_wait` seconds.
+
+    Waiting requests hold no thread, only a future of their event loop, and a released slot goes straight
+    to the oldest waiter. A request still waiting at its deadline is shed instead of joining an invisible
+    queue in front of the thread pool.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = Lock()
+        # Measurements
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def acquire(self) -> float:
+        """Take a slot, returns the seconds waited for it (raises Overloaded past the deadline)."""
+        start = time.perf_counter()
+        with self._lock:
+            while self._waiters and self._waiters[0][1].cancelled():  # Gave up before their turn
+                self._waiters.popleft()
+            if self.active < self.max_concurrency and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return 0.0
+            if self.max_wait <= 0:
+                self.rejected += 1
+                raise Overloaded()
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except BaseException as error:  # The deadline, or the request cancelled while waiting (client gone)
+            timed_out = isinstance(error, asyncio.TimeoutError)
+            with self._lock:
+                granted = future.done()
+                if not granted:
+                    future.cancel()  # Skipped by release
+                    if timed_out:
+                        self.rejected += 1
+            if not timed_out:
+                if granted:  # The slot came with the cancellation, pass it on
+                    self.release()
+                raise
+            if not granted:
+                raise Overloaded()
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.admitted += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if future.cancelled():
+                    continue
+                # The slot passes to the waiter as is, `active` does not change
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:  # Its loop is closed
+                    continue
+            self.active -= 1
+
+    def _grant(self, future: asyncio.Future):
+        with self._lock:
+            if not future.done():
+                future.set_result(None)
+                return
+        self.release()  # Gave up meanwhile, the slot goes to the next one
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_wait": self.max_wait,
+                "active": self.active,
+                "waiting": sum(not future.done() for _, future in self._waiters),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_mean_ms": round(1000 * self.wait_total / self.admitted, 3) if self.admitted else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+            }
+
+
+def limit_from_environment(name: str, max_concurrency: int, max_wait: float) -> ConcurrencyLimit:
+    prefix = f"ADMISSION_{name.upper()}"
+    return ConcurrencyLimit(
+        name,
+        max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", max_concurrency)),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT", max_wait))
+    )
+
+
+# Defaults share the thread pool: bcrypt is CPU bound, so the login and signup work is capped near the core
+# count, and reads keep slots when writes pile up (and the other way around)
+auth_limit = limit_from_environment("auth", max(1, min(multiprocessing.cpu_count(), THREAD_POOL_SIZE // 8)), 2.0)
+write_limit = limit_from_environment("write", max(1, THREAD_POOL_SIZE // 4), 1.0)
+read_limit = limit_from_environment("read", max(1, THREAD_POOL_SIZE // 2), 1.0)
+
+admission_limits = {limit.name: limit for limit in (auth_limit, write_limit, read_limit)}
+
+
+def thread_pool_stats() -> dict:
+    """Occupancy of the thread pool of the running event loop."""
+    limiter = current_default_thread_limiter()
+    return {
+        "size": limiter.total_tokens,
+        "busy": limiter.borrowed_tokens,
+        "waiting": limiter.statistics().tasks_waiting,
+    }
+
+
+# Middleware
+class AdmissionMiddleware:
+    """Per route class concurrency limits in front of the thread pool.
+
+    `routes` maps paths to a limit name, the other requests are reads (GET, HEAD) or writes. `exempt` paths
+    (long lived streams) are not limited. Shed requests get a 503 with Retry-After, admitted ones a
+    Server-Timing header with their wait in line.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            limits: Dict[str, ConcurrencyLimit],
+            routes: Optional[Dict[str, str]] = None,
+            exempt: Iterable[str] = (),
+            enabled: bool = True
+    ):
+        self.app = app
+        self.limits = limits
+        self.routes = routes or {}
+        self.exempt = set(exempt)
+        self.enabled = enabled
+
+    def limit_for(self, scope: Scope) -> Optional[ConcurrencyLimit]:
+        path, method = scope["path"], scope["method"]
+        if path in self.exempt or method == "OPTIONS":
+            return None
+        name = self.routes.get(path, "read" if method in ("GET", "HEAD") else "write")
+        return self.limits.get(name)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limit_for(scope) if self.enabled and scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            waited = await limit.acquire()
+        except Overloaded:
+            body = b'{"detail":"The server is overloaded, retry later"}'
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, round(limit.max_wait))).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        timing = f"queue;desc={limit.name};dur={1000 * waited:.1f}".encode()
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", timing)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            limit.release()
@@ -1,12 +1,19 @@
 
 # Libraries
+import os
 import json
 
+NOTIFICATIONS_FILE = os.getenv("NOTIFICATIONS_FILE", "email.json")
+
 
 # Function
 def write_notification(email: str, message: str):
-    with open("email.json", "r+", encoding="utf-8") as f:
-        content = json.loads(f.read())
+    if not os.path.exists(NOTIFICATIONS_FILE):
+        with open(NOTIFICATIONS_FILE, "w", encoding="utf-8") as f:
+            f.write("{}")
+
+    with open(NOTIFICATIONS_FILE, "r+", encoding="utf-8") as f:
+        content = json.loads(f.read() or "{}")
 
         if email not in content:
             content[email] = []
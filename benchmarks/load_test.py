@@ -0,0 +1,226 @@
+
+# Python
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# HTTP
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PASSWORD = "thisistheloadtestpassword"
+
+# Relative weight of every route in the traffic mix
+ROUTE_MIX = {
+    "POST /login": 5,
+    "GET /": 30,
+    "POST /post": 15,
+    "GET /tweets/{tweet_id}": 30,
+    "GET /users/me": 20,
+}
+
+
+# Dataset
+def seed_database(database_url: str, users: int, tweets: int, seed: int):
+    """Create the schema and insert a synthetic dataset, all users share the same password."""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, str(ROOT))
+    from sql_app.database import Base, mysql_engine as engine
+    from sql_app.seed import seed_database as seed_rows
+
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        seed_rows(connection, users, tweets, seed, password=PASSWORD)
+        emails = connection.exec_driver_sql("SELECT email FROM users").scalars().all()
+        tweet_ids = connection.exec_driver_sql("SELECT tweet_id FROM tweets").scalars().all()
+    engine.dispose()
+
+    return emails, tweet_ids
+
+
+# Server
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url, RATE_LIMIT_ENABLED="0")
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--no-access-log", "--log-level", "warning",
+    ]
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                raise RuntimeError("The server exited during startup")
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError("The server did not start in 30 seconds")
+
+
+# Load
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Worker:
+    def __init__(self, base_url: str, emails, tweet_ids, seed: int):
+        self.base_url = base_url
+        self.emails = emails
+        self.tweet_ids = tweet_ids
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.email = self.rng.choice(emails)
+        self.header = {"Authorization": "Bearer " + self.login()[1].json()["access_token"]}
+        self.routes = list(ROUTE_MIX)
+        self.weights = list(ROUTE_MIX.values())
+
+    def login(self):
+        return "POST /login", self.session.post(
+            self.base_url + "/login", data={"username": self.email, "password": PASSWORD}
+        )
+
+    def request(self):
+        route = self.rng.choices(self.routes, self.weights)[0]
+
+        if route == "POST /login":
+            return self.login()
+        if route == "GET /":
+            return route, self.session.get(self.base_url + "/")
+        if route == "POST /post":
+            content = {"content": "posted during the load test"}
+            return route, self.session.post(self.base_url + "/post", json=content, headers=self.header)
+        if route == "GET /tweets/{tweet_id}":
+            tweet_id = self.rng.choice(self.tweet_ids)
+            return route, self.session.get(f"{self.base_url}/tweets/{tweet_id}")
+        return route, self.session.get(self.base_url + "/users/me", headers=self.header)
+
+    def run(self, stop_at: float, latencies, errors, lock: threading.Lock):
+        local_latencies = defaultdict(list)
+        local_errors = defaultdict(int)
+
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            route, response = self.request()
+            local_latencies[route].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                local_errors[route] += 1
+
+        with lock:
+            for route, values in local_latencies.items():
+                latencies[route].extend(values)
+            for route, count in local_errors.items():
+                errors[route] += count
+
+
+def run_level(base_url: str, concurrency: int, duration: float, emails, tweet_ids, seed: int) -> dict:
+    workers = [Worker(base_url, emails, tweet_ids, seed + number) for number in range(concurrency)]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    stop_at = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker.run, stop_at, latencies, errors, lock) for worker in workers]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for route in ROUTE_MIX:
+        values = sorted(latencies.get(route, []))
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors.get(route, 0),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 2),
+        "routes": routes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP load test of main.app against a SQLite database.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tweets", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Defaults to a new SQLite file in a temporary directory")
+    parser.add_argument("--output", type=Path, default=ROOT / "benchmarks" / "results" / "load_test.json")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite:///{directory}/load_test.db"
+        emails, tweet_ids = seed_database(database_url, args.users, args.tweets, args.seed)
+
+        port = free_port()
+        server = start_server(database_url, port, args.workers)
+        try:
+            levels = []
+            for concurrency in args.concurrency:
+                level = run_level(f"http://127.0.0.1:{port}", concurrency, args.duration, emails, tweet_ids, args.seed)
+                print(f"concurrency={concurrency}: {level['rps']} req/s", file=sys.stderr)
+                levels.append(level)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "benchmark": "load_test",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users,
+            "tweets": args.tweets,
+            "duration": args.duration,
+            "workers": args.workers,
+            "seed": args.seed,
+            "route_mix": ROUTE_MIX,
+        },
+        "levels": levels,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
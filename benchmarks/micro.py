@@ -0,0 +1,320 @@
+
+# Python
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+from uuid import uuid4
+from pathlib import Path
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The benchmarks build their own SQLite databases, and time the lookups without the entity cache
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ENTITY_CACHE_SIZE", "0")
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# FastAPI
+from fastapi.encoders import jsonable_encoder
+
+# App
+from models import Tweet, User
+from sql_app import crud
+from sql_app.database import Base
+from sql_app.search import name_keys
+from sql_app.sqlalchemy_models import UserDB, TweetDB
+from sql_app.hashing import pwd_context, get_password_hash, verify_password
+from controllers.token import create_access_token, verify_token
+
+TABLE_SIZES = (100, 1_000, 10_000)
+BCRYPT_ROUNDS = (4, 8, 10, 12)
+PASSWORD = "thisisthebenchmarkpassword"
+
+benchmarks: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """Register a setup function that returns the callable to time."""
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+# Fixtures
+def make_session(size: int, seed: int = 42):
+    """In-memory database with `size` users and `size` tweets."""
+    rng = random.Random(seed)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    hashed_password = get_password_hash(PASSWORD)
+    users = [
+        {
+            "user_id": str(uuid4()),
+            "first_name": f"Bench{number}",
+            "last_name": "Mark",
+            "email": f"bench{number}@example.com",
+            "password": hashed_password,
+            "birth_date": date(1990, 1, 1),
+            "country": "Peru",
+            "creation_account_date": date(2020, 1, 1),
+            **name_keys(f"Bench{number}", "Mark"),
+        }
+        for number in range(size)
+    ]
+    tweets = [
+        {
+            "tweet_id": str(uuid4()),
+            "content": "benchmark tweet " * rng.randint(1, 15),
+            "created_at": date(2022, 1, 1) + timedelta(days=rng.randint(0, 300)),
+            "updated_at": date(2022, 12, 1),
+            "user_id": rng.choice(users)["user_id"],
+        }
+        for _ in range(size)
+    ]
+
+    with engine.begin() as connection:
+        connection.execute(UserDB.__table__.insert(), users)
+        connection.execute(TweetDB.__table__.insert(), tweets)
+
+    return sessionmaker(bind=engine)(), users, tweets
+
+
+# CRUD
+for table_size in TABLE_SIZES:
+    @benchmark(f"crud.get_tweets[{table_size}]")
+    def setup_get_tweets(size=table_size):
+        db, _, _ = make_session(size)
+
+        def run():
+            tweets = crud.get_tweets(db)
+            db.expunge_all()
+            return tweets
+        return run
+
+    @benchmark(f"orm.get_tweets[{table_size}]")
+    def setup_orm_get_tweets(size=table_size):
+        """The ORM entities crud.get_tweets used to hydrate, to compare with its records."""
+        db, _, _ = make_session(size)
+
+        def run():
+            tweets = db.query(TweetDB).all()
+            db.expunge_all()
+            return tweets
+        return run
+
+    @benchmark(f"crud.get_users[{table_size}]")
+    def setup_get_users(size=table_size):
+        db, _, _ = make_session(size)
+        return lambda: crud.get_users(db)
+
+    @benchmark(f"crud.search_users[{table_size}]")
+    def setup_search_users(size=table_size):
+        """A typeahead: a first or last name prefix, one page of 20."""
+        db, _, _ = make_session(size)
+        prefixes = ["bench1", "bench42", "mark", "benc"]
+        rng = random.Random(0)
+        return lambda: crud.search_users(db, rng.choice(prefixes))
+
+    @benchmark(f"crud.get_user_by_email[{table_size}]")
+    def setup_get_user_by_email(size=table_size):
+        db, users, _ = make_session(size)
+        emails = [user["email"] for user in users]
+        rng = random.Random(0)
+
+        def run():
+            user = crud.get_user_by_email(db, rng.choice(emails))
+            db.expunge_all()
+            return user
+        return run
+
+    @benchmark(f"orm.get_user_by_email[{table_size}]")
+    def setup_orm_get_user_by_email(size=table_size):
+        """A new Query per call, like crud.get_user_by_email before its cached statement."""
+        db, users, _ = make_session(size)
+        emails = [user["email"] for user in users]
+        rng = random.Random(0)
+
+        def run():
+            user = db.query(UserDB).filter(UserDB.email == rng.choice(emails)).first()
+            db.expunge_all()
+            return user
+        return run
+
+    @benchmark(f"crud.get_user_by_id[{table_size}]")
+    def setup_get_user_by_id(size=table_size):
+        db, users, _ = make_session(size)
+        user_ids = [user["user_id"] for user in users]
+        rng = random.Random(0)
+
+        def run():
+            user = crud.get_user_by_id(db, rng.choice(user_ids))
+            db.expunge_all()
+            return user
+        return run
+
+    @benchmark(f"crud.get_tweet_by_id[{table_size}]")
+    def setup_get_tweet_by_id(size=table_size):
+        db, _, tweets = make_session(size)
+        tweet_ids = [tweet["tweet_id"] for tweet in tweets]
+        rng = random.Random(0)
+
+        def run():
+            tweet = crud.get_tweet_by_id(db, rng.choice(tweet_ids))
+            db.expunge_all()
+            return tweet
+        return run
+
+    @benchmark(f"orm.get_tweet_by_id[{table_size}]")
+    def setup_orm_get_tweet_by_id(size=table_size):
+        db, _, tweets = make_session(size)
+        tweet_ids = [tweet["tweet_id"] for tweet in tweets]
+        rng = random.Random(0)
+
+        def run():
+            tweet = db.query(TweetDB).filter(TweetDB.tweet_id == rng.choice(tweet_ids)).first()
+            db.expunge_all()
+            return tweet
+        return run
+
+
+# Auth
+@benchmark("token.create_access_token")
+def setup_create_access_token():
+    return lambda: create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+
+
+@benchmark("token.verify_token")
+def setup_verify_token():
+    token = create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+    return lambda: verify_token(token)
+
+
+for bcrypt_rounds in BCRYPT_ROUNDS:
+    @benchmark(f"hashing.get_password_hash[rounds={bcrypt_rounds}]")
+    def setup_hash(rounds=bcrypt_rounds):
+        context = pwd_context.using(rounds=rounds)
+        return lambda: context.hash(PASSWORD)
+
+    @benchmark(f"hashing.verify_password[rounds={bcrypt_rounds}]")
+    def setup_verify(rounds=bcrypt_rounds):
+        hashed_password = pwd_context.using(rounds=rounds).hash(PASSWORD)
+        return lambda: verify_password(PASSWORD, hashed_password)
+
+
+# Serialization
+for table_size in TABLE_SIZES[:2]:
+    @benchmark(f"serialize.tweets[{table_size}]")
+    def setup_serialize_tweets(size=table_size):
+        db, _, _ = make_session(size)
+        db_tweets = crud.get_tweets(db)
+        return lambda: jsonable_encoder([Tweet.from_orm(db_tweet) for db_tweet in db_tweets])
+
+    @benchmark(f"serialize.users[{table_size}]")
+    def setup_serialize_users(size=table_size):
+        db, _, _ = make_session(size)
+        db_users = crud.get_users(db)
+        return lambda: jsonable_encoder([User.from_orm(db_user) for db_user in db_users])
+
+
+# Runner
+def measure(run: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """Median and best seconds per call over `repeat` rounds of at least `min_time` each."""
+    run()  # Warm up
+
+    # Calls per round, like timeit.autorange
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        rounds.append((time.perf_counter() - start) / number)
+
+    median = statistics.median(rounds)
+    return {
+        "calls_per_round": number,
+        "median_s": median,
+        "min_s": min(rounds),
+        "stdev_s": statistics.pstdev(rounds),
+        "ops_per_s": round(1 / median, 2) if median else None,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Names of the benchmarks whose median got slower than the baseline by more than `threshold`."""
+    regressions = []
+    print(f"{'benchmark':50} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_s"], result["median_s"]
+        change = (after - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:50} {before * 1e6:10.1f}us {after * 1e6:10.1f}us {change:+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the CRUD, auth and serialization layers.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--output", type=Path, default=ROOT / "benchmarks" / "results" / "micro.json")
+    parser.add_argument("--compare", type=Path, help="Previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before failing (0.10 = 10%%)")
+    parser.add_argument("--list", action="store_true", help="Only list the benchmark names")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in benchmarks if args.filter in name]
+    if args.list:
+        print("\n".join(selected))
+        return
+
+    results = {}
+    for name in selected:
+        results[name] = measure(benchmarks[name](), args.repeat, args.min_time)
+        print(f"{name:50} {results[name]['median_s'] * 1e6:12.1f}us", file=sys.stderr)
+
+    report = {
+        "benchmark": "micro",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+
+# Python
+import zlib
+import hashlib
+from threading import Lock
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Optional encoders
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+# Encoders
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so every streamed chunk reaches the client right away
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Server preference order, only the installed ones
+encoders = {"gzip": GzipEncoder}
+if brotli is not None:
+    encoders["br"] = BrotliEncoder
+if zstandard is not None:
+    encoders["zstd"] = ZstdEncoder
+
+preferred_encodings = [encoding for encoding in ("zstd", "br", "gzip") if encoding in encoders]
+
+default_levels = {"gzip": 6, "br": 4, "zstd": 3}
+
+# Media types that are already compressed, and event streams (one compressor per open connection)
+skip_content_types = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred available encoding with the highest q-value, None for identity."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in preferred_encodings:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+
+    return best_encoding
+
+
+# Cache
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by encoding and ETag (or body digest), bounded in bytes."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(encoding: str, body: bytes, path: str, etag: Optional[str] = None):
+        if etag is not None:
+            return encoding, path, etag
+        return encoding, hashlib.blake2b(body, digest_size=16).digest()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return compressed
+
+    def set(self, key, compressed: bytes):
+        if len(compressed) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+
+            self._entries[key] = compressed
+            self.current_bytes += len(compressed)
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+# Middleware
+class CompressionMiddleware:
+    """Negotiates gzip/br/zstd from Accept-Encoding.
+
+    Body messages are buffered up to the route threshold before deciding: bodies that end below it
+    are sent as they are, whole bodies are compressed at once (and cached for repeated responses),
+    and the longer streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int = 500,
+            route_minimum_sizes: Optional[Dict[str, int]] = None,
+            levels: Optional[Dict[str, int]] = None,
+            cache_max_bytes: int = 32 * 1024 * 1024
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        # Longest prefix wins
+        self.route_minimum_sizes = sorted((route_minimum_sizes or {}).items(), key=lambda item: -len(item[0]))
+        self.levels = {**default_levels, **(levels or {})}
+        self.cache = CompressedBodyCache(cache_max_bytes) if cache_max_bytes else None
+
+    def minimum_size_for(self, path: str) -> int:
+        for prefix, minimum_size in self.route_minimum_sizes:
+            if path.startswith(prefix):
+                return minimum_size
+        return self.minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, encoding, scope["path"], send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, path: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.level = middleware.levels[encoding]
+        self.path = path
+        self.minimum_size = middleware.minimum_size_for(path)
+        self.downstream_send = send
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+        self.buffer = []  # Body chunks received before the decision
+        self.buffered = 0
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = "content-encoding" in headers or content_type.startswith(skip_content_types)
+            self.start_message = message
+            if self.passthrough:
+                await self.downstream_send(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream_send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None and self.start_message is not None:
+            # Wait for the end of the body, or for enough of it to be worth compressing
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if more_body and self.buffered < self.minimum_size:
+                return
+            body = b"".join(self.buffer)
+            self.buffer = []
+            start_message, self.start_message = self.start_message, None
+
+            # Whole body
+            if not more_body:
+                if len(body) < self.minimum_size:
+                    await self.downstream_send(start_message)
+                    await self.downstream_send({"type": "http.response.body", "body": body})
+                    return
+
+                etag = Headers(raw=start_message["headers"]).get("etag")
+                compressed = self.compress_whole(body, etag)
+
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(compressed))
+                headers.add_vary_header("Accept-Encoding")
+
+                await self.downstream_send(start_message)
+                await self.downstream_send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streamed body
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "content-length" in headers:
+                del headers["Content-Length"]
+
+            self.encoder = encoders[self.encoding](self.level)
+            await self.downstream_send(start_message)
+
+        if self.encoder is None:
+            await self.downstream_send(message)
+            return
+
+        chunk = self.encoder.compress(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+
+        await self.downstream_send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def compress_whole(self, body: bytes, etag: Optional[str]) -> bytes:
+        cache = self.middleware.cache
+        key = None
+
+        if cache is not None:
+            key = cache.key(f"{self.encoding}:{self.level}", body, self.path, etag)
+            compressed = cache.get(key)
+            if compressed is not None:
+                return compressed
+
+        encoder = encoders[self.encoding](self.level)
+        compressed = encoder.compress(body) + encoder.finish()
+
+        if cache is not None:
+            cache.set(key, compressed)
+        return compressed
@@ -6,6 +6,8 @@ from fastapi import APIRouter
 from .auth import router as auth_router
 from .user import router as user_router
 from .tweet import router as tweet_router
+from .sync import router as sync_router
+from .admin import router as admin_router
 
 
 router = APIRouter()
@@ -14,3 +16,5 @@ router = APIRouter()
 router.include_router(auth_router)
 router.include_router(user_router)
 router.include_router(tweet_router)
+router.include_router(sync_router)
+router.include_router(admin_router)
@@ -0,0 +1,285 @@
+# Python
+from enum import Enum
+from typing import Optional
+
+# FastAPI
+from fastapi import APIRouter, Depends
+from fastapi import status, HTTPException
+from fastapi import Path, Query, File, UploadFile
+from fastapi.responses import StreamingResponse
+
+# Database
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sql_app import crud, dump, maintenance
+
+# Admission Control
+from admission import admission_limits, thread_pool_stats
+
+# Dependencies
+from sql_app.dependencies import get_db
+from .oauth2 import admin_dependencies
+
+# Tags
+from .tags import Tags
+
+
+router = APIRouter(tags=[Tags.admin], dependencies=admin_dependencies)
+
+
+class DumpTable(str, Enum):
+    users = 'users'
+    tweets = 'tweets'
+    follows = 'follows'
+    timeline_entries = 'timeline_entries'
+
+
+class DumpFormat(str, Enum):
+    ndjson = 'ndjson'
+    csv = 'csv'
+
+
+# Admin Path Operations
+
+## Export a table
+@router.get(
+    path="/admin/export/{table}",
+    status_code=status.HTTP_200_OK,
+    summary='Export a table as a compressed dump'
+)
+def export_table(
+        table: DumpTable = Path(..., title="Table", description="Table to export."),
+        format: DumpFormat = Query(default=DumpFormat.ndjson, description="Rows format inside the gzip file."),
+        db: Session = Depends(get_db)
+):
+    """
+    Export Table
+
+    This path operation streams a whole table as a gzip file, reading the rows with a server-side cursor
+
+    Parameters:
+    - Path Parameters:
+        - **table: DumpTable**
+    - Query Parameters:
+        - **format: DumpFormat**
+
+    Returns the `<table>.<format>.gz` file
+    """
+
+    engine = db.get_bind()
+
+    def chunks():
+        with engine.connect() as connection:
+            yield from dump.export_table(connection, table.value, format.value)
+
+    filename = f"{table.value}.{format.value}.gz"
+    return StreamingResponse(
+        chunks(),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+## Restore a table
+@router.post(
+    path="/admin/restore/{table}",
+    status_code=status.HTTP_200_OK,
+    summary='Restore a table from a compressed dump'
+)
+def restore_table(
+        table: DumpTable = Path(..., title="Table", description="Table to restore."),
+        format: DumpFormat = Query(default=DumpFormat.ndjson, description="Rows format inside the gzip file."),
+        file: UploadFile = File(..., description="Dump made by the export operation."),
+        db: Session = Depends(get_db)
+):
+    """
+    Restore Table
+
+    This path operation bulk loads a dump in batched transactions, restore users first (then tweets,
+    follows and timeline_entries)
+
+    Parameters:
+    - Path Parameters:
+        - **table: DumpTable**
+    - Query Parameters:
+        - **format: DumpFormat**
+    - Form Parameters:
+        - **file: UploadFile**
+
+    Returns a json with the load throughput:
+    - table: str
+    - rows: int
+    - seconds: float
+    - rows_per_second: int
+    """
+
+    try:
+        with db.get_bind().connect() as connection:
+            # Live table: the indexes stay (deferring them is for the offline CLI restores)
+            report = dump.restore_table(connection, table.value, file.file, format.value, defer_indexes=False)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Some rows already exist!")
+    crud.clear_caches()
+
+    return report
+
+
+## Trim the home timelines
+@router.post(
+    path="/admin/timelines/trim",
+    status_code=status.HTTP_200_OK,
+    summary='Trim the home timelines'
+)
+def trim_timelines(
+        max_length: Optional[int] = Query(default=None, ge=1, description="Entries kept per timeline."),
+        db: Session = Depends(get_db)
+):
+    """
+    Trim Timelines
+
+    This path operation deletes the oldest entries of every home timeline longer than max_length
+    (TIMELINE_MAX_LENGTH by default)
+
+    Parameters:
+    - Query Parameters:
+        - **max_length: Optional[int]**
+
+    Returns a json with the following keys:
+    - timelines: int
+    - deleted_entries: int
+    """
+
+    return maintenance.trim_timelines(db, max_length)
+
+
+## Reconcile the user counters
+@router.post(
+    path="/admin/counters/reconcile",
+    status_code=status.HTTP_200_OK,
+    summary='Reconcile the user counters'
+)
+def reconcile_counters(
+        batch_size: int = Query(default=1000, ge=1, le=10000, description="Users checked per chunk."),
+        db: Session = Depends(get_db)
+):
+    """
+    Reconcile Counters
+
+    This path operation recounts the tweets, followers and following of every user and fixes the
+    stored counters that drifted
+
+    Parameters:
+    - Query Parameters:
+        - **batch_size: int**
+
+    Returns a json with the following keys:
+    - users: int
+    - fixed: int
+    - skipped: int (changed by a write meanwhile, checked again by the next run)
+    """
+
+    report = maintenance.reconcile_counters(db, batch_size)
+    db.commit()
+    crud.clear_caches()
+
+    return report
+
+
+## Compact the change log
+@router.post(
+    path="/admin/changes/compact",
+    status_code=status.HTTP_200_OK,
+    summary='Compact the change log'
+)
+def compact_changes(db: Session = Depends(get_db)):
+    """
+    Compact Changes
+
+    This path operation deletes the change log entries superseded by a later change of the same
+    tweet or user
+
+    Returns a json with the following keys:
+    - deleted_changes: int
+    """
+
+    report = maintenance.compact_changes(db)
+    db.commit()
+
+    return report
+
+
+## Archive the cold tweets
+@router.post(
+    path="/admin/tweets/archive",
+    status_code=status.HTTP_200_OK,
+    summary='Archive the cold tweets'
+)
+def archive_tweets(
+        older_than_days: Optional[int] = Query(default=None, ge=0, description="Age of the archived tweets."),
+        db: Session = Depends(get_db)
+):
+    """
+    Archive Tweets
+
+    This path operation moves the tweets created more than older_than_days days ago (ARCHIVE_AFTER_DAYS by
+    default) from the tweets table to compressed archive segments, where they stay readable by id, in the
+    home timelines and in the tweets of their authors
+
+    Parameters:
+    - Query Parameters:
+        - **older_than_days: Optional[int]**
+
+    Returns a json with the following keys:
+    - archived: int
+    - segments: int
+    """
+    try:
+        return maintenance.archive_tweets(db, older_than_days)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+
+## Admission control measurements
+@router.get(
+    path="/admin/admission",
+    status_code=status.HTTP_200_OK,
+    summary='Show the admission control measurements'
+)
+async def show_admission():
+    """
+    Show Admission
+
+    This path operation shows the occupancy of the thread pool of this worker and, for every route class
+    (auth, write, read), its concurrency limit, the requests running and waiting, and the time spent
+    waiting for a slot
+
+    Returns a json with the following keys:
+    - thread_pool: size, busy and waiting
+    - limits: max_concurrency, max_wait, active, waiting, admitted, rejected, wait_mean_ms and wait_max_ms
+      of every route class
+    """
+
+    return {
+        "thread_pool": thread_pool_stats(),
+        "limits": {name: limit.stats() for name, limit in admission_limits.items()}
+    }
+
+
+## Entity cache measurements
+@router.get(
+    path="/admin/cache",
+    status_code=status.HTTP_200_OK,
+    summary='Show the entity cache measurements'
+)
+async def show_cache():
+    """
+    Show Cache
+
+    This path operation shows the tweet and user caches of this worker: their size, hits (of rows and of
+    missing ids), misses, lookups that waited for the load of another request, loads, evictions and
+    invalidations
+
+    Returns a json with the measurements of every enabled cache (tweets, users)
+    """
+
+    return crud.cache_stats()
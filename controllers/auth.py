@@ -18,6 +18,7 @@ from sql_app.database import mysql_engine as engine
 
 # Dependencies
 from sql_app.dependencies import get_db
+from .rate_limit import login_rate_limit
 
 # Hashing
 from sql_app.hashing import verify_password
@@ -38,7 +39,8 @@ router = APIRouter(tags=[Tags.auth])
     path="/login",
     response_model=Token,
     status_code=status.HTTP_200_OK,
-    summary='Login a User'
+    summary='Login a User',
+    dependencies=[Depends(login_rate_limit)]
 )
 def login(
         db: Session = Depends(get_db),
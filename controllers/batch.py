@@ -0,0 +1,64 @@
+
+# Python
+from uuid import UUID
+from typing import Dict, List, Optional
+
+# FastAPI
+from fastapi import Query, status, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Models
+from models import BATCH_MAX_IDS
+
+# Sparse Fieldsets
+from .fieldsets import project, Expand
+
+
+# Batch Lookups
+def unique_ids(ids: List[UUID]) -> List[str]:
+    """Ids as stored in the database, in the requested order without repetitions."""
+    return list(dict.fromkeys(str(entity_id) for entity_id in ids))
+
+
+def parse_ids(
+        ids: Optional[str] = Query(
+            default=None,
+            title="IDs",
+            description=f"Comma separated UUIDs to look up (at most {BATCH_MAX_IDS}), POST them for long lists"
+        )
+) -> Optional[List[str]]:
+    if ids is None:
+        return None
+
+    values = [value.strip() for value in ids.split(",") if value.strip()]
+    try:
+        parsed = unique_ids([UUID(value) for value in values])
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be comma separated UUIDs"
+        )
+    if not parsed or len(parsed) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"ids must hold between 1 and {BATCH_MAX_IDS} UUIDs"
+        )
+    return parsed
+
+
+def batch_response(
+        key: str,
+        ids: List[str],
+        found: Dict[str, object],
+        fields: Optional[List[str]] = None,
+        expand: Optional[Expand] = None
+):
+    """The found rows in the order of `ids` under `key`, and the ids that matched nothing under "missing"."""
+    rows = [found[entity_id] for entity_id in ids if entity_id in found]
+    missing = [entity_id for entity_id in ids if entity_id not in found]
+
+    if fields or expand:
+        data = {key: [project(row, fields, expand) for row in rows], "missing": missing}
+        return JSONResponse(content=jsonable_encoder(data))
+    return {key: rows, "missing": missing}
@@ -0,0 +1,80 @@
+
+# Python
+from enum import Enum
+from typing import List, Optional, Type
+
+# FastAPI
+from fastapi import Query, status, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Pydantic
+from pydantic import BaseModel
+
+# Models
+from models import Tweet, User, Author
+
+
+# Sparse Fieldsets
+def fields_query(model: Type[BaseModel]):
+    allowed_fields = list(model.__fields__)
+
+    def parse_fields(
+            fields: Optional[str] = Query(
+                default=None,
+                title="Fields",
+                description=f"Comma separated keys to return. Allowed: {', '.join(allowed_fields)}",
+                example=",".join(allowed_fields[:3])
+            )
+    ) -> Optional[List[str]]:
+        if fields is None:
+            return None
+
+        # Keep the requested order, drop blanks and repetitions
+        selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+
+        unknown = [field for field in selected if field not in model.__fields__]
+        if not selected or unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid fields: {', '.join(unknown) or fields!r}. Allowed: {', '.join(allowed_fields)}"
+            )
+        return selected
+
+    return parse_fields
+
+
+tweet_fields = fields_query(Tweet)
+user_fields = fields_query(User)
+
+tweet_field_names = list(Tweet.__fields__)
+author_field_names = list(Author.__fields__)
+
+
+# Expansions
+class Expand(str, Enum):
+    author = 'author'
+
+
+def project(db_object, fields: List[str], expand: Optional[Expand] = None):
+    data = {field: getattr(db_object, field) for field in fields}
+
+    if expand == Expand.author:  # None for a tweet whose author is gone
+        author = db_object.user
+        data["by"] = project(author, author_field_names) if author is not None else None
+    return data
+
+
+def sparse_response(
+        content,
+        fields: List[str],
+        expand: Optional[Expand] = None,
+        status_code: int = status.HTTP_200_OK
+):
+    """Serialize only the selected keys (and expansions), skipping the full response model."""
+    if isinstance(content, list):
+        data = [project(db_object, fields, expand) for db_object in content]
+    else:
+        data = project(content, fields, expand)
+
+    return JSONResponse(content=jsonable_encoder(data), status_code=status_code)
@@ -1,6 +1,7 @@
 
 # Libraries
-from fastapi import Depends
+import os
+from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from .token import verify_token, credentials_exception
 
@@ -22,5 +23,23 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     return user
 
 
+def get_streaming_user_id(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """get_current_user for long-lived responses, which keep their dependencies until they end."""
+    user_id = get_current_user(token, db).user_id
+    db.commit()  # Ends the read transaction: the stream does not hold a pooled connection
+    return user_id
+
+
+# Administrators (comma separated emails)
+ADMIN_EMAILS = {email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+
+def get_current_admin(current_user=Depends(get_current_user)):
+    if current_user.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
+
+
 # Auth Dependencies
 auth_dependencies = [Depends(get_current_user)]
+admin_dependencies = [Depends(get_current_admin)]
@@ -0,0 +1,118 @@
+
+# Python
+import os
+import math
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from collections import OrderedDict
+
+# FastAPI
+from fastapi import Depends, Request, status, HTTPException
+
+# Models
+from models import User
+
+# Dependencies
+from .oauth2 import get_current_user
+
+
+# Backends
+class RateLimitBackend(ABC):
+    """Token-bucket store. Plug a shared implementation to enforce one limit across workers."""
+
+    @abstractmethod
+    def consume(self, key: str, rate: float, capacity: int, cost: int = 1) -> float:
+        """Take `cost` tokens from the bucket of `key`.
+
+        Returns 0 when the request is allowed, otherwise the seconds until enough tokens are refilled.
+        """
+
+
+class MemoryBackend(RateLimitBackend):
+    """In-process buckets, O(1) per check and bounded to `max_keys` (least recently seen are dropped)."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = Lock()
+
+    def consume(self, key: str, rate: float, capacity: int, cost: int = 1) -> float:
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, last_refill = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last_refill) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+backend: RateLimitBackend = MemoryBackend()
+
+
+def set_backend(new_backend: RateLimitBackend):
+    global backend
+    backend = new_backend
+
+
+# Policies
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+
+
+class RateLimit:
+    def __init__(self, policy: str, rate: float, capacity: int):
+        self.policy = policy
+        self.rate = rate  # Tokens refilled per second
+        self.capacity = capacity  # Burst size
+
+    def check(self, key: str):
+        if not RATE_LIMIT_ENABLED:
+            return
+
+        wait = backend.consume(f"{self.policy}:{key}", rate=self.rate, capacity=self.capacity)
+
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, slow down!",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+
+class IPRateLimit(RateLimit):
+    """Keyed by the client address, for anonymous routes."""
+
+    def __call__(self, request: Request):
+        self.check(request.client.host if request.client else "unknown")
+
+
+class UserRateLimit(RateLimit):
+    """Keyed by the authenticated user (get_current_user is cached per request)."""
+
+    def __call__(self, current_user: User = Depends(get_current_user)):
+        self.check(str(current_user.user_id))
+
+
+login_rate_limit = IPRateLimit("login", rate=10 / 60, capacity=10)
+signup_rate_limit = IPRateLimit("signup", rate=5 / 60, capacity=5)
+public_read_rate_limit = IPRateLimit("public_read", rate=5, capacity=20)
+read_rate_limit = UserRateLimit("read", rate=20, capacity=40)
+write_rate_limit = UserRateLimit("write", rate=2, capacity=10)
+
+rate_limits = [
+    login_rate_limit,
+    signup_rate_limit,
+    public_read_rate_limit,
+    read_rate_limit,
+    write_rate_limit,
+]
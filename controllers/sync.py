@@ -0,0 +1,137 @@
+# Python
+import os
+import asyncio
+from typing import Optional
+
+# FastAPI
+from fastapi import APIRouter, Depends
+from fastapi import status, HTTPException
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+
+# Models
+from models import Changes
+
+# Database
+from sqlalchemy.orm import Session
+from sql_app import crud
+from sql_app.hub import tweet_hub, Subscription, HubFull, RESYNC
+
+# Dependencies
+from sql_app.dependencies import get_db
+from .oauth2 import auth_dependencies, get_streaming_user_id
+from .rate_limit import read_rate_limit
+
+# Tags
+from .tags import Tags
+
+
+router = APIRouter(tags=[Tags.sync])
+
+# Seconds between two keep-alive comments of an idle stream
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))
+
+
+async def event_stream(subscription: Subscription, heartbeat: float = STREAM_HEARTBEAT):
+    try:
+        yield b"retry: 3000\n\n"  # Sends the headers right away, and the reconnection delay
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield message
+            if message is RESYNC:
+                return
+    finally:
+        subscription.close()
+
+
+# Sync Path Operations
+
+## Show the changes since a sync token
+@router.get(
+    path="/changes",
+    response_model=Changes,
+    status_code=status.HTTP_200_OK,
+    summary="Show the changes since the last sync",
+    dependencies=auth_dependencies + [Depends(read_rate_limit)]
+)
+def show_changes(
+        db: Session = Depends(get_db),
+        since: Optional[int] = Query(default=None, ge=0, description="next_token of the last sync"),
+        limit: int = Query(default=100, ge=1, le=1000, description="Log entries read per page")
+):
+    """
+    Show Changes
+
+    This path operation show the tweets and users created, updated or deleted since the since token,
+    oldest first. Several changes of the same tweet or user are compacted into the last one, which
+    comes with the current tweet or user. Call it again with next_token while has_more is true.
+    Without since it only returns the current token: take it before downloading the tweets in full
+
+    Parameters:
+    - Query Parameters:
+        - **since: Optional[int]** sync token (next_token of the previous call)
+        - **limit: int** log entries read per page (1 to 1000)
+
+    Returns a json with the following keys:
+    - changes: List[Change] (token, entity, entity_id, operation and the tweet or the user)
+    - next_token: int
+    - has_more: bool
+    """
+
+    if since is None:
+        return {"changes": [], "next_token": crud.get_last_change_token(db), "has_more": False}
+
+    changes, next_token, has_more = crud.get_changes(db, since=since, limit=limit)
+
+    return {
+        "changes": [
+            {"token": token, "entity": entity, "entity_id": entity_id, "operation": operation, entity: db_row}
+            for token, entity, entity_id, operation, db_row in changes
+        ],
+        "next_token": next_token,
+        "has_more": has_more
+    }
+
+
+## Stream the tweet writes
+@router.get(
+    path="/stream",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Stream the tweets as they are written",
+    responses={status.HTTP_200_OK: {"content": {"text/event-stream": {}}}},
+    dependencies=[Depends(get_streaming_user_id)]
+)
+async def stream_tweets():
+    """
+    Stream Tweets
+
+    This path operation keeps the connection open and pushes every tweet created, updated or deleted
+    as a Server-Sent Event, instead of polling the home. A client too slow to read its events gets a
+    resync event and is disconnected: catch up with GET /changes, then reconnect
+
+    Returns a text/event-stream with the following events:
+    - create: Tweet
+    - update: Tweet
+    - delete: {"tweet_id": UUID}
+    - resync: {}
+    """
+
+    try:
+        subscription = tweet_hub.subscribe()
+    except HubFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams!",
+            headers={"Retry-After": "30"}
+        )
+
+    return StreamingResponse(
+        event_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -7,4 +7,6 @@ class Tags(str, Enum):
     auth = 'auth'
     users = 'users'
     tweets = 'tweets'
+    sync = 'sync'
+    admin = 'admin'
 
@@ -1,22 +1,27 @@
 # Python
-from typing import List
+from typing import List, Optional
 
 # FastAPI
 from fastapi import APIRouter, Depends
 from fastapi import status, HTTPException
-from fastapi import Path, Body
+from fastapi import Path, Body, Query
 
 # Models
-from models import Tweet, NewTweet, TweetDeleted, UpdateTweet, User
+from models import Tweet, NewTweet, TweetDeleted, UpdateTweet, User, Timeline
+from models import BatchIds, TweetBatch
 
 # Database
 from sqlalchemy.orm import Session
 from sql_app import crud, sqlalchemy_models as sql_models
 from sql_app.database import mysql_engine as engine
+from sql_app.coalescer import tweet_writer
 
 # Dependencies
 from sql_app.dependencies import get_db
 from .oauth2 import auth_dependencies, get_current_user
+from .fieldsets import tweet_fields, tweet_field_names, sparse_response, Expand
+from .rate_limit import public_read_rate_limit, read_rate_limit, write_rate_limit
+from .batch import parse_ids, unique_ids, batch_response
 
 # Tags
 from .tags import Tags
@@ -37,25 +42,38 @@ router = APIRouter(tags=[Tags.tweets])
     path="/",
     response_model=List[Tweet],
     status_code=status.HTTP_200_OK,
-    summary="Show all tweets"
+    summary="Show all tweets",
+    dependencies=[Depends(public_read_rate_limit)]
 )
-def home(db: Session = Depends(get_db)):
+def home(
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(tweet_fields),
+        expand: Optional[Expand] = Query(default=None, description='Use "author" to embed the tweet author')
+):
     """
     Home
 
-    This path operation show all tweets in the app
+    This path operation show all tweets in the app, except the archived ones (with TWEET_ARCHIVE_DIR set):
+    those are read by id, in /tweets/me and in the home timelines
 
-    No-Parameters
+    Parameters:
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
+        - **expand: Optional[Expand]** use "author" to embed the tweet author
 
-    Returns a json list with all tweets in the app with the following keys:
+    Returns a json list with all the tweets of the tweets table (or of every shard) with the following keys:
     - tweet_id: UUID
     - content: str
     - created_at: datetime
     - updated_at: Optional[datetime]
-    - by: User
+    - user_id: UUID
+    - by: Author (only with expand=author)
     """
 
-    db_tweets = crud.get_tweets(db)
+    db_tweets = crud.get_tweets(db, fields=fields, expand_author=expand == Expand.author)
+
+    if fields or expand:
+        return sparse_response(db_tweets, fields or tweet_field_names, expand)
     return db_tweets
 
 
@@ -65,7 +83,7 @@ def home(db: Session = Depends(get_db)):
     response_model=Tweet,
     status_code=status.HTTP_201_CREATED,
     summary='Post a tweet',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(write_rate_limit)]
 )
 def post_tweet(
         tweet: NewTweet = Body(..., examples=TweetExamples.tweet_info),
@@ -91,6 +109,10 @@ def post_tweet(
     if tweet.user_id is None:
         tweet.user_id = current_user.user_id
 
+    # Opt-in group commit (WRITE_COALESCING=1)
+    if tweet_writer is not None:
+        return tweet_writer.submit(tweet)
+
     db_tweet = crud.create_tweet(db, tweet)
     return db_tweet
 
@@ -100,34 +122,92 @@ def post_tweet(
     path="/tweets/me",
     response_model=List[Tweet],
     status_code=status.HTTP_200_OK,
-    summary="Show my tweets"
+    summary="Show my tweets",
+    dependencies=[Depends(read_rate_limit)]
 )
-def show_my_tweets(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def show_my_tweets(
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user),
+        fields: Optional[List[str]] = Depends(tweet_fields),
+        expand: Optional[Expand] = Query(default=None, description='Use "author" to embed the tweet author')
+):
     """
     Show my Tweets
 
     This path operation show my tweets in the app
 
-    No-Parameters
+    Parameters:
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
+        - **expand: Optional[Expand]** use "author" to embed the tweet author
 
     Returns a json list with all tweets in the app with the following keys:
     - tweet_id: UUID
     - content: str
     - created_at: datetime
     - updated_at: Optional[datetime]
-    - by: User
+    - user_id: UUID
+    - by: Author (only with expand=author)
     """
 
-    my_tweets = crud.get_user_tweets(db, current_user)
+    my_tweets = crud.get_user_tweets(db, current_user, fields=fields, expand_author=expand == Expand.author)
+
+    if fields or expand:
+        return sparse_response(my_tweets, fields or tweet_field_names, expand)
     return my_tweets
 
 
+## Show my home timeline
+@router.get(
+    path="/timeline",
+    response_model=Timeline,
+    status_code=status.HTTP_200_OK,
+    summary="Show my home timeline",
+    dependencies=[Depends(read_rate_limit)]
+)
+def show_timeline(
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user),
+        limit: int = Query(default=50, ge=1, le=200, description="Tweets per page"),
+        before: Optional[str] = Query(
+            default=None,
+            regex=r"^\d+(:[\w-]+)?$",
+            description="next_cursor of the previous page"
+        )
+):
+    """
+    Show my Timeline
+
+    This path operation show the tweets of the login user and of the users it follows, newest first
+
+    Parameters:
+    - Query Parameters:
+        - **limit: int** tweets per page (1 to 200)
+        - **before: Optional[str]** cursor of the next page
+
+    Returns a json with the following keys:
+    - tweets: List[Tweet]
+    - next_cursor: Optional[str] (null on the last page)
+    """
+
+    # "<position>:<tweet_id>", or the position alone
+    position, _, tweet_id = before.partition(":") if before is not None else (None, None, None)
+    cursor = (int(position), tweet_id or None) if position is not None else None
+    entries, next_key = crud.get_home_timeline(db, str(current_user.user_id), limit=limit, before=cursor)
+
+    return {
+        "tweets": [db_tweet for _, db_tweet in entries],
+        "next_cursor": f"{next_key[0]}:{next_key[1]}" if next_key is not None else None
+    }
+
+
 ## Show a tweet
 @router.get(
     path="/tweets/{tweet_id}",
     response_model=Tweet,
     status_code=status.HTTP_200_OK,
-    summary='Show a specific tweet'
+    summary='Show a specific tweet',
+    dependencies=[Depends(public_read_rate_limit)]
 )
 def show_tweet(
         tweet_id: str = Path(
@@ -138,7 +218,9 @@ def show_tweet(
             description="This is UUID4 that identifies a tweet.",
             examples=TweetExamples.tweet_id
         ),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(tweet_fields),
+        expand: Optional[Expand] = Query(default=None, description='Use "author" to embed the tweet author')
 ):
     """
     Show Tweet
@@ -148,6 +230,9 @@ def show_tweet(
     Parameters:
     - Path Parameters:
         - **tweet_id: str**
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
+        - **expand: Optional[Expand]** use "author" to embed the tweet author
 
     Returns a json list with the tweet info with the following keys:
     - tweet_id: UUID
@@ -155,22 +240,99 @@ def show_tweet(
     - created_at: datetime
     - updated_at: Optional[datetime]
     - user_id: str
+    - by: Author (only with expand=author)
     """
 
-    db_tweet = crud.get_tweet_by_id(db, tweet_id)
+    db_tweet = crud.get_tweet_by_id(db, tweet_id, fields=fields, expand_author=expand == Expand.author)
 
     if db_tweet is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tweet not found!")
+
+    if fields or expand:
+        return sparse_response(db_tweet, fields or tweet_field_names, expand)
     return db_tweet
 
 
+## Show several tweets
+@router.get(
+    path="/tweets",
+    response_model=TweetBatch,
+    status_code=status.HTTP_200_OK,
+    summary='Show several tweets',
+    dependencies=[Depends(public_read_rate_limit)]
+)
+def show_tweets(
+        tweet_ids: Optional[List[str]] = Depends(parse_ids),
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(tweet_fields),
+        expand: Optional[Expand] = Query(default=None, description='Use "author" to embed the tweet author')
+):
+    """
+    Show Tweets
+
+    This path operation show several tweets given their IDs, read with one query
+
+    Parameters:
+    - Query Parameters:
+        - **ids: str** comma separated tweet IDs
+        - **fields: Optional[str]** comma separated keys to return
+        - **expand: Optional[Expand]** use "author" to embed the tweet author
+
+    Returns a json with the following keys:
+    - tweets: list of tweets in the order of the IDs
+    - missing: list of the IDs without a tweet
+    """
+    if tweet_ids is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="ids is required")
+
+    db_tweets = crud.get_tweets_by_ids(db, tweet_ids, fields=fields, expand_author=expand == Expand.author)
+
+    return batch_response("tweets", tweet_ids, db_tweets, fields or (tweet_field_names if expand else None), expand)
+
+
+## Look up several tweets
+@router.post(
+    path="/tweets/lookup",
+    response_model=TweetBatch,
+    status_code=status.HTTP_200_OK,
+    summary='Look up several tweets',
+    dependencies=[Depends(public_read_rate_limit)]
+)
+def lookup_tweets(
+        lookup: BatchIds = Body(...),
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(tweet_fields),
+        expand: Optional[Expand] = Query(default=None, description='Use "author" to embed the tweet author')
+):
+    """
+    Lookup Tweets
+
+    This path operation show several tweets given their IDs in the body, for lists too long for a URL
+
+    Parameters:
+    - Request Body parameters:
+        - **lookup: BatchIds**
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
+        - **expand: Optional[Expand]** use "author" to embed the tweet author
+
+    Returns a json with the following keys:
+    - tweets: list of tweets in the order of the IDs
+    - missing: list of the IDs without a tweet
+    """
+    tweet_ids = unique_ids(lookup.ids)
+    db_tweets = crud.get_tweets_by_ids(db, tweet_ids, fields=fields, expand_author=expand == Expand.author)
+
+    return batch_response("tweets", tweet_ids, db_tweets, fields or (tweet_field_names if expand else None), expand)
+
+
 ## Delete a tweet
 @router.delete(
     path="/tweets/{tweet_id}/delete",
     response_model=TweetDeleted,
     status_code=status.HTTP_200_OK,
     summary='Delete a specific tweet',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(write_rate_limit)]
 )
 def delete_tweet(
         tweet_id: str = Path(
@@ -212,7 +374,7 @@ def delete_tweet(
     response_model=Tweet,
     status_code=status.HTTP_200_OK,
     summary='Update a specific tweet',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(write_rate_limit)]
 )
 def update_tweet(
         tweet_id: str = Path(
@@ -1,22 +1,29 @@
 # Python
-from typing import List
+from typing import List, Optional, Union
 
 # FastAPI
 from fastapi import APIRouter, Depends, BackgroundTasks
 from fastapi import status, HTTPException
-from fastapi import Path, Body
+from fastapi import Path, Body, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
 # Models
-from models import User, UserRegister, UserDeleted
+from models import User, UserRegister, UserDeleted, Follow
+from models import BatchIds, UserBatch, UserSearch
 
 # Database
 from sqlalchemy.orm import Session
 from sql_app import crud, sqlalchemy_models as sql_models
 from sql_app.database import mysql_engine as engine
+from sql_app.search import encode_cursor, decode_cursor
 
 # Dependencies
 from sql_app.dependencies import get_db
 from .oauth2 import get_current_user, auth_dependencies
+from .fieldsets import user_fields, sparse_response, project
+from .rate_limit import signup_rate_limit, read_rate_limit, write_rate_limit
+from .batch import parse_ids, unique_ids, batch_response
 
 # Background Tasks
 from background import write_notification
@@ -41,7 +48,8 @@ router = APIRouter(tags=[Tags.users])
     path="/signup",
     response_model=User,
     status_code=status.HTTP_201_CREATED,
-    summary='Register a User'
+    summary='Register a User',
+    dependencies=[Depends(signup_rate_limit)]
 )
 def signup(
         background_tasks: BackgroundTasks,
@@ -82,18 +90,26 @@ def signup(
 ## Show all users
 @router.get(
     path="/users",
-    response_model=List[User],
+    response_model=Union[List[User], UserBatch],
     status_code=status.HTTP_200_OK,
     summary='Show all users',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(read_rate_limit)]
 )
-def show_all_users(db: Session = Depends(get_db)):
+def show_all_users(
+        user_ids: Optional[List[str]] = Depends(parse_ids),
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(user_fields)
+):
     """
     Show all users
 
-    This path operation show all users in the app
+    This path operation show all users in the app, or only the users with the given IDs (read with one
+    query)
 
-    No-Parameters
+    Parameters:
+    - Query Parameters:
+        - **ids: Optional[str]** comma separated user IDs
+        - **fields: Optional[str]** comma separated keys to return
 
     Returns a json list with all users in the app with the following keys:
     - user_id: UUID
@@ -103,28 +119,124 @@ def show_all_users(db: Session = Depends(get_db)):
     - country: Optional[str]
     - birth_date: Optional[PastDate]
     - creation_account_date: PastDate
+
+    With ids, returns a json with the following keys:
+    - users: list of users in the order of the IDs
+    - missing: list of the IDs without a user
     """
 
-    db_users = crud.get_users(db)
+    if user_ids is not None:
+        return batch_response("users", user_ids, crud.get_users_by_ids(db, user_ids, fields=fields), fields)
+
+    db_users = crud.get_users(db, fields=fields)
+
+    if fields:
+        return sparse_response(db_users, fields)
     return db_users
 
 
+## Search users by name
+@router.get(
+    path="/users/search",
+    response_model=UserSearch,
+    status_code=status.HTTP_200_OK,
+    summary='Search users by name',
+    dependencies=auth_dependencies + [Depends(read_rate_limit)]
+)
+def search_users(
+        prefix: str = Query(default="", max_length=41, description="Start of the first or the last name"),
+        country: Optional[str] = Query(default=None, min_length=1, max_length=50),
+        limit: int = Query(default=20, ge=1, le=100, description="Users per page"),
+        after: Optional[str] = Query(default=None, description="next_cursor of the previous page"),
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(user_fields)
+):
+    """
+    Search Users
+
+    This path operation show the users whose first or last name starts with prefix (ignoring case and
+    accents), ordered by name, for a typeahead. Every page is read from the name indexes
+
+    Parameters:
+    - Query Parameters:
+        - **prefix: str** start of the name, "ana gar" matches Ana García and "garcia a" too
+        - **country: Optional[str]** only the users of this country
+        - **limit: int** users per page (1 to 100)
+        - **after: Optional[str]** cursor of the next page
+        - **fields: Optional[str]** comma separated keys to return
+
+    Returns a json with the following keys:
+    - users: List[User]
+    - next_cursor: Optional[str] (null on the last page)
+    """
+
+    try:
+        position = decode_cursor(after) if after is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid cursor")
+
+    records, next_key = crud.search_users(db, prefix, country, limit=limit, after=position, fields=fields)
+    next_cursor = encode_cursor(next_key) if next_key is not None else None
+
+    if fields:
+        data = {"users": [project(record, fields) for record in records], "next_cursor": next_cursor}
+        return JSONResponse(content=jsonable_encoder(data))
+    return {"users": records, "next_cursor": next_cursor}
+
+
+## Look up several users
+@router.post(
+    path="/users/lookup",
+    response_model=UserBatch,
+    status_code=status.HTTP_200_OK,
+    summary='Look up several users',
+    dependencies=auth_dependencies + [Depends(read_rate_limit)]
+)
+def lookup_users(
+        lookup: BatchIds = Body(...),
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(user_fields)
+):
+    """
+    Lookup Users
+
+    This path operation show several users given their IDs in the body, for lists too long for a URL
+
+    Parameters:
+    - Request Body parameters:
+        - **lookup: BatchIds**
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
+
+    Returns a json with the following keys:
+    - users: list of users in the order of the IDs
+    - missing: list of the IDs without a user
+    """
+    user_ids = unique_ids(lookup.ids)
+
+    return batch_response("users", user_ids, crud.get_users_by_ids(db, user_ids, fields=fields), fields)
+
+
 ## Show me
 @router.get(
     path="/users/me",
     response_model=User,
     status_code=status.HTTP_200_OK,
-    summary='Show my information'
+    summary='Show my information',
+    dependencies=[Depends(read_rate_limit)]
 )
 def show_user(
-        current_user: User = Depends(get_current_user)
+        current_user: User = Depends(get_current_user),
+        fields: Optional[List[str]] = Depends(user_fields)
 ):
     """
     Show me
 
     This path operation show information about the login user
 
-    No-Parameters
+    Parameters:
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
 
     Returns a json with the user info with the following keys:
     - user_id: UUID
@@ -136,6 +248,8 @@ def show_user(
     - creation_account_date: PastDate
     """
 
+    if fields:
+        return sparse_response(current_user, fields)
     return current_user
 
 
@@ -145,7 +259,7 @@ def show_user(
     response_model=User,
     status_code=status.HTTP_200_OK,
     summary='Show a specific user information',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(read_rate_limit)]
 )
 def show_user(
         user_id: str = Path(
@@ -156,7 +270,8 @@ def show_user(
             description="This is UUID4 that identifies a person.",
             examples=UserExamples.user_id
         ),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_db),
+        fields: Optional[List[str]] = Depends(user_fields)
 ):
     """
     Show User
@@ -166,6 +281,8 @@ def show_user(
     Parameters:
     - Path Parameters:
         - **user_id: str**
+    - Query Parameters:
+        - **fields: Optional[str]** comma separated keys to return
 
     Returns a json with the user info with the following keys:
     - user_id: UUID
@@ -177,10 +294,13 @@ def show_user(
     - creation_account_date: PastDate
     """
 
-    db_user = crud.get_user_by_id(db, user_id)
+    db_user = crud.get_user_by_id(db, user_id, fields=fields)
 
     if db_user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found!")
+
+    if fields:
+        return sparse_response(db_user, fields)
     return db_user
 
 
@@ -190,7 +310,7 @@ def show_user(
     response_model=UserDeleted,
     status_code=status.HTTP_200_OK,
     summary='Delete a specific user account',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(write_rate_limit)]
 )
 def delete_user(
         user_id: str = Path(
@@ -232,7 +352,7 @@ def delete_user(
     response_model=User,
     status_code=status.HTTP_200_OK,
     summary='Update a specific user account',
-    dependencies=auth_dependencies
+    dependencies=auth_dependencies + [Depends(write_rate_limit)]
 )
 def update_user(
         user_id: str = Path(
@@ -275,3 +395,91 @@ def update_user(
     updated_user = crud.update_user(db, user_id, new_user_info)
 
     return updated_user
+
+
+## Follow a user
+@router.post(
+    path="/users/{user_id}/follow",
+    response_model=Follow,
+    status_code=status.HTTP_200_OK,
+    summary='Follow a user',
+    dependencies=[Depends(write_rate_limit)]
+)
+def follow_user(
+        user_id: str = Path(
+            ...,
+            min_length=36,
+            max_length=36,
+            title="User ID",
+            description="This is UUID4 that identifies a person.",
+            examples=UserExamples.user_id
+        ),
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Follow User
+
+    This path operation makes the login user follow a specific user, its next tweets will appear in the
+    login user home timeline (and its most recent ones right away)
+
+    Parameters:
+    - Path Parameters:
+        - **user_id: str**
+
+    Returns a json with the following keys:
+    - user_id: UUID
+    - following: bool
+    """
+
+    if user_id == str(current_user.user_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You can't follow yourself!")
+
+    db_user = crud.get_user_by_id(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User doesn't exist!")
+
+    crud.follow_user(db, str(current_user.user_id), db_user)
+
+    return {"user_id": user_id, "following": True}
+
+
+## Unfollow a user
+@router.delete(
+    path="/users/{user_id}/follow",
+    response_model=Follow,
+    status_code=status.HTTP_200_OK,
+    summary='Unfollow a user',
+    dependencies=[Depends(write_rate_limit)]
+)
+def unfollow_user(
+        user_id: str = Path(
+            ...,
+            min_length=36,
+            max_length=36,
+            title="User ID",
+            description="This is UUID4 that identifies a person.",
+            examples=UserExamples.user_id
+        ),
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Unfollow User
+
+    This path operation makes the login user stop following a specific user, its tweets are removed from
+    the login user home timeline
+
+    Parameters:
+    - Path Parameters:
+        - **user_id: str**
+
+    Returns a json with the following keys:
+    - user_id: UUID
+    - following: bool
+    """
+
+    if not crud.unfollow_user(db, str(current_user.user_id), user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="You don't follow this user!")
+
+    return {"user_id": user_id, "following": False}
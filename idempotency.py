@@ -0,0 +1,314 @@
+
+# Python
+import time
+import asyncio
+import hashlib
+import logging
+from threading import Lock
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+# Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+MAX_KEY_LENGTH = 255
+
+
+def json_error(status_code: int, detail: str, headers: Iterable[Tuple[bytes, bytes]] = ()) -> List[Message]:
+    body = ('{"detail":"%s"}' % detail).encode()
+    return [
+        {"type": "http.response.start", "status": status_code, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers
+        ]},
+        {"type": "http.response.body", "body": body}
+    ]
+
+
+def replay(response: Tuple[int, list, bytes]) -> List[Message]:
+    status_code, headers, body = response
+    return [
+        {"type": "http.response.start", "status": status_code, "headers": headers + [REPLAYED_HEADER]},
+        {"type": "http.response.body", "body": body}
+    ]
+
+
+# Store
+class IdempotentRequest:
+    """A key seen once: in flight until its response is stored, then replayed until it expires."""
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.response: Optional[Tuple[int, list, bytes]] = None  # status, headers, body
+        self.done = False
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = Lock()
+
+    def wait(self) -> asyncio.Future:
+        """Resolved with the response, or None if the original failed (called from the loop of the waiter)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.done:
+                future.set_result(self.response)
+            else:
+                self._waiters.append((loop, future))
+        return future
+
+    def resolve(self, response: Optional[Tuple[int, list, bytes]]):
+        with self._lock:
+            self.response, self.done = response, True
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(response))
+            except RuntimeError:  # The loop of that duplicate is closed, nobody waits for it
+                pass
+
+
+class IdempotencyStore:
+    """In-process keys, bounded to `max_keys` (oldest dropped first) and kept `ttl` seconds."""
+
+    def __init__(self, ttl: float = 24 * 3600, max_keys: int = 100_000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._requests: "OrderedDict[tuple, IdempotentRequest]" = OrderedDict()
+        self._lock = Lock()
+        self.replays = 0
+        self.conflicts = 0
+
+    def claim(self, key: tuple, fingerprint: str) -> Tuple[IdempotentRequest, bool]:
+        """The request of `key`, and whether the caller is the first one (it must then complete it)."""
+        now = time.monotonic()
+        with self._lock:
+            request = self._requests.get(key)
+            if request is not None and request.expires_at > now:
+                return request, False
+
+            request = IdempotentRequest(fingerprint, now + self.ttl)
+            self._requests.pop(key, None)
+            self._requests[key] = request
+            while len(self._requests) > self.max_keys:
+                self._requests.popitem(last=False)
+            return request, True
+
+    def complete(self, key: tuple, request: IdempotentRequest, response: Optional[Tuple[int, list, bytes]]):
+        """Store the response for the replays, or forget the key (response None) so a retry runs again."""
+        if response is None:
+            with self._lock:
+                if self._requests.get(key) is request:
+                    del self._requests[key]
+        request.resolve(response)
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = len(self._requests)
+        return {"keys": keys, "replays": self.replays, "conflicts": self.conflicts}
+
+
+class SharedKeys(ABC):
+    """Keys seen by every worker (sql_app/idempotency_keys.py keeps them in the database), checked once the
+    in-process store let a request run. The calls block, the middleware makes them in the thread pool."""
+
+    @abstractmethod
+    def claim(self, key: tuple, fingerprint: str, ttl: float) -> Optional[Tuple[str, Optional[tuple]]]:
+        """None if the caller got the key (it must then complete or forget it), else the fingerprint of the
+        request that has it and its stored response (None while that request runs). A claim never completed
+        is released after a lease of at most `ttl` seconds."""
+
+    @abstractmethod
+    def complete(self, key: tuple, response: Tuple[int, list, bytes], ttl: float):
+        """Store the response of a claimed key for the replays of every worker, kept `ttl` seconds."""
+
+    @abstractmethod
+    def forget(self, key: tuple):
+        """Release a claimed key without a response, a retry runs again."""
+
+
+# Middleware
+class IdempotencyMiddleware:
+    """Idempotency-Key support for the POST path operations in `paths`.
+
+    The first request with a key runs and its response is stored, keyed by path, Authorization header (the
+    client address without one) and key. Retries get the stored response back without running again, and duplicates arriving while the
+    original is in flight wait for it (up to `wait_timeout` seconds, then 409). Reusing a key with another
+    body is a 422. Server errors and 429s are not stored, a retry runs again.
+
+    The store is per process. With `shared` keys, a request the store lets run claims its key there too, so
+    the retries that reach another worker are replayed as well (duplicates in flight on another worker are
+    polled every `poll_interval` seconds).
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            paths: Iterable[str],
+            store: Optional[IdempotencyStore] = None,
+            wait_timeout: float = 10.0,
+            shared: Optional[SharedKeys] = None,
+            poll_interval: float = 0.05
+    ):
+        self.app = app
+        self.paths = set(paths)
+        self.store = store or IdempotencyStore()
+        self.wait_timeout = wait_timeout
+        self.shared = shared
+        self.poll_interval = poll_interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get(HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self.send_all(send, json_error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"))
+            return
+
+        # The whole body is read to fingerprint it, then handed to the app again
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        fingerprint = hashlib.sha256(body).hexdigest()
+        principal = hashlib.sha256(self.principal(scope, headers).encode()).hexdigest()
+        key = (scope["path"], principal, idempotency_key)
+
+        while True:
+            request, first = self.store.claim(key, fingerprint)
+            if request.fingerprint != fingerprint:
+                self.store.conflicts += 1
+                await self.send_all(send, json_error(422, "Idempotency-Key already used with another request body"))
+                return
+            if first:
+                break
+
+            try:
+                response = await asyncio.wait_for(request.wait(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                await self.send_all(send, json_error(409, "A request with this Idempotency-Key is in progress", [
+                    (b"retry-after", b"1")
+                ]))
+                return
+            if response is None:  # The original failed and forgot the key, the first duplicate runs instead
+                continue
+
+            self.store.replays += 1
+            await self.send_all(send, replay(response))
+            return
+
+        if self.shared is not None:
+            try:
+                answer = await self.claim_shared(key, fingerprint)
+            except BaseException:
+                self.store.complete(key, request, None)
+                raise
+            if answer is not None:
+                # Answered from another worker's request, the local duplicates get the same
+                messages, response = answer
+                self.store.complete(key, request, response)
+                await self.send_all(send, messages)
+                return
+
+        await self.run_first(scope, body, receive, send, key, request)
+
+    async def claim_shared(self, key: tuple, fingerprint: str) -> Optional[Tuple[List[Message], Optional[tuple]]]:
+        """None when this worker got the key, else the messages to answer with and the response to keep."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            existing = await run_in_threadpool(self.shared.claim, key, fingerprint, self.store.ttl)
+            if existing is None:
+                return None
+
+            other_fingerprint, response = existing
+            if other_fingerprint != fingerprint:
+                self.store.conflicts += 1
+                return json_error(422, "Idempotency-Key already used with another request body"), None
+            if response is not None:
+                self.store.replays += 1
+                return replay(response), response
+            if time.monotonic() >= deadline:
+                return json_error(409, "A request with this Idempotency-Key is in progress", [
+                    (b"retry-after", b"1")
+                ]), None
+            await asyncio.sleep(self.poll_interval)
+
+    async def complete_shared(self, key: tuple, response: Optional[Tuple[int, list, bytes]]):
+        if self.shared is None:
+            return
+        try:
+            if response is not None:
+                await run_in_threadpool(self.shared.complete, key, response, self.store.ttl)
+                return
+        except Exception:
+            logger.exception("Could not store the response of an Idempotency-Key, releasing it")
+        try:
+            await run_in_threadpool(self.shared.forget, key)
+        except Exception:
+            logger.exception("Could not release an Idempotency-Key, it stays in progress until it expires")
+
+    async def run_first(self, scope: Scope, body: bytes, receive: Receive, send: Send, key: tuple, request):
+        replayed_body = False
+
+        async def receive_again() -> Message:
+            nonlocal replayed_body
+            if not replayed_body:
+                replayed_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        stored = False
+
+        async def capture(message: Message):
+            nonlocal start, stored
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False) and not stored:
+                    # Complete once the response is sent, before the background tasks run
+                    stored = True
+                    status_code = start["status"]
+                    response = (status_code, list(start.get("headers", [])), b"".join(chunks))
+                    if status_code >= 500 or status_code == 429:
+                        response = None
+                    await self.complete_shared(key, response)
+                    self.store.complete(key, request, response)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_again, capture)
+        finally:
+            if not stored:
+                await self.complete_shared(key, None)
+                self.store.complete(key, request, None)
+
+    @staticmethod
+    def principal(scope: Scope, headers: Headers) -> str:
+        """The Authorization header, or the client address of the anonymous requests (signups): two clients
+        picking the same key must not get each other's response."""
+        authorization = headers.get("authorization")
+        if authorization:
+            return authorization
+        host, _ = scope.get("client") or ("", 0)
+        return f"anonymous {host}"
+
+    @staticmethod
+    async def send_all(send: Send, messages: List[Message]):
+        for message in messages:
+            await send(message)
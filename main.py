@@ -1,5 +1,8 @@
-# Starlette
-from starlette.middleware.base import BaseHTTPMiddleware
+# Python
+import os
+
+# AnyIO
+from anyio.to_thread import current_default_thread_limiter
 
 # Uvicorn
 import uvicorn
@@ -11,8 +14,18 @@ from fastapi.middleware.cors import CORSMiddleware
 # Router
 from controllers import router
 
+# Cache invalidations of the other workers
+from sql_app import crud
+
+# Idempotency-Keys of every worker
+from sql_app.database import SessionLocal
+from sql_app.idempotency_keys import DatabaseIdempotencyKeys
+
 # Middleware
-from middleware import process_time_header
+from middleware import ProcessTimeMiddleware
+from compression import CompressionMiddleware
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+from admission import AdmissionMiddleware, admission_limits, THREAD_POOL_SIZE
 
 # CROS (Cros-Origin Resource Sharing)
 from origins import cros_origins
@@ -20,7 +33,6 @@ from origins import cros_origins
 # Metadata
 from metadata import APIMetadata, tags_metadata
 
-
 # App
 app = FastAPI(
     title=APIMetadata["title"],
@@ -36,7 +48,58 @@ app = FastAPI(
 
 app.include_router(router)
 
-app.add_middleware(BaseHTTPMiddleware, dispatch=process_time_header)
+
+@app.on_event("startup")
+async def set_thread_pool_size():
+    current_default_thread_limiter().total_tokens = THREAD_POOL_SIZE
+
+
+@app.on_event("startup")
+def start_cache_bus():
+    # In every worker, after the fork of a preloading master
+    if crud.cache_bus is not None:
+        crud.cache_bus.start()
+
+
+@app.on_event("shutdown")
+def stop_cache_bus():
+    if crud.cache_bus is not None:
+        crud.cache_bus.stop()
+
+
+# Innermost: requests wait for a slot of their class before taking a thread of the pool
+app.add_middleware(
+    AdmissionMiddleware,
+    limits=admission_limits,
+    routes={"/login": "auth", "/signup": "auth", "/tweets/lookup": "read", "/users/lookup": "read"},
+    exempt={"/stream"},
+    enabled=os.getenv("ADMISSION_ENABLED", "1") != "0"
+)
+# Replays skip the admission, and are compressed and timed like any response
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths={"/post", "/signup"},
+    store=IdempotencyStore(
+        ttl=float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600)),
+        max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS", 100_000))
+    ),
+    wait_timeout=float(os.getenv("IDEMPOTENCY_WAIT", 10)),
+    shared=DatabaseIdempotencyKeys(
+        SessionLocal, lease=float(os.getenv("IDEMPOTENCY_LEASE", 300))
+    ) if os.getenv("IDEMPOTENCY_SHARED", "1") != "0" else None
+)
+app.add_middleware(ProcessTimeMiddleware)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", 500)),
+    route_minimum_sizes={"/login": 2048, "/users/me": 2048},
+    levels={
+        "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL", 6)),
+        "br": int(os.getenv("COMPRESSION_BROTLI_LEVEL", 4)),
+        "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3)),
+    },
+    cache_max_bytes=int(os.getenv("COMPRESSION_CACHE_BYTES", 32 * 1024 * 1024))
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cros_origins,
@@ -47,4 +47,12 @@ tags_metadata = [
         "name": Tags.tweets,
         "description": "Operations with _tweets_."
     },
+    {
+        "name": Tags.sync,
+        "description": "Incremental _sync_ of the tweets and users a client already downloaded."
+    },
+    {
+        "name": Tags.admin,
+        "description": "Maintenance operations, only for the accounts listed in `ADMIN_EMAILS`."
+    },
 ]
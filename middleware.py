@@ -1,14 +1,27 @@
-
 import time
-from fastapi import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
 # Middleware
-async def process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    end_time = time.time()
-    process_time = end_time - start_time
-
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+class ProcessTimeMiddleware:
+    """Adds X-Process-Time (seconds until the response starts) without re-streaming the body, so the
+    middlewares around it still get whole bodies in one message."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+
+        async def send_with_time(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(time.time() - start_time))
+            await send(message)
+
+        await self.app(scope, receive, send_with_time)
@@ -1,4 +1,7 @@
 
-from .user import User, UserRegister, UserLogin, UserDeleted
-from .tweet import Tweet, NewTweet, TweetDeleted, UpdateTweet
+from .user import User, UserRegister, UserLogin, UserDeleted, Author, Follow
+from .tweet import Tweet, NewTweet, TweetDeleted, UpdateTweet, TweetWithAuthor, Timeline
 from .token import Token, TokenData
+from .change import Change, Changes
+from .batch import BatchIds, TweetBatch, UserBatch, BATCH_MAX_IDS
+from .search import UserSearch
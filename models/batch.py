@@ -0,0 +1,27 @@
+# Python
+from typing import List
+from uuid import UUID
+
+# Pydantic
+from pydantic import BaseModel, Field
+
+# Models
+from .user import User
+from .tweet import Tweet
+
+BATCH_MAX_IDS = 300  # Ids resolved by one batch lookup
+
+
+class BatchIds(BaseModel):
+    ids: List[UUID] = Field(..., min_items=1, max_items=BATCH_MAX_IDS)
+
+
+class TweetBatch(BaseModel):
+    # In the requested order, each tweet once
+    tweets: List[Tweet] = Field(default_factory=list)
+    missing: List[UUID] = Field(default_factory=list)
+
+
+class UserBatch(BaseModel):
+    users: List[User] = Field(default_factory=list)
+    missing: List[UUID] = Field(default_factory=list)
@@ -0,0 +1,38 @@
+# Python
+from enum import Enum
+from typing import List, Optional
+from uuid import UUID
+
+# Pydantic
+from pydantic import BaseModel, Field
+
+# Models
+from .user import User
+from .tweet import Tweet
+
+
+class ChangeEntity(str, Enum):
+    tweet = 'tweet'
+    user = 'user'
+
+
+class ChangeOperation(str, Enum):
+    create = 'create'
+    update = 'update'
+    delete = 'delete'
+
+
+class Change(BaseModel):
+    token: int = Field(...)
+    entity: ChangeEntity = Field(...)
+    entity_id: UUID = Field(...)
+    operation: ChangeOperation = Field(...)
+    # The current row, none for deletes
+    tweet: Optional[Tweet] = Field(default=None)
+    user: Optional[User] = Field(default=None)
+
+
+class Changes(BaseModel):
+    changes: List[Change] = Field(default_factory=list)
+    next_token: int = Field(...)
+    has_more: bool = Field(default=False)
@@ -0,0 +1,14 @@
+# Python
+from typing import List, Optional
+
+# Pydantic
+from pydantic import BaseModel, Field
+
+# Models
+from .user import User
+
+
+class UserSearch(BaseModel):
+    # By normalized name, each user once
+    users: List[User] = Field(default_factory=list)
+    next_cursor: Optional[str] = Field(default=None)
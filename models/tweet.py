@@ -1,11 +1,14 @@
 # Python
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID, uuid4
 from datetime import date
 
 # Pydantic
 from pydantic import BaseModel, Field
 
+# Models
+from .user import Author
+
 
 class TweetBase(BaseModel):
     content: str = Field(..., min_length=0, max_length=280)
@@ -28,9 +31,18 @@ class Tweet(TweetBase, TweetID):
         orm_mode = True
 
 
+class TweetWithAuthor(Tweet):
+    by: Optional[Author] = Field(...)
+
+
 class TweetDeleted(TweetID):
     delete_message: str = Field(default="Tweet has been deleted!")
 
 
 class UpdateTweet(TweetBase):
     pass
+
+
+class Timeline(BaseModel):
+    tweets: List[Tweet] = Field(default_factory=list)
+    next_cursor: Optional[str] = Field(default=None)
@@ -1,6 +1,7 @@
 # Python
 from typing import Optional
 from uuid import UUID, uuid4
+from datetime import date
 
 # Pydantic
 from pydantic import BaseModel, Field
@@ -43,7 +44,22 @@ class UserInfo(UserBase):
     creation_account_date: PastDate
 
 
-class User(UserInfo, UserID):
+class UserCounters(BaseModel):
+    tweets_count: int = Field(default=0)
+    followers_count: int = Field(default=0)
+    following_count: int = Field(default=0)
+    last_tweet_at: Optional[date] = Field(default=None)
+
+
+class User(UserCounters, UserInfo, UserID):
+    class Config:
+        orm_mode = True
+
+
+class Author(UserID):
+    first_name: str = Field(...)
+    last_name: str = Field(...)
+
     class Config:
         orm_mode = True
 
@@ -54,3 +70,7 @@ class UserRegister(UserInfo, Password):
 
 class UserDeleted(UserID):
     delete_message: str = Field(default="User has been deleted!")
+
+
+class Follow(UserID):
+    following: bool = Field(...)
@@ -0,0 +1,137 @@
+
+# Python
+import os
+import argparse
+import tempfile
+import multiprocessing
+from typing import Optional
+
+# Uvicorn
+import uvicorn
+
+# Gunicorn (process manager, not available on Windows)
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+def env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default) != "0"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Production settings, every option defaults to an environment variable."""
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count())),
+        help="Worker processes, one per core by default (bcrypt and the sync handlers are CPU bound)"
+    )
+    parser.add_argument(
+        "--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", 10_000)),
+        help="Recycle a worker after this many requests (0 disables it)"
+    )
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=int(os.getenv("MAX_REQUESTS_JITTER", 1_000)),
+        help="Random extra requests per worker, so they do not all restart at once"
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", 30)),
+        help="Seconds a stopping worker gets to finish its requests"
+    )
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", 60)))
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("KEEPALIVE", 5)))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument(
+        "--no-preload", dest="preload", action="store_false", default=env_flag("PRELOAD"),
+        help="Import the app in every worker instead of once in the master"
+    )
+    parser.add_argument(
+        "--no-reuse-port", dest="reuse_port", action="store_false", default=env_flag("REUSE_PORT"),
+        help="Do not set SO_REUSEPORT on the listening socket"
+    )
+    return parser.parse_args(argv)
+
+
+def cache_bus_directory(args: argparse.Namespace) -> Optional[str]:
+    """Sockets the workers use to invalidate each other's entity caches, None with a single worker."""
+    if args.workers <= 1:
+        return os.getenv("CACHE_BUS_DIR") or None
+    return os.getenv("CACHE_BUS_DIR") or os.path.join(tempfile.gettempdir(), f"twitter-api-{args.port}-cache-bus")
+
+
+def post_fork(server, worker):
+    """Workers forked from a preloaded master must not share its pooled database connections."""
+    from sql_app.database import mysql_engine
+    from sql_app.sharding import tweet_shards
+    mysql_engine.dispose(close=False)
+    if tweet_shards is not None:
+        tweet_shards.dispose(close=False)
+
+
+def gunicorn_options(args: argparse.Namespace) -> dict:
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": args.preload,
+        "reuse_port": args.reuse_port,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": args.keepalive,
+        "loglevel": args.log_level,
+        "post_fork": post_fork,
+    }
+
+
+if BaseApplication is not None:
+    class Server(BaseApplication):
+        """Gunicorn master: binds the socket once, forks the workers and restarts them.
+
+        Signals: HUP restarts the workers gracefully (new code only with --no-preload), TTIN/TTOU add or
+        remove a worker and USR2 starts a new master with the new code next to the old one.
+        """
+
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+
+def run(argv=None):
+    args = parse_args(argv)
+
+    # Read when the app is imported (by the master with preloading, by every worker otherwise)
+    directory = cache_bus_directory(args)
+    if directory is not None:
+        os.environ["CACHE_BUS_DIR"] = directory
+
+    if BaseApplication is None:
+        # Uvicorn's own supervisor: several workers, but no preloading nor graceful reload
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            limit_max_requests=args.max_requests or None,
+            timeout_keep_alive=args.keepalive,
+            log_level=args.log_level
+        )
+        return
+
+    Server(gunicorn_options(args)).run()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,353 @@
+
+# Python
+import os
+import json
+import mmap
+import zlib
+import bisect
+import struct
+import hashlib
+import threading
+from datetime import date
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))  # Age of the tweets moved out of the hot table
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ARCHIVE_SEGMENT_SIZE", 50_000))  # Tweets per segment file
+ARCHIVE_BLOCK_SIZE = 64  # Tweets per compressed block, one block is read to find a tweet
+ARCHIVE_BLOCK_CACHE = int(os.getenv("ARCHIVE_BLOCK_CACHE", 256))  # Decompressed blocks kept in memory
+
+# Segment file: header, zlib compressed blocks of JSON lines sorted by tweet_id, compressed JSON footer
+# (sparse index, per-user blocks, bloom filter) and a fixed size trailer pointing to the footer
+HEADER = b"TWSEG001"
+TRAILER = struct.Struct(">QQ8s")
+SUFFIX = ".seg"
+PENDING = ".pending"
+TOMBSTONES = "tombstones.log"
+EVERY_SEGMENT = "~"  # Bound of the tombstones written before they named one, sorts after every segment name
+NO_SEGMENT = "-"  # Bound of the tombstones written before any segment, sorts before every segment name
+
+COLUMNS = ("tweet_id", "user_id", "content", "created_at", "updated_at")
+
+
+def encode_row(row: dict) -> list:
+    return [str(row["tweet_id"]), str(row["user_id"]), row["content"], str(row["created_at"]), str(row["updated_at"])]
+
+
+def decode_row(values: list) -> dict:
+    row = dict(zip(COLUMNS, values))
+    for key in ("created_at", "updated_at"):
+        row[key] = date.fromisoformat(row[key]) if row[key] != "None" else None
+    return row
+
+
+# Bloom Filter
+class BloomFilter:
+    """Most lookups of a tweet that is not in a segment skip it without reading a block (about 1% do not)."""
+
+    def __init__(self, bits: bytearray, hashes: int):
+        self.bits = bits
+        self.size = len(bits) * 8
+        self.hashes = hashes
+
+    @classmethod
+    def build(cls, keys: List[str], bits_per_key: int = 10) -> "BloomFilter":
+        bloom = cls(bytearray(max(1, len(keys) * bits_per_key // 8)), hashes=7)
+        for key in keys:
+            for position in bloom.positions(key):
+                bloom.bits[position >> 3] |= 1 << (position & 7)
+        return bloom
+
+    def positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return ((first + number * second) % self.size for number in range(self.hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+# Segments
+def write_segment(path: str, rows: List[dict], block_size: int = ARCHIVE_BLOCK_SIZE):
+    """Write `rows` (sorted by tweet_id) to a new file at `path`, synced to disk before it returns."""
+    blocks, users = [], {}
+    with open(path, "wb") as segment:
+        segment.write(HEADER)
+        for number, start in enumerate(range(0, len(rows), block_size)):
+            block = rows[start:start + block_size]
+            data = zlib.compress("\n".join(json.dumps(encode_row(row)) for row in block).encode(), 6)
+            blocks.append([str(block[0]["tweet_id"]), segment.tell(), len(data)])
+            segment.write(data)
+
+            for row in block:
+                count, newest, user_blocks = users.setdefault(str(row["user_id"]), [0, "", []])
+                users[str(row["user_id"])] = [count + 1, max(newest, str(row["created_at"])), user_blocks]
+                if not user_blocks or user_blocks[-1] != number:
+                    user_blocks.append(number)
+
+        bloom = BloomFilter.build([str(row["tweet_id"]) for row in rows])
+        footer = zlib.compress(json.dumps({
+            "blocks": blocks, "users": users, "bloom": bloom.bits.hex(), "hashes": bloom.hashes
+        }).encode())
+        footer_offset = segment.tell()
+        segment.write(footer)
+        segment.write(TRAILER.pack(footer_offset, len(footer), HEADER))
+        segment.flush()
+        os.fsync(segment.fileno())
+
+
+class Segment:
+    """Read-only, memory mapped segment: only its footer is held in memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as segment:
+            self._map = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer_offset, footer_length, magic = TRAILER.unpack(self._map[-TRAILER.size:])
+        if self._map[:len(HEADER)] != HEADER or magic != HEADER:
+            raise ValueError(f"{path} is not a tweet archive segment")
+        footer = json.loads(zlib.decompress(self._map[footer_offset:footer_offset + footer_length]))
+
+        self.first_ids = [first_id for first_id, _, _ in footer["blocks"]]
+        self.extents = [(offset, length) for _, offset, length in footer["blocks"]]
+        self.users: Dict[str, list] = footer["users"]
+        self.bloom = BloomFilter(bytearray.fromhex(footer["bloom"]), footer["hashes"])
+
+    def block_for(self, tweet_id: str) -> Optional[int]:
+        """Sparse index: the only block that can hold `tweet_id`."""
+        if tweet_id not in self.bloom:
+            return None
+        number = bisect.bisect_right(self.first_ids, tweet_id) - 1
+        return number if number >= 0 else None
+
+    def read_block(self, number: int) -> List[bytes]:
+        """The JSON lines of a block, decoded by the caller for the rows it wants only."""
+        offset, length = self.extents[number]
+        return zlib.decompress(self._map[offset:offset + length]).split(b"\n")
+
+    def close(self):
+        self._map.close()
+
+
+# Archive
+class TweetArchive:
+    """Cold tweets, in append-only segment files of a directory.
+
+    Segments are never modified: archiving writes a new one and deleting an archived tweet appends its id to
+    a tombstone log. Workers see the segments written by the archival job as soon as the directory changes.
+
+    A tombstone hides its tweet in the segments published when it was written, not in the later ones: a
+    tweet edited back to the table (its archived copy buried) can be archived again into a new segment.
+    """
+
+    def __init__(self, directory: str, block_cache: int = ARCHIVE_BLOCK_CACHE):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.block_cache = block_cache
+        self.segments: List[Segment] = []
+        self.tombstones: Dict[str, Tuple[str, str]] = {}  # tweet_id: (user_id, newest segment it hides in)
+        self._tombstones_read = 0
+        self._directory_mtime = None
+        self._blocks: "OrderedDict[Tuple[str, int], List[bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.block_reads = 0
+        self.refresh()
+
+    # Discovery
+    def refresh(self):
+        """Open the new segments and read the new tombstones (two stat calls when nothing changed)."""
+        tombstones_path = os.path.join(self.directory, TOMBSTONES)
+        directory_mtime = os.stat(self.directory).st_mtime_ns
+        tombstones_size = os.path.getsize(tombstones_path) if os.path.exists(tombstones_path) else 0
+        if directory_mtime == self._directory_mtime and tombstones_size == self._tombstones_read:
+            return
+
+        with self._lock:
+            known = {segment.name for segment in self.segments}
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(SUFFIX) and name not in known:
+                    self.segments.append(Segment(os.path.join(self.directory, name)))
+            self._directory_mtime = directory_mtime
+
+            if tombstones_size > self._tombstones_read:
+                with open(tombstones_path, "rb") as tombstones:
+                    tombstones.seek(self._tombstones_read)
+                    data = tombstones.read(tombstones_size - self._tombstones_read)
+                complete = data[:data.rfind(b"\n") + 1]  # A line being written is read next time
+                for line in complete.decode().splitlines():
+                    tweet_id, user_id, *bound = line.split()
+                    bound = bound[0] if bound else EVERY_SEGMENT
+                    self.tombstones[tweet_id] = (user_id, max(bound, self.tombstones.get(tweet_id, ("", ""))[1]))
+                self._tombstones_read += len(complete)
+
+    def close(self):
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+            self._blocks.clear()
+
+    # Reads
+    def buried(self, tweet_id: str, segment: Segment) -> bool:
+        """Whether the copy of `tweet_id` in `segment` was deleted."""
+        tombstone = self.tombstones.get(tweet_id)
+        return tombstone is not None and segment.name <= tombstone[1]
+
+    def _block(self, segment: Segment, number: int) -> List[bytes]:
+        key = (segment.name, number)
+        with self._lock:
+            lines = self._blocks.get(key)
+            if lines is not None:
+                self._blocks.move_to_end(key)
+                return lines
+
+        lines = segment.read_block(number)
+        with self._lock:
+            self.block_reads += 1
+            self._blocks[key] = lines
+            while len(self._blocks) > self.block_cache:
+                self._blocks.popitem(last=False)
+        return lines
+
+    def get(self, tweet_id: str) -> Optional[dict]:
+        tweet_id = str(tweet_id)
+        self.refresh()
+        prefix = json.dumps([tweet_id])[:-1].encode()  # Lines start with the tweet_id
+        for segment in reversed(self.segments):  # Newest copy first
+            if self.buried(tweet_id, segment):
+                return None  # And in every older segment
+            number = segment.block_for(tweet_id)
+            if number is None:
+                continue
+            for line in self._block(segment, number):
+                if line.startswith(prefix):
+                    return decode_row(json.loads(line))
+        return None
+
+    def get_many(self, tweet_ids: Iterable[str]) -> Dict[str, dict]:
+        rows = {}
+        for tweet_id in tweet_ids:
+            row = self.get(tweet_id)
+            if row is not None:
+                rows[row["tweet_id"]] = row
+        return rows
+
+    def user_tweets(self, user_id: str) -> List[dict]:
+        """The archived tweets of a user, read from the blocks its segments list for it."""
+        user_id = str(user_id)
+        self.refresh()
+        rows, marker = {}, json.dumps(user_id).encode()
+        for segment in self.segments:  # Oldest first, a newer copy replaces an older one
+            for number in segment.users.get(user_id, (0, "", []))[2]:
+                for line in self._block(segment, number):
+                    if marker not in line:
+                        continue
+                    row = decode_row(json.loads(line))
+                    if row["user_id"] == user_id and not self.buried(row["tweet_id"], segment):
+                        rows[row["tweet_id"]] = row
+        return list(rows.values())
+
+    def user_stats(self, user_ids: Iterable[str]) -> Dict[str, Tuple[int, Optional[date]]]:
+        """(count, newest created_at) of the archived tweets of each user, from the footers.
+
+        Only the users with deleted archived tweets have their blocks read.
+        """
+        self.refresh()
+        buried = {user_id for user_id, _ in self.tombstones.values()}
+        stats = {}
+        for user_id in map(str, user_ids):
+            if user_id in buried:
+                rows = self.user_tweets(user_id)
+                if rows:
+                    stats[user_id] = (len(rows), max(row["created_at"] for row in rows))
+                continue
+            count, newest = 0, ""
+            for segment in self.segments:
+                user_count, user_newest, _ = segment.users.get(user_id, (0, "", []))
+                count, newest = count + user_count, max(newest, user_newest)
+            if count:
+                stats[user_id] = (count, date.fromisoformat(newest))
+        return stats
+
+    def batches(self, batch_size: int) -> Iterator[List[dict]]:
+        """Every archived tweet, segment by segment (newest segments first, a tweet archived twice comes once),
+        for the dumps. The blocks are read around the cache."""
+        self.refresh()
+        seen, batch = set(), []
+        for segment in reversed(list(self.segments)):
+            for number in range(len(segment.extents)):
+                for line in segment.read_block(number):
+                    row = decode_row(json.loads(line))
+                    if row["tweet_id"] in seen:
+                        continue
+                    seen.add(row["tweet_id"])  # A buried copy also hides the older ones
+                    if self.buried(row["tweet_id"], segment):
+                        continue
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    # Writes
+    def write_pending(self, rows: List[dict]) -> str:
+        """Write the next segment under a name readers ignore until `publish`."""
+        with self._lock:
+            names = [name for name in os.listdir(self.directory) if SUFFIX in name]
+            number = max((int(name.split(".")[0]) for name in names), default=0) + 1
+        path = os.path.join(self.directory, f"{number:08d}{SUFFIX}{PENDING}")
+        write_segment(path, sorted(rows, key=lambda row: str(row["tweet_id"])))
+        return path
+
+    @staticmethod
+    def publish(pending_path: str):
+        os.replace(pending_path, pending_path[:-len(PENDING)])
+
+    def recover(self, still_hot: Callable[[dict], bool]):
+        """Finish the segments of an interrupted archival: publish them if their tweets left the hot table
+        (the deletion committed), drop them otherwise."""
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(PENDING):
+                continue
+            path = os.path.join(self.directory, name)
+            segment = Segment(path)
+            first_row = decode_row(json.loads(segment.read_block(0)[0]))
+            segment.close()
+            if still_hot(first_row):
+                os.remove(path)
+            else:
+                self.publish(path)
+
+    def bury(self, tweets: List[Tuple[str, str]]):
+        """Delete archived tweets ((tweet_id, user_id) pairs) with an append to the tombstone log.
+
+        Each line names the newest published segment, the copies archived again later stay visible.
+        """
+        if not tweets:
+            return
+        self.refresh()
+        with self._lock:
+            bound = self.segments[-1].name if self.segments else NO_SEGMENT
+        with open(os.path.join(self.directory, TOMBSTONES), "ab") as tombstones:
+            tombstones.write("".join(f"{tweet_id} {user_id} {bound}\n" for tweet_id, user_id in tweets).encode())
+            tombstones.flush()
+            os.fsync(tombstones.fileno())
+        self.refresh()
+
+    def stats(self) -> dict:
+        self.refresh()
+        return {
+            "segments": len(self.segments),
+            "bytes": sum(os.path.getsize(segment.path) for segment in self.segments),
+            "tombstones": len(self.tombstones),
+            "cached_blocks": len(self._blocks),
+            "block_reads": self.block_reads,
+        }
+
+
+# Unset: no archive, every tweet stays in the tweets table
+TWEET_ARCHIVE_DIR = os.getenv("TWEET_ARCHIVE_DIR", "")
+tweet_archive: Optional[TweetArchive] = TweetArchive(TWEET_ARCHIVE_DIR) if TWEET_ARCHIVE_DIR else None
@@ -0,0 +1,226 @@
+
+# Python
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Live Streams
+from .hub import RESYNC
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR", "")  # Sockets of the workers of one host, empty disables the bus
+CACHE_BUS_BATCH = 500  # Keys per datagram
+CACHE_BUS_EVENTS_BATCH = 50  # Stream events per datagram (each one a tweet of up to 280 characters)
+CACHE_BUS_BUFFER = 1024 * 1024  # Receive buffer of every worker
+
+
+class InvalidationBus:
+    """Invalidations of the entity caches between the workers of a host, over unix datagram sockets.
+
+    Every worker binds `<directory>/<sender>.sock` and reads it from a daemon thread, and a write sends the
+    keys it changed to every other socket of the directory without waiting for them (no broker, no
+    database). Messages carry a version, one counter per sender: a receiver that finds a gap missed a
+    message (its buffer was full) and clears its caches instead of serving what it missed. Sockets left by
+    dead workers are removed by the first sender that finds nobody reading them.
+
+    The live stream events of the writes travel the same way to the `deliver` of the other workers (their
+    hub), after a gap it gets a resync instead.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            evict: Callable[[List[str], List[str]], None],
+            clear: Callable[[], None],
+            deliver: Optional[Callable[[List[bytes]], None]] = None
+    ):
+        self.directory = directory
+        self.evict = evict
+        self.clear = clear
+        self.deliver = deliver
+        self._lock = threading.Lock()
+        self._pid = None
+        self._listener: Optional[socket.socket] = None
+        self._seen: Dict[str, int] = {}  # Last version of every sender
+        self._peers: List[str] = []
+        self._peers_mtime = None
+        # Measurements
+        self.published = 0
+        self.received = 0
+        self.gaps = 0
+        self.dropped = 0
+
+    def _check_process(self):
+        """A forked worker gets its own sender name, version and socket (called holding the lock)."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self.sender = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        self.version = 0
+        self._listener = None
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.sender}.sock")
+
+    # Receive
+    def start(self):
+        """Listen for the invalidations of the other workers, once per worker process."""
+        with self._lock:
+            self._check_process()
+            if self._listener is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, CACHE_BUS_BUFFER)
+            listener.bind(self.path)
+            self._listener = listener
+        threading.Thread(target=self._receive, args=(listener,), name="cache-bus", daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            listener, self._listener = self._listener, None
+            if listener is None or self._pid != os.getpid():
+                return
+            try:
+                self._socket.sendto(b"", self.path)  # Wakes the receiving thread up
+            except OSError:
+                listener.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _receive(self, listener: socket.socket):
+        while True:
+            try:
+                datagram = listener.recv(CACHE_BUS_BUFFER)
+            except OSError:
+                break
+            if not datagram:  # Stopped
+                break
+            try:
+                self.handle(json.loads(datagram))
+            except Exception:
+                logger.exception("Invalid cache bus message")
+        listener.close()
+
+    def handle(self, message: dict):
+        with self._lock:
+            last = self._seen.get(message["sender"])
+            self._seen[message["sender"]] = message["version"]
+            self.received += 1
+            gap = last is not None and message["version"] != last + 1
+            if gap:
+                self.gaps += 1
+
+        if gap or message.get("clear"):
+            self.clear()
+        elif message.get("tweets") or message.get("users"):
+            self.evict(message.get("tweets", []), message.get("users", []))
+
+        if self.deliver is not None:
+            events = [event.encode() for event in message.get("events", [])]
+            self.deliver(([RESYNC] if gap else []) + events)  # Streams that missed events catch up
+
+    # Send
+    def publish(
+            self,
+            tweet_ids: Iterable[str] = (),
+            user_ids: Iterable[str] = (),
+            clear: bool = False,
+            events: Iterable[bytes] = ()
+    ):
+        """Send written keys (or a clear of every cache), and the stream events of the writes, to the other
+        workers."""
+        tweet_ids = [str(tweet_id) for tweet_id in tweet_ids]
+        user_ids = [str(user_id) for user_id in user_ids]
+        events = [event.decode() for event in events]
+        if not (tweet_ids or user_ids or clear or events):
+            return
+
+        with self._lock:
+            self._check_process()
+            messages = []
+            if tweet_ids or user_ids or clear:
+                for start in range(0, max(len(tweet_ids), len(user_ids), 1), CACHE_BUS_BATCH):
+                    messages.append({
+                        "tweets": tweet_ids[start:start + CACHE_BUS_BATCH],
+                        "users": user_ids[start:start + CACHE_BUS_BATCH],
+                        "clear": clear,
+                    })
+            for start in range(0, len(events), CACHE_BUS_EVENTS_BATCH):
+                messages.append({"events": events[start:start + CACHE_BUS_EVENTS_BATCH]})
+
+            datagrams = []
+            for message in messages:
+                self.version += 1
+                datagrams.append(json.dumps(
+                    {"sender": self.sender, "version": self.version, **message}, separators=(",", ":")
+                ).encode())
+            self.published += len(datagrams)
+
+            # Sent holding the lock, so every receiver gets the versions of this worker in order
+            for path in self._current_peers():
+                for datagram in datagrams:
+                    try:
+                        self._socket.sendto(datagram, path)
+                    except BlockingIOError:  # Full buffer, the receiver will find the gap
+                        self.dropped += 1
+                    except (ConnectionRefusedError, FileNotFoundError):  # Dead worker
+                        self._forget(path)
+                        break
+                    except OSError:
+                        logger.exception("Cache bus send to %s failed", path)
+                        break
+
+    def _current_peers(self) -> List[str]:
+        """Sockets of the other workers, listed again when the directory changed."""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime != self._peers_mtime:
+            self._peers_mtime = mtime
+            names = [name for name in os.listdir(self.directory) if name.endswith(".sock")]
+            self._peers = [os.path.join(self.directory, name) for name in names if name != f"{self.sender}.sock"]
+            # Forget the versions of the workers that are gone
+            senders = {name[:-len(".sock")] for name in names}
+            self._seen = {sender: version for sender, version in self._seen.items() if sender in senders}
+        return self._peers
+
+    def _forget(self, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._peers = [peer for peer in self._peers if peer != path]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "listening": self._listener is not None and self._pid == os.getpid(),
+                "peers": len(self._current_peers()) if self._pid is not None else 0,
+                "published": self.published,
+                "received": self.received,
+                "gaps": self.gaps,
+                "dropped": self.dropped,
+            }
+
+
+def bus_from_environment(
+        evict: Callable[[List[str], List[str]], None],
+        clear: Callable[[], None],
+        deliver: Optional[Callable[[List[bytes]], None]] = None
+) -> Optional[InvalidationBus]:
+    if not CACHE_BUS_DIR or not hasattr(socket, "AF_UNIX"):
+        return None
+    return InvalidationBus(CACHE_BUS_DIR, evict, clear, deliver)
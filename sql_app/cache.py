@@ -0,0 +1,171 @@
+
+# Python
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", 10_000))  # Rows kept per entity and worker, 0 disables
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", 5))  # Seconds a cached row is served
+ENTITY_CACHE_NEGATIVE_TTL = float(os.getenv("ENTITY_CACHE_NEGATIVE_TTL", 1))  # Seconds a missing id is remembered
+
+# Column values of a row by their attribute names, None for an id without a row
+Row = Optional[dict]
+
+
+class Flight:
+    """One load of a key, the readers arriving meanwhile wait for its result instead of querying."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Row = None
+        self.failed = False
+        self.stale = False  # Invalidated while loading: the value is returned but not stored
+
+
+class EntityCache:
+    """Bounded read-through cache of rows by primary key, with TTL and LRU eviction.
+
+    `get_many` answers from the fresh entries and loads the others with one call of `load`, which
+    returns the rows it found by key. The keys being loaded are in flight: concurrent readers of a key
+    wait for its load (single-flight), so a miss of a hot key costs one query whatever the number of
+    threads asking. Missing ids are remembered for `negative_ttl` seconds.
+
+    Writers call `invalidate` once committed. A load started before the write may return the old row
+    to its readers, but it is not stored.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, negative_ttl: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Row]]" = OrderedDict()
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        # Measurements
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_many(self, keys: Iterable[str], load: Callable[[List[str]], Dict[str, dict]]) -> Dict[str, Row]:
+        """Row (or None) of every key, loading the missing ones in one call."""
+        found: Dict[str, Row] = {}
+        mine: Dict[str, Flight] = {}
+        theirs: Dict[str, Flight] = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                    if entry[1] is None:
+                        self.negative_hits += 1
+                    else:
+                        self.hits += 1
+                elif key in self._flights:
+                    theirs[key] = self._flights[key]
+                    self.coalesced += 1
+                else:
+                    mine[key] = self._flights[key] = Flight()
+                    self.misses += 1
+
+        if mine:
+            self._load(mine, load)
+            found.update((key, flight.value) for key, flight in mine.items())
+
+        failed = []
+        for key, flight in theirs.items():
+            flight.done.wait()
+            if flight.failed:
+                failed.append(key)
+            else:
+                found[key] = flight.value
+        if failed:  # Their load raised, ours runs without the cache
+            rows = load(failed)
+            found.update((key, rows.get(key)) for key in failed)
+        return found
+
+    def get(self, key: str, load: Callable[[List[str]], Dict[str, dict]]) -> Row:
+        return self.get_many([key], load)[key]
+
+    def _load(self, flights: Dict[str, Flight], load: Callable[[List[str]], Dict[str, dict]]):
+        try:
+            rows = load(list(flights))
+        except BaseException:
+            with self._lock:
+                for key, flight in flights.items():
+                    flight.failed = True
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                    flight.done.set()
+            raise
+
+        now = time.monotonic()
+        with self._lock:
+            self.loads += 1
+            for key, flight in flights.items():
+                flight.value = rows.get(key)
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if not flight.stale and self.max_entries > 0:
+                    ttl = self.ttl if flight.value is not None else self.negative_ttl
+                    self._entries[key] = (now + ttl, flight.value)
+                    self._entries.move_to_end(key)
+                flight.done.set()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                key = str(key)
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+                flight = self._flights.pop(key, None)
+                if flight is not None:  # Later readers start a new load
+                    flight.stale = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for flight in self._flights.values():
+                flight.stale = True
+            self._flights.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def cache_from_environment(name: str) -> Optional[EntityCache]:
+    if ENTITY_CACHE_SIZE <= 0:
+        return None
+    return EntityCache(name, ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL, ENTITY_CACHE_NEGATIVE_TTL)
+
+
+# One cache per entity and worker (None when disabled)
+tweet_cache: Optional[EntityCache] = cache_from_environment("tweets")
+user_cache: Optional[EntityCache] = cache_from_environment("users")
@@ -0,0 +1,146 @@
+
+# Python
+import os
+import time
+import queue
+import logging
+import threading
+from uuid import uuid4
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+# SQLAlchemy
+from sqlalchemy.orm import Session, sessionmaker
+
+# Pydantic Models
+from models import NewTweet
+
+# CRUD
+from . import crud
+from .database import mysql_engine
+
+logger = logging.getLogger(__name__)
+
+WRITE_COALESCING = os.getenv("WRITE_COALESCING", "0") != "0"
+MAX_BATCH = int(os.getenv("WRITE_COALESCING_MAX_BATCH", 64))
+MAX_WAIT = float(os.getenv("WRITE_COALESCING_MAX_WAIT_MS", 2)) / 1000
+
+
+class WriteCoalescer:
+    """Group commit for tweet inserts.
+
+    Callers block on `submit` while one background thread takes everything queued (waiting at most
+    `max_wait` seconds for more, up to `max_batch` rows) and commits it in a single transaction. Under
+    concurrency many requests share one commit and one fsync, a lone request only waits `max_wait`.
+
+    Every tweet gets its id when queued, so retrying it (alone, after its batch failed) writes the same row
+    and never a second one.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            max_batch: int = MAX_BATCH,
+            max_wait: float = MAX_WAIT
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[NewTweet, str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, tweet: NewTweet):
+        """Insert `tweet` with the next group commit and return its row.
+
+        No timeout once queued: the batch could still commit after it, and a client told that its tweet
+        failed would post it again.
+        """
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((tweet, str(uuid4()), future))
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": round(self.rows / self.batches, 2) if self.batches else 0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_thread(self):
+        # Started lazily, and again in every worker forked from a preloaded master
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="tweet-write-coalescer", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> List[Tuple[NewTweet, str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._commit(batch)
+            except Exception as error:  # Never let the writer thread die
+                logger.exception("Tweet write coalescer failed")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _insert(self, tweets: List[NewTweet], tweet_ids: List[str]) -> list:
+        db = self.session_factory()
+        try:
+            return crud.create_tweets(db, tweets, tweet_ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _commit(self, batch: List[Tuple[NewTweet, str, Future]]):
+        try:
+            db_tweets = self._insert([tweet for tweet, _, _ in batch], [tweet_id for _, tweet_id, _ in batch])
+        except Exception:
+            # One bad row (e.g. an unknown user) must not fail the others: retry them one by one, with their ids
+            for tweet, tweet_id, future in batch:
+                try:
+                    future.set_result(self._insert([tweet], [tweet_id])[0])
+                except Exception as error:
+                    future.set_exception(error)
+        else:
+            for (_, _, future), db_tweet in zip(batch, db_tweets):
+                future.set_result(db_tweet)
+
+        self.batches += 1
+        self.rows += len(batch)
+
+
+# The rows outlive the session, so they keep their loaded values after the commit
+CoalescerSession = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=mysql_engine)
+
+tweet_writer: Optional[WriteCoalescer] = WriteCoalescer(CoalescerSession) if WRITE_COALESCING else None
@@ -1,50 +1,305 @@
+# Python
+import os
+import time
+import logging
+from datetime import date
+from threading import Lock
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
 # UUID
 from uuid import uuid4
 
 # Session
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, case, func, insert, select, inspect, lambda_stmt
+from sqlalchemy.orm import Session, Query, load_only, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 # SQLAlchemy Models
-from .sqlalchemy_models import UserDB, TweetDB
+from .sqlalchemy_models import UserDB, TweetDB, FollowDB, TimelineEntryDB, ChangeDB
 
 # Pydantic Models
 from models import UserRegister, User
-from models import NewTweet, UpdateTweet
+from models import Tweet, NewTweet, UpdateTweet
 
 # Hashing
 from .hashing import get_password_hash
 
+# Live streams
+from .hub import tweet_hub, sse_message
+
+# Shards (None when every tweet is in the main database)
+from .sharding import tweet_shards
+
+# Archive of the cold tweets (None when every tweet stays in the tweets table)
+from .archive import tweet_archive
+
+# Read-only records of the list endpoints
+from .records import AuthorRecord, TweetRecord, UserRecord, TWEET_COLUMNS, USER_COLUMNS
+from .records import record_columns, make_records
+
+# Name search
+from .search import name_keys, normalize_name, prefix_bounds
+
+# Entity caches (None when disabled)
+from .cache import tweet_cache, user_cache
+from .bus import bus_from_environment
+
+logger = logging.getLogger(__name__)
+
+# Timelines
+TIMELINE_FANOUT_LIMIT = int(os.getenv("TIMELINE_FANOUT_LIMIT", 10_000))  # Followers to switch to fan-out-on-read
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", 800))  # Entries kept by trim_timeline
+TIMELINE_BACKFILL = int(os.getenv("TIMELINE_BACKFILL", 20))  # Recent tweets copied on follow
+
+
+# Cached Statements
+# The hot lookups run the same shapes thousands of times a second. A lambda statement builds its construct and
+# cache key once per call site, later calls only bind the new values of the closure variables to the SQL
+# compiled the first time.
+def user_by_email(email: str):
+    return lambda_stmt(lambda: select(UserDB).where(UserDB.email == email))
+
+
+def user_by_id(user_id: str):
+    user_id = str(user_id)
+    return lambda_stmt(lambda: select(UserDB).where(UserDB.user_id == user_id))
+
+
+def users_by_ids(user_ids: List[str]):
+    return lambda_stmt(lambda: select(UserDB).where(UserDB.user_id.in_(user_ids)))
+
+
+def tweet_by_id(tweet_id: str):
+    tweet_id = str(tweet_id)
+    return lambda_stmt(lambda: select(TweetDB).where(TweetDB.tweet_id == tweet_id))
+
+
+def tweets_by_ids(tweet_ids: List[str]):
+    return lambda_stmt(lambda: select(TweetDB).where(TweetDB.tweet_id.in_(tweet_ids)))
+
+
+# Projections
+def with_fields(query: Query, model, fields: Optional[List[str]] = None):
+    """Restrict the SELECTed columns to the requested fields (the primary key is always loaded)."""
+    if not fields:
+        return query
+    return query.options(load_only(*[getattr(model, field) for field in fields]))
+
+
+def query_tweets(db: Session, fields: Optional[List[str]] = None, expand_author: bool = False):
+    """Tweets query with optional projection and authors batch-loaded in one IN query."""
+    if expand_author and fields and "user_id" not in fields:
+        fields = fields + ["user_id"]
+
+    query = with_fields(db.query(TweetDB), TweetDB, fields)
+
+    if expand_author:
+        query = query.options(selectinload(TweetDB.user).load_only(UserDB.first_name, UserDB.last_name))
+    return query
+
+
+def shard_fields(fields: Optional[List[str]] = None, expand_author: bool = False):
+    if expand_author and fields and "user_id" not in fields:
+        return fields + ["user_id"]
+    return fields
+
+
+def with_authors(db: Session, db_tweets: List[TweetDB], expand_author: bool = False):
+    """Authors of tweets read from the shards, batch-loaded from the main database in one IN query."""
+    if expand_author and db_tweets:
+        user_ids = {db_tweet.user_id for db_tweet in db_tweets}
+        authors = {
+            db_user.user_id: db_user for db_user in
+            db.query(UserDB).options(load_only(UserDB.first_name, UserDB.last_name)).filter(UserDB.user_id.in_(user_ids))
+        }
+        for db_tweet in db_tweets:
+            set_committed_value(db_tweet, "user", authors.get(db_tweet.user_id))
+    return db_tweets
+
+
+def with_author_records(db: Session, records: List[TweetRecord], expand_author: bool = False) -> List[TweetRecord]:
+    """Authors of tweet records, read with Core selects of their names (500 ids per IN query)."""
+    if not expand_author or not records:
+        return records
+    user_ids = list({record.user_id for record in records})
+    authors = {}
+    for start in range(0, len(user_ids), 500):
+        statement = select(UserDB.user_id, UserDB.first_name, UserDB.last_name).where(
+            UserDB.user_id.in_(user_ids[start:start + 500])
+        )
+        authors.update((row.user_id, AuthorRecord(*row)) for row in db.execute(statement))
+    return [record._replace(user=authors.get(record.user_id)) for record in records]
+
+
+def archived_tweets(tweet_ids: List[str]) -> Dict[str, TweetDB]:
+    """Tweets read from the archive, as rows that never join a session."""
+    if tweet_archive is None:
+        return {}
+    return {tweet_id: TweetDB(**row) for tweet_id, row in tweet_archive.get_many(tweet_ids).items()}
+
+
+# Entity Caches
+def row_values(db_objects: Dict[str, object]) -> Dict[str, dict]:
+    """Column values of loaded rows, what the caches keep (never the instances of a session)."""
+    return {
+        key: {column.key: getattr(db_object, column.key) for column in inspect(type(db_object)).column_attrs}
+        for key, db_object in db_objects.items()
+    }
+
+
+def invalidate(tweet_ids: Iterable[str] = (), user_ids: Iterable[str] = ()):
+    """Drop written rows from the caches of every worker, called once their transaction committed."""
+    tweet_ids, user_ids = list(tweet_ids), list(user_ids)
+    evict(tweet_ids, user_ids)
+    if cache_bus is not None:
+        cache_bus.publish(tweet_ids, user_ids)
+
+
+def clear_caches():
+    """Drop every cached row, after the bulk writes that do not list their ids (restore, reconcile)."""
+    clear_local_caches()
+    if cache_bus is not None:
+        cache_bus.publish(clear=True)
+
+
+def evict(tweet_ids: List[str], user_ids: List[str]):
+    """Invalidation of this worker only (the bus calls it for the writes of the others)."""
+    if tweet_cache is not None:
+        tweet_cache.invalidate(tweet_ids)
+    if user_cache is not None:
+        user_cache.invalidate(user_ids)
+
+
+def clear_local_caches():
+    for cache in (tweet_cache, user_cache):
+        if cache is not None:
+            cache.clear()
+
+
+def publish_events(messages: List[bytes]):
+    """Push committed writes to the live streams of every worker, called once their transaction committed."""
+    tweet_hub.publish(messages)
+    if cache_bus is not None:
+        cache_bus.publish(events=messages)
+
+
+def cache_stats() -> dict:
+    stats = {cache.name: cache.stats() for cache in (tweet_cache, user_cache) if cache is not None}
+    if cache_bus is not None:
+        stats["bus"] = cache_bus.stats()
+    return stats
+
+
+# Invalidations and stream events sent to the other workers of the host (None when CACHE_BUS_DIR is not set)
+cache_bus = bus_from_environment(evict=evict, clear=clear_local_caches, deliver=tweet_hub.publish)
+
 
 # User Functions
 ## Read
-def get_user_by_id(db: Session, user_id: str):
-    return db.query(UserDB).filter(UserDB.user_id == user_id).first()
+def get_user_by_id(db: Session, user_id: str, fields: Optional[List[str]] = None):
+    if user_cache is not None:
+        return get_users_by_ids(db, [str(user_id)]).get(str(user_id))
+    if not fields:
+        return db.execute(user_by_id(user_id)).scalars().first()
+    query = with_fields(db.query(UserDB), UserDB, fields)
+    return query.filter(UserDB.user_id == user_id).first()
 
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(UserDB).filter(UserDB.email == email).first()
+    return db.execute(user_by_email(email)).scalars().first()
+
+
+def get_users(db: Session, fields: Optional[List[str]] = None) -> List[UserRecord]:
+    """Every user as a read-only record, from a Core select of the requested columns."""
+    statement = select(*record_columns(UserDB.__table__, USER_COLUMNS, fields))
+    return make_records(UserRecord, db.execute(statement), fields)
+
+
+def get_users_by_ids(db: Session, user_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, UserDB]:
+    """Several users in one IN query, by user_id (missing ids are left out).
+
+    With the cache, whole rows for the ids it misses, and instances outside the session.
+    """
+    if not user_ids:
+        return {}
+    if user_cache is not None:
+        rows = user_cache.get_many(map(str, user_ids), lambda keys: row_values(load_users(db, keys)))
+        return {user_id: UserDB(**row) for user_id, row in rows.items() if row is not None}
+    return load_users(db, user_ids, fields)
 
 
-def get_users(db: Session):
-    return db.query(UserDB).all()
+def load_users(db: Session, user_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, UserDB]:
+    if not fields:
+        query = db.execute(users_by_ids(list(user_ids))).scalars()
+    else:
+        query = with_fields(db.query(UserDB), UserDB, fields).filter(UserDB.user_id.in_(user_ids))
+    return {db_user.user_id: db_user for db_user in query}
+
+
+def search_users(
+        db: Session,
+        prefix: str = "",
+        country: Optional[str] = None,
+        limit: int = 20,
+        after: Optional[Tuple[str, str]] = None,
+        fields: Optional[List[str]] = None
+) -> Tuple[List[UserRecord], Optional[Tuple[str, str]]]:
+    """Users whose first or last name starts with `prefix`, ordered by (name key, user_id), and the
+    (key, user_id) to pass as `after` for the next page (None on the last one).
+
+    One range scan per name order, each stopping after `limit + 1` index entries, merged in Python. A user
+    matching by both names is only returned by the first scan.
+    """
+    prefix = normalize_name(prefix)
+    columns = record_columns(UserDB.__table__, USER_COLUMNS, fields)
+    names = [column.key for column in columns]
+
+    scans = [(UserDB.name_key, None)]
+    if prefix:
+        lower, upper = prefix_bounds(prefix)
+        scans.append((UserDB.reverse_name_key, UserDB.name_key))
+
+    rows = []
+    for key, first_scan_key in scans:
+        statement = select(*columns, key.label("search_key")).order_by(key, UserDB.user_id).limit(limit + 1)
+        if prefix:
+            statement = statement.where(key >= lower, key < upper)
+        else:
+            statement = statement.where(key.isnot(None))
+        if first_scan_key is not None:
+            statement = statement.where(or_(first_scan_key < lower, first_scan_key >= upper))
+        if country is not None:
+            statement = statement.where(UserDB.country == country)
+        if after is not None:
+            statement = statement.where(or_(key > after[0], and_(key == after[0], UserDB.user_id > after[1])))
+        rows.extend(db.execute(statement).all())
+
+    rows.sort(key=lambda row: (row.search_key, row.user_id))
+    page = rows[:limit]
+    cursor = (page[-1].search_key, page[-1].user_id) if len(rows) > limit else None
+    return [UserRecord(**dict(zip(names, row))) for row in page], cursor
 
 
 ## Create
-def create_user(db: Session, user: UserRegister):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: UserRegister, hashed_password: Optional[str] = None):
+    # A pre-computed hash skips the bcrypt work (fixtures, seeding)
+    hashed_password = hashed_password or get_password_hash(user.password)
 
     db_user = UserDB(
-        user_id=uuid4(),
+        user_id=str(uuid4()),
         first_name=user.first_name,
         last_name=user.last_name,
         email=user.email,
         password=hashed_password,
         birth_date=user.birth_date,
         country=user.country,
-        creation_account_date=user.creation_account_date
+        creation_account_date=user.creation_account_date,
+        **name_keys(user.first_name, user.last_name)
     )
 
     db.add(db_user)  # Add the new instance
+    record_changes(db, "user", "create", [db_user.user_id])
     db.commit()  # Commit the changes to the database
     # Refresh the instance (so that it contains new data from the database, like the generated ID)
     db.refresh(db_user)
@@ -52,20 +307,23 @@ def create_user(db: Session, user: UserRegister):
     return db_user
 
 
-def create_user_if_not_exist(db: Session, user: UserRegister):
+def create_user_if_not_exist(db: Session, user: UserRegister, hashed_password: Optional[str] = None):
     db_user = get_user_by_email(db, user.email)
     if db_user:
         return db_user
     else:
-        user = create_user(db, user)
+        user = create_user(db, user, hashed_password)
         return user
 
 
 ## Delete
 def delete_user(db: Session, user_id: str):
     user_to_delete = get_user_by_id(db, user_id)
+    neighbours = delete_user_graph(db, user_id)
     db.query(UserDB).filter(UserDB.user_id == user_id).delete()
+    record_changes(db, "user", "delete", [user_id])
     db.commit()
+    invalidate(user_ids=[user_id] + neighbours)
 
     response = {
         "user_id": user_to_delete.user_id,
@@ -78,8 +336,11 @@ def delete_user(db: Session, user_id: str):
 def delete_user_if_exists(db: Session, user_id: str):
     db_user = get_user_by_id(db, user_id)
     if db_user is not None:
+        neighbours = delete_user_graph(db, user_id)
         db.query(UserDB).filter(UserDB.user_id == user_id).delete()
+        record_changes(db, "user", "delete", [user_id])
         db.commit()
+        invalidate(user_ids=[user_id] + neighbours)
 
 
 ## Update
@@ -90,53 +351,268 @@ def update_user(db: Session, user_id: str, new_user_info: UserRegister):
 
     # To Dict
     new_user_info = new_user_info.dict()
+    new_user_info.update(name_keys(new_user_info["first_name"], new_user_info["last_name"]))
 
     # Updating Info
     db.query(UserDB).filter(UserDB.user_id == user_id).update(new_user_info)
+    record_changes(db, "user", "update", [user_id])
     db.commit()
+    invalidate(user_ids=[user_id])
 
     return get_user_by_id(db, user_id=user_id)
 
 
 # Tweet Functions
 ## Read
-def get_tweets(db: Session):
-    return db.query(TweetDB).all()
-
-
-def get_user_tweets(db: Session, user: User):
-    return db.query(TweetDB).filter(TweetDB.user_id == user.user_id).all()
-
+def get_tweets(db: Session, fields: Optional[List[str]] = None, expand_author: bool = False) -> List[TweetRecord]:
+    """Every hot tweet as a read-only record, from Core selects of the requested columns.
+
+    The archive is not merged: listing it would read every segment on each call, the archived tweets are read
+    by id, by author and in the home timelines.
+    """
+    fields = shard_fields(fields, expand_author)
+    if tweet_shards is not None:  # Newest first, merged from every shard
+        records = tweet_shards.get_tweets(fields)
+    else:
+        statement = select(*record_columns(TweetDB.__table__, TWEET_COLUMNS, fields))
+        records = make_records(TweetRecord, db.execute(statement), fields)
+    return with_author_records(db, records, expand_author)
+
+
+def get_user_tweets(
+        db: Session,
+        user: User,
+        fields: Optional[List[str]] = None,
+        expand_author: bool = False
+) -> List[TweetRecord]:
+    fields = shard_fields(fields, expand_author)
+    if tweet_shards is not None:  # One shard
+        records = tweet_shards.get_user_tweets(user.user_id, fields)
+    else:
+        statement = select(*record_columns(TweetDB.__table__, TWEET_COLUMNS, fields)).where(
+            TweetDB.user_id == str(user.user_id)
+        )
+        records = make_records(TweetRecord, db.execute(statement), fields)
+
+    if tweet_archive is not None:  # Then the archived ones, from the blocks listing this user
+        hot = {record.tweet_id for record in records}
+        records += [TweetRecord(**row) for row in tweet_archive.user_tweets(user.user_id) if row["tweet_id"] not in hot]
+    return with_author_records(db, records, expand_author)
+
+
+def get_tweet_by_id(db: Session, tweet_id: str, fields: Optional[List[str]] = None, expand_author: bool = False):
+    if tweet_cache is not None:
+        return get_tweets_by_ids(db, [str(tweet_id)], fields, expand_author).get(str(tweet_id))
+    if tweet_shards is not None:
+        db_tweet = tweet_shards.get_tweets_by_id([tweet_id], shard_fields(fields, expand_author)).get(tweet_id)
+        if db_tweet is not None:
+            return with_authors(db, [db_tweet], expand_author)[0]
+    else:
+        if not fields and not expand_author:
+            db_tweet = db.execute(tweet_by_id(tweet_id)).scalars().first()
+        else:
+            db_tweet = query_tweets(db, fields, expand_author).filter(TweetDB.tweet_id == tweet_id).first()
+        if db_tweet is not None:
+            return db_tweet
+
+    # Not in the hot table: the archive, or nothing
+    db_tweet = archived_tweets([tweet_id]).get(str(tweet_id))
+    return with_authors(db, [db_tweet], expand_author)[0] if db_tweet is not None else None
+
+
+def get_tweets_by_ids(
+        db: Session,
+        tweet_ids: List[str],
+        fields: Optional[List[str]] = None,
+        expand_author: bool = False
+) -> Dict[str, TweetDB]:
+    """Several tweets in one IN query (on every shard when sharded), the archive for the rest, by tweet_id.
+
+    With the cache, whole rows for the ids it misses and authors from the user cache, and instances
+    outside the session.
+    """
+    if not tweet_ids:
+        return {}
+    if tweet_cache is not None:
+        rows = tweet_cache.get_many(map(str, tweet_ids), lambda keys: row_values(load_tweets(db, keys)))
+        db_tweets = {tweet_id: TweetDB(**row) for tweet_id, row in rows.items() if row is not None}
+        if expand_author and db_tweets:
+            authors = get_users_by_ids(db, list({db_tweet.user_id for db_tweet in db_tweets.values()}))
+            for db_tweet in db_tweets.values():
+                set_committed_value(db_tweet, "user", authors.get(db_tweet.user_id))
+        return db_tweets
+    return load_tweets(db, tweet_ids, fields, expand_author)
+
+
+def load_tweets(
+        db: Session,
+        tweet_ids: List[str],
+        fields: Optional[List[str]] = None,
+        expand_author: bool = False
+) -> Dict[str, TweetDB]:
+    if tweet_shards is not None:
+        db_tweets = tweet_shards.get_tweets_by_id(tweet_ids, shard_fields(fields, expand_author))
+        with_authors(db, list(db_tweets.values()), expand_author)
+    elif not fields and not expand_author:  # What the cache loads
+        db_tweets = {db_tweet.tweet_id: db_tweet for db_tweet in db.execute(tweets_by_ids(list(tweet_ids))).scalars()}
+    else:
+        query = query_tweets(db, fields, expand_author).filter(TweetDB.tweet_id.in_(tweet_ids))
+        db_tweets = {db_tweet.tweet_id: db_tweet for db_tweet in query}
 
-def get_tweet_by_id(db: Session, tweet_id: str):
-    return db.query(TweetDB).filter(TweetDB.tweet_id == tweet_id).first()
+    archived = archived_tweets([tweet_id for tweet_id in tweet_ids if tweet_id not in db_tweets])
+    with_authors(db, list(archived.values()), expand_author)
+    db_tweets.update(archived)
+    return db_tweets
 
 
 ## Create
-def create_tweet(db: Session, tweet: NewTweet):
-    db_tweet = TweetDB(
-        tweet_id=uuid4(),
+def tweet_row(tweet: NewTweet, tweet_id: Optional[str] = None):
+    return TweetDB(
+        tweet_id=tweet_id or str(uuid4()),
         content=tweet.content,
         created_at=tweet.created_at,
         updated_at=tweet.updated_at,
-        user_id=tweet.user_id
+        user_id=str(tweet.user_id)
     )
 
-    db.add(db_tweet)  # Add the new instance
-    db.commit()  # Commit the changes to the database
+
+def create_tweets(db: Session, tweets: List[NewTweet], tweet_ids: Optional[List[str]] = None):
+    """Insert several tweets in one transaction, so they share a single commit.
+
+    `tweet_ids` (new ones by default) let a caller retry the same rows: a shard skips the ids it already has.
+    """
+    db_tweets = [tweet_row(tweet, tweet_id) for tweet, tweet_id in zip(tweets, tweet_ids or [None] * len(tweets))]
+    add_tweets(db, db_tweets)
+    with removed_from_shards_on_error(db, db_tweets):
+        fan_out(db, db_tweets)
+        count_new_tweets(db, db_tweets)
+        record_changes(db, "tweet", "create", [db_tweet.tweet_id for db_tweet in db_tweets])
+        messages = [tweet_message("create", db_tweet) for db_tweet in db_tweets]
+        db.commit()
+    invalidate(user_ids={db_tweet.user_id for db_tweet in db_tweets})  # Counters
+    publish_events(messages)
+    # Every column is generated here, no refresh needed when the session does not expire on commit
+    return db_tweets
+
+
+def create_tweet(db: Session, tweet: NewTweet):
+    db_tweet = tweet_row(tweet)
+
+    add_tweets(db, [db_tweet])  # Add the new instance
+    with removed_from_shards_on_error(db, [db_tweet]):
+        fan_out(db, [db_tweet])  # Timeline entries, counters and change log, in the same transaction
+        count_new_tweets(db, [db_tweet])
+        record_changes(db, "tweet", "create", [db_tweet.tweet_id])
+        db.commit()  # Commit the changes to the database
+    invalidate(user_ids=[db_tweet.user_id])  # Counters
     # Refresh the instance (so that it contains new data from the database, like the generated ID)
-    db.refresh(db_tweet)
+    if tweet_shards is None:
+        db.refresh(db_tweet)
+    publish_events([tweet_message("create", db_tweet)])
 
     return db_tweet
 
 
+def add_tweets(db: Session, db_tweets: List[TweetDB]):
+    if tweet_shards is not None:
+        # Committed in their shards first, the main database only keeps their ids (timelines, change log)
+        tweet_shards.add_tweets(db_tweets)
+    else:
+        db.add_all(db_tweets)
+
+
+@contextmanager
+def removed_from_shards_on_error(db: Session, db_tweets: List[TweetDB]):
+    """The shards commit the new tweets before the main database. If the rest of the write fails, the main
+    transaction is rolled back and the tweets deleted from their shards, so none is left without its timeline
+    entries, counters and change log (the error is raised again)."""
+    try:
+        yield
+    except BaseException:
+        if tweet_shards is None:
+            raise
+        db.rollback()
+        by_user: Dict[str, List[str]] = {}
+        for db_tweet in db_tweets:
+            by_user.setdefault(db_tweet.user_id, []).append(db_tweet.tweet_id)
+        for user_id, tweet_ids in by_user.items():
+            try:
+                tweet_shards.delete_tweets(user_id, tweet_ids)
+            except Exception:
+                logger.exception("Could not delete the tweets %s of a failed write from their shard", tweet_ids)
+        raise
+
+
+def tweet_message(operation: str, db_tweet: TweetDB) -> bytes:
+    """Live stream message of a tweet write (published by the caller once committed)."""
+    return sse_message(operation, Tweet.from_orm(db_tweet).dict())
+
+
+## Counters
+def count_new_tweets(db: Session, db_tweets: List[TweetDB]):
+    """Add new tweets to their authors' counters with one atomic UPDATE per author."""
+    authors = {}
+    for db_tweet in db_tweets:
+        count, newest = authors.get(db_tweet.user_id, (0, db_tweet.created_at))
+        authors[db_tweet.user_id] = (count + 1, max(newest, db_tweet.created_at))
+
+    for user_id, (count, newest) in authors.items():
+        db.query(UserDB).filter(UserDB.user_id == user_id).update({
+            "tweets_count": UserDB.tweets_count + count,
+            "last_tweet_at": case(
+                (or_(UserDB.last_tweet_at.is_(None), UserDB.last_tweet_at < newest), newest),
+                else_=UserDB.last_tweet_at
+            )
+        }, synchronize_session=False)
+
+
+def newest_tweet_date(db: Session, user_id: str, buried: Iterable[str] = ()):
+    """Correlated subquery for last_tweet_at, an indexed read of one user's tweets (for deletes and edits).
+
+    A value instead when the tweets are read from the shards or the archive, without the archived tweets
+    `buried` once the transaction commits.
+    """
+    if tweet_shards is not None:  # Read once the shard committed
+        newest = tweet_shards.newest_tweet_date(user_id)
+    else:
+        newest = select(func.max(TweetDB.created_at)).where(TweetDB.user_id == user_id).scalar_subquery()
+    if tweet_archive is None:
+        return newest
+
+    # The newest archived tweet, from the segment footers
+    if tweet_shards is None:
+        newest = db.execute(select(newest)).scalar()
+    if buried:
+        archived = max(
+            (row["created_at"] for row in tweet_archive.user_tweets(user_id) if row["tweet_id"] not in buried),
+            default=None
+        )
+    else:
+        _, archived = tweet_archive.user_stats([user_id]).get(str(user_id), (0, None))
+    return max(filter(None, (newest, archived)), default=None)
+
+
 ## Delete
 def delete_tweet(db: Session, tweet_id: str):
     tweet_to_delete = get_tweet_by_id(db, tweet_id)
-    user = tweet_to_delete.user
+    user = get_user_by_id(db, tweet_to_delete.user_id)
+    buried = [tweet_id] if tweet_archive is not None and tweet_archive.get(tweet_id) is not None else []
 
-    db.query(TweetDB).filter(TweetDB.tweet_id == tweet_id).delete()
+    db.query(TimelineEntryDB).filter(TimelineEntryDB.tweet_id == tweet_id).delete()
+    if tweet_shards is not None:
+        tweet_shards.delete_tweets(user.user_id, [tweet_id])
+    else:
+        db.query(TweetDB).filter(TweetDB.tweet_id == tweet_id).delete()
+    db.query(UserDB).filter(UserDB.user_id == user.user_id).update(
+        {"tweets_count": UserDB.tweets_count - 1, "last_tweet_at": newest_tweet_date(db, user.user_id, buried)},
+        synchronize_session=False
+    )
+    record_changes(db, "tweet", "delete", [tweet_id])
     db.commit()
+    if buried:  # Segments hold no transaction, the copy is buried once the delete committed
+        tweet_archive.bury([(tweet_id, user.user_id)])
+    invalidate(tweet_ids=[tweet_id], user_ids=[user.user_id])
+    publish_events([sse_message("delete", {"tweet_id": tweet_id})])
 
     response = {
         "tweet_id": tweet_to_delete.tweet_id,
@@ -147,14 +623,355 @@ def delete_tweet(db: Session, tweet_id: str):
 
 
 def delete_tweets_by_user(db: Session, user_id: str):
-    db.query(TweetDB).filter(TweetDB.user_id == user_id).delete()
+    db.query(TimelineEntryDB).filter(TimelineEntryDB.author_id == user_id).delete()
+    if tweet_shards is not None:
+        tweet_ids = tweet_shards.delete_tweets(user_id)
+    else:
+        tweet_ids = [tweet_id for tweet_id, in db.query(TweetDB.tweet_id).filter(TweetDB.user_id == user_id)]
+        db.query(TweetDB).filter(TweetDB.user_id == user_id).delete()
+    buried = [row["tweet_id"] for row in tweet_archive.user_tweets(user_id)] if tweet_archive is not None else []
+    tweet_ids += buried
+    db.query(UserDB).filter(UserDB.user_id == user_id).update(
+        {"tweets_count": 0, "last_tweet_at": None}, synchronize_session=False
+    )
+    record_changes(db, "tweet", "delete", tweet_ids)
     db.commit()
+    if buried:
+        tweet_archive.bury([(tweet_id, user_id) for tweet_id in buried])
+    invalidate(tweet_ids=tweet_ids, user_ids=[user_id])
+    publish_events([sse_message("delete", {"tweet_id": tweet_id}) for tweet_id in tweet_ids])
 
 
 ## Update
 def update_tweet(db: Session, tweet_id: str, new_tweet_info: UpdateTweet):
     new_tweet_info = new_tweet_info.dict()
-    db.query(TweetDB).filter(TweetDB.tweet_id == tweet_id).update(new_tweet_info)
+    thawed = thaw_tweet(db, tweet_id)
+    if tweet_shards is not None:
+        db_tweet = tweet_shards.update_tweet(get_tweet_by_id(db, tweet_id), new_tweet_info)
+        user_id = db_tweet.user_id
+    else:
+        db.query(TweetDB).filter(TweetDB.tweet_id == tweet_id).update(new_tweet_info)
+        user_id = db.query(TweetDB.user_id).filter(TweetDB.tweet_id == tweet_id).scalar()
+
+    # created_at may have changed
+    db.query(UserDB).filter(UserDB.user_id == user_id).update(
+        {"last_tweet_at": newest_tweet_date(db, user_id)}, synchronize_session=False
+    )
+    record_changes(db, "tweet", "update", [tweet_id])
     db.commit()
+    invalidate(tweet_ids=[tweet_id], user_ids=[user_id])
+    if thawed is not None:  # Back in the hot table for good
+        tweet_archive.bury([(tweet_id, user_id)])
 
-    return get_tweet_by_id(db, tweet_id=tweet_id)
+    if tweet_shards is None:
+        db_tweet = get_tweet_by_id(db, tweet_id=tweet_id)
+    publish_events([tweet_message("update", db_tweet)])
+    return db_tweet
+
+
+def thaw_tweet(db: Session, tweet_id: str) -> Optional[TweetDB]:
+    """Copy an archived tweet back to the hot table before it is edited (segments are immutable).
+
+    The caller buries the archived copy once its transaction committed.
+    """
+    if tweet_archive is None:
+        return None
+    if tweet_shards is not None:
+        if tweet_shards.get_tweets_by_id([tweet_id], ["tweet_id"]):
+            return None
+    elif db.query(TweetDB.tweet_id).filter(TweetDB.tweet_id == tweet_id).first() is not None:
+        return None
+
+    db_tweet = archived_tweets([tweet_id]).get(str(tweet_id))
+    if db_tweet is not None:
+        add_tweets(db, [db_tweet])
+        db.flush()
+    return db_tweet
+
+
+# Follow Functions
+## Read
+def get_follow(db: Session, follower_id: str, followed_id: str):
+    return db.query(FollowDB).filter(FollowDB.follower_id == follower_id, FollowDB.followed_id == followed_id).first()
+
+
+## Create
+def follow_user(db: Session, follower_id: str, followed: UserDB):
+    db_follow = get_follow(db, follower_id, followed.user_id)
+    if db_follow is not None:
+        return db_follow
+
+    db_follow = FollowDB(
+        follower_id=follower_id,
+        followed_id=followed.user_id,
+        created_at=date.today(),
+        fanout_on_read=followed.fanout_on_read
+    )
+    db.add(db_follow)
+    db.flush()
+    count_follow(db, follower_id, followed.user_id, 1)
+
+    if not followed.fanout_on_read:
+        followers = db.query(UserDB.followers_count).filter(UserDB.user_id == followed.user_id).scalar()
+        if followers >= TIMELINE_FANOUT_LIMIT:
+            set_fanout_on_read(db, followed.user_id)
+        else:
+            backfill_timeline(db, follower_id, followed.user_id)
+
+    db.commit()
+    invalidate(user_ids=[follower_id, followed.user_id])  # Counters and fanout_on_read
+    db.refresh(db_follow)
+
+    return db_follow
+
+
+def set_fanout_on_read(db: Session, user_id: str):
+    """From now on the tweets of `user_id` are not copied to its followers, they are merged at read time."""
+    db.query(UserDB).filter(UserDB.user_id == user_id).update({"fanout_on_read": True})
+    db.query(FollowDB).filter(FollowDB.followed_id == user_id).update({"fanout_on_read": True})
+
+
+## Delete
+def unfollow_user(db: Session, follower_id: str, followed_id: str) -> bool:
+    deleted = db.query(FollowDB).filter(
+        FollowDB.follower_id == follower_id, FollowDB.followed_id == followed_id
+    ).delete()
+    db.query(TimelineEntryDB).filter(
+        TimelineEntryDB.user_id == follower_id, TimelineEntryDB.author_id == followed_id
+    ).delete()
+    if deleted:
+        count_follow(db, follower_id, followed_id, -1)
+    db.commit()
+    invalidate(user_ids=[follower_id, followed_id])
+
+    return bool(deleted)
+
+
+def count_follow(db: Session, follower_id: str, followed_id: str, change: int):
+    db.query(UserDB).filter(UserDB.user_id == followed_id).update(
+        {"followers_count": UserDB.followers_count + change}, synchronize_session=False
+    )
+    db.query(UserDB).filter(UserDB.user_id == follower_id).update(
+        {"following_count": UserDB.following_count + change}, synchronize_session=False
+    )
+
+
+def delete_user_graph(db: Session, user_id: str) -> List[str]:
+    """Follows and timeline entries of a user that is about to be deleted (committed by the caller).
+
+    Returns the ids of the users whose counters changed.
+    """
+    neighbours = [
+        follower_id if followed_id == user_id else followed_id
+        for follower_id, followed_id in db.query(FollowDB.follower_id, FollowDB.followed_id).filter(
+            or_(FollowDB.follower_id == user_id, FollowDB.followed_id == user_id)
+        )
+    ]
+    followers = select(FollowDB.follower_id).where(FollowDB.followed_id == user_id)
+    followed = select(FollowDB.followed_id).where(FollowDB.follower_id == user_id)
+    db.query(UserDB).filter(UserDB.user_id.in_(followers)).update(
+        {"following_count": UserDB.following_count - 1}, synchronize_session=False
+    )
+    db.query(UserDB).filter(UserDB.user_id.in_(followed)).update(
+        {"followers_count": UserDB.followers_count - 1}, synchronize_session=False
+    )
+    db.query(FollowDB).filter(or_(FollowDB.follower_id == user_id, FollowDB.followed_id == user_id)).delete()
+    db.query(TimelineEntryDB).filter(
+        or_(TimelineEntryDB.user_id == user_id, TimelineEntryDB.author_id == user_id)
+    ).delete()
+    return neighbours
+
+
+# Timeline Functions
+_position_lock = Lock()
+_last_position = 0
+
+
+def next_position() -> int:
+    """Microseconds since the epoch, strictly increasing within the process."""
+    global _last_position
+    with _position_lock:
+        _last_position = max(_last_position + 1, time.time_ns() // 1000)
+        return _last_position
+
+
+## Create
+def fan_out(db: Session, db_tweets: List[TweetDB]):
+    """Copy new tweets to the timelines of the author and its followers (fan-out-on-write).
+
+    Accounts with fanout_on_read set only get the author's own entry, their followers merge those at read time.
+    """
+    entries = []
+    for db_tweet in db_tweets:
+        position = next_position()
+        readers = [db_tweet.user_id]
+
+        fanout_on_read = db.query(UserDB.fanout_on_read).filter(UserDB.user_id == db_tweet.user_id).scalar()
+        if not fanout_on_read:
+            followers = db.query(FollowDB.follower_id).filter(FollowDB.followed_id == db_tweet.user_id)
+            readers += [follow.follower_id for follow in followers]
+
+        entries += [
+            {"user_id": reader, "position": position, "tweet_id": db_tweet.tweet_id, "author_id": db_tweet.user_id}
+            for reader in readers
+        ]
+
+    db.flush()  # Tweets before their entries
+    db.execute(insert(TimelineEntryDB.__table__), entries)
+
+
+def backfill_timeline(db: Session, follower_id: str, followed_id: str, size: int = None):
+    """Recent tweets of a newly followed account, taken from its own timeline entries."""
+    recent = db.query(TimelineEntryDB.position, TimelineEntryDB.tweet_id).filter(
+        TimelineEntryDB.user_id == followed_id, TimelineEntryDB.author_id == followed_id
+    ).order_by(TimelineEntryDB.position.desc()).limit(TIMELINE_BACKFILL if size is None else size).all()
+
+    if recent:
+        db.execute(insert(TimelineEntryDB.__table__), [
+            {"user_id": follower_id, "position": position, "tweet_id": tweet_id, "author_id": followed_id}
+            for position, tweet_id in recent
+        ])
+
+
+## Read
+def get_home_timeline(
+        db: Session,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[Tuple[int, Optional[str]]] = None
+) -> Tuple[List[Tuple[int, TweetDB]], Optional[Tuple[int, str]]]:
+    """(position, tweet) pairs, newest first, and the (position, tweet_id) to pass as `before` for the next
+    page (None on the last one).
+
+    A range read of the user's entries on (user_id, position, tweet_id). Followed accounts with fanout_on_read
+    add the ranges of their own entries, whatever the number of followed accounts. Positions come from the
+    clock of each worker and may repeat, the tweet_id orders the entries of the same position. The cursor is
+    the last entry read, even when its tweet is gone, so a page of deleted tweets does not end the timeline.
+    """
+    pulled = [
+        follow.followed_id for follow in
+        db.query(FollowDB.followed_id).filter(FollowDB.follower_id == user_id, FollowDB.fanout_on_read.is_(True))
+    ]
+
+    owned = TimelineEntryDB.user_id == user_id
+    if pulled:
+        owned = or_(
+            # Entries copied before those accounts switched to fan-out-on-read are read from their side
+            and_(owned, TimelineEntryDB.author_id.notin_(pulled)),
+            and_(TimelineEntryDB.user_id.in_(pulled), TimelineEntryDB.author_id == TimelineEntryDB.user_id)
+        )
+
+    if tweet_shards is not None:
+        query = db.query(TimelineEntryDB.position, TimelineEntryDB.tweet_id, TimelineEntryDB.author_id)
+    elif tweet_archive is not None:  # Entries of archived tweets find no row in the tweets table
+        query = db.query(TimelineEntryDB.position, TimelineEntryDB.tweet_id, TweetDB).outerjoin(
+            TweetDB, TweetDB.tweet_id == TimelineEntryDB.tweet_id
+        )
+    else:
+        query = db.query(TimelineEntryDB.position, TimelineEntryDB.tweet_id, TweetDB).join(
+            TweetDB, TweetDB.tweet_id == TimelineEntryDB.tweet_id
+        )
+    query = query.filter(owned)
+    if before is not None:
+        position, tweet_id = before
+        if tweet_id is None:  # Cursors of the position alone
+            query = query.filter(TimelineEntryDB.position < position)
+        else:
+            query = query.filter(or_(
+                TimelineEntryDB.position < position,
+                and_(TimelineEntryDB.position == position, TimelineEntryDB.tweet_id < tweet_id)
+            ))
+    entries = query.order_by(TimelineEntryDB.position.desc(), TimelineEntryDB.tweet_id.desc()).limit(limit).all()
+    next_key = (entries[-1][0], entries[-1][1]) if len(entries) == limit else None
+
+    if tweet_shards is not None:
+        # The entries know the authors, so only the shards holding the page are read
+        db_tweets = tweet_shards.get_authored_tweets({tweet_id: author_id for _, tweet_id, author_id in entries})
+    else:
+        db_tweets = {tweet_id: db_tweet for _, tweet_id, db_tweet in entries if db_tweet is not None}
+
+    if tweet_archive is not None:  # The tweets missing from the hot table fall through to the archive
+        db_tweets.update(archived_tweets([tweet_id for _, tweet_id, _ in entries if tweet_id not in db_tweets]))
+    return [(position, db_tweets[tweet_id]) for position, tweet_id, _ in entries if tweet_id in db_tweets], next_key
+
+
+## Delete
+def trim_timeline(db: Session, user_id: str, max_length: int = None) -> int:
+    """Keep the newest `max_length` entries of a timeline, returns the number of deleted entries."""
+    cutoff = db.query(TimelineEntryDB.position).filter(TimelineEntryDB.user_id == user_id).order_by(
+        TimelineEntryDB.position.desc()
+    ).offset(TIMELINE_MAX_LENGTH if max_length is None else max_length).limit(1).scalar()
+
+    if cutoff is None:
+        return 0
+
+    deleted = db.query(TimelineEntryDB).filter(
+        TimelineEntryDB.user_id == user_id, TimelineEntryDB.position <= cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    return deleted
+
+
+# Change Log Functions
+## Create
+def record_changes(db: Session, entity: str, operation: str, entity_ids: List[str]):
+    """Append to the change log in the caller's transaction, so a change is visible exactly when the write is."""
+    if entity_ids:
+        db.execute(insert(ChangeDB), [
+            {"entity": entity, "entity_id": str(entity_id), "operation": operation} for entity_id in entity_ids
+        ])
+
+
+## Read
+def get_last_change_token(db: Session) -> int:
+    return db.query(func.max(ChangeDB.change_id)).scalar() or 0
+
+
+def get_changes(db: Session, since: int = 0, limit: int = 100):
+    """One page of the change log after the `since` token, compacted to the last change of each entity.
+
+    The page is a range of `limit` log rows on the primary key, so a sync costs O(changes) whatever the size
+    of the tables. Entities changed again after the page are left for a later page, and the others come with
+    their current row (None for deletes). Returns (changes, next_token, has_more), changes being
+    (token, entity, entity_id, operation, row) tuples.
+    """
+    rows = db.query(ChangeDB.change_id, ChangeDB.entity, ChangeDB.entity_id, ChangeDB.operation).filter(
+        ChangeDB.change_id > since
+    ).order_by(ChangeDB.change_id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_token = rows[-1].change_id if rows else since
+
+    # Compaction: the last change of each entity wins
+    latest = {(row.entity, row.entity_id): row for row in rows}
+
+    current = {}
+    for entity, model, key in (("tweet", TweetDB, TweetDB.tweet_id), ("user", UserDB, UserDB.user_id)):
+        entity_ids = [entity_id for kind, entity_id in latest if kind == entity]
+        if not entity_ids:
+            continue
+        if has_more:
+            superseded = db.query(ChangeDB.entity_id).filter(
+                ChangeDB.entity == entity, ChangeDB.entity_id.in_(entity_ids), ChangeDB.change_id > next_token
+            ).distinct()
+            for entity_id, in superseded:
+                del latest[(entity, entity_id)]
+        wanted = [entity_id for kind, entity_id in latest if kind == entity]
+        if wanted and entity == "tweet" and tweet_shards is not None:
+            current.update((("tweet", tweet_id), row) for tweet_id, row in tweet_shards.get_tweets_by_id(wanted).items())
+        elif wanted:
+            current.update(((entity, getattr(row, key.key)), row) for row in db.query(model).filter(key.in_(wanted)))
+        if wanted and entity == "tweet":
+            missing = [tweet_id for tweet_id in wanted if ("tweet", tweet_id) not in current]
+            current.update((("tweet", tweet_id), row) for tweet_id, row in archived_tweets(missing).items())
+
+    changes = []
+    for (entity, entity_id), row in sorted(latest.items(), key=lambda item: item[1].change_id):
+        db_row = current.get((entity, entity_id))
+        # A missing row was deleted by a write that committed after this page was read
+        operation = row.operation if db_row is not None else "delete"
+        changes.append((row.change_id, entity, entity_id, operation, db_row))
+
+    return changes, next_token, has_more
@@ -0,0 +1,341 @@
+
+# Python
+import io
+import csv
+import sys
+import json
+import time
+import gzip
+import zlib
+import logging
+import argparse
+from pathlib import Path
+from datetime import date, datetime
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, List
+
+# SQLAlchemy
+from sqlalchemy import select, Table, Boolean, Date, DateTime, Integer
+from sqlalchemy.engine import Connection
+
+# SQLAlchemy Models
+from .sqlalchemy_models import UserDB, TweetDB, FollowDB, TimelineEntryDB
+
+# Tweet Shards and Archive (crud.tweet_shards and crud.tweet_archive, read when called so the tests can swap them)
+from . import crud
+from .sharding import shard_tweets
+
+# Name search
+from .search import name_keys
+
+logger = logging.getLogger(__name__)
+
+# Restore order follows the foreign keys
+tables: Dict[str, Table] = {
+    "users": UserDB.__table__,
+    "tweets": TweetDB.__table__,
+    "follows": FollowDB.__table__,
+    "timeline_entries": TimelineEntryDB.__table__,  # The fan-out of the tweets, not replayed by a restore
+}
+
+formats = ("ndjson", "csv")
+
+BATCH_SIZE = 5000
+CSV_NULL = "\\N"
+
+
+# Serialization
+def encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def decode_boolean(value) -> bool:
+    # NDJSON keeps JSON booleans, CSV has their text
+    return value if isinstance(value, bool) else value in ("True", "true", "1")
+
+
+def column_decoders(table: Table):
+    decoders = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            decoders[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            decoders[column.name] = date.fromisoformat
+        elif isinstance(column.type, Integer):
+            decoders[column.name] = int
+        elif isinstance(column.type, Boolean):
+            decoders[column.name] = decode_boolean
+    return decoders
+
+
+def decode_row(row: dict, decoders: dict, table: Table) -> dict:
+    decoded = {}
+    for name, value in row.items():
+        if name not in table.columns:
+            continue
+        if value is not None and name in decoders:
+            value = decoders[name](value)
+        decoded[name] = value
+    if table is UserDB.__table__ and decoded.get("name_key") is None:  # Dumps made before the name search
+        decoded.update(name_keys(decoded.get("first_name"), decoded.get("last_name")))
+    return decoded
+
+
+# Export
+def iter_rows(connection: Connection, table: Table, batch_size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    """Batches of rows read through a server-side cursor, so memory stays bounded."""
+    statement = select(table).order_by(*table.primary_key.columns)
+    result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement)
+
+    for partition in result.mappings().partitions(batch_size):
+        yield [dict(row) for row in partition]
+
+
+def iter_table_rows(connection: Connection, table: Table, batch_size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    """The rows of `table`. The tweets are those of every shard with the tweet shards on (the main database
+    has none), then the archived ones with the archive on, so a tweets dump holds every tweet."""
+    if table is not TweetDB.__table__:
+        yield from iter_rows(connection, table, batch_size)
+        return
+
+    if crud.tweet_shards is None:
+        yield from iter_rows(connection, table, batch_size)
+    else:
+        for engine in crud.tweet_shards.engines.values():
+            with engine.connect() as shard_connection:
+                yield from iter_rows(shard_connection, shard_tweets, batch_size)
+
+    if crud.tweet_archive is not None:
+        yield from crud.tweet_archive.batches(batch_size)
+
+
+def iter_lines(batches: Iterable[List[dict]], table: Table, fmt: str) -> Iterator[str]:
+    if fmt == "ndjson":
+        for batch in batches:
+            yield "".join(json.dumps({key: encode_value(value) for key, value in row.items()}) + "\n" for row in batch)
+        return
+
+    names = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+
+    for batch in batches:
+        for row in batch:
+            writer.writerow([CSV_NULL if row[name] is None else encode_value(row[name]) for name in names])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def export_table(
+        connection: Connection,
+        table_name: str,
+        fmt: str = "ndjson",
+        batch_size: int = BATCH_SIZE,
+        compress_level: int = 6
+) -> Iterator[bytes]:
+    """Gzip compressed chunks of the whole table, one chunk per batch."""
+    table = tables[table_name]
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    counter = {"rows": 0}
+
+    def counted(batches):
+        for batch in batches:
+            counter["rows"] += len(batch)
+            yield batch
+
+    start = time.perf_counter()
+    for text in iter_lines(counted(iter_table_rows(connection, table, batch_size)), table, fmt):
+        chunk = compressor.compress(text.encode("utf-8"))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+    report = throughput(table_name, counter["rows"], time.perf_counter() - start)
+    logger.info("Exported %(rows)s %(table)s rows in %(seconds)ss (%(rows_per_second)s rows/s)", report)
+
+
+# Restore
+def read_batches(stream, table: Table, fmt: str, batch_size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    """Decompress and parse the dump lazily, `stream` is a binary file-like object."""
+    text = io.TextIOWrapper(gzip.GzipFile(fileobj=stream, mode="rb"), encoding="utf-8", newline="")
+    decoders = column_decoders(table)
+
+    if fmt == "ndjson":
+        rows = (json.loads(line) for line in text if line.strip())
+    else:
+        rows = (
+            {name: None if value == CSV_NULL else value for name, value in row.items()}
+            for row in csv.DictReader(text)
+        )
+
+    batch = []
+    for row in rows:
+        batch.append(decode_row(row, decoders, table))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def deferred_indexes(connection: Connection, table: Table):
+    """Drop the non-unique secondary indexes and the foreign key checks while loading an empty table, rebuild
+    them at the end. Offline loads only (CLI restores, the seeder): the unique indexes stay, so the emails
+    remain unique, but the other readers of the table would scan it meanwhile.
+    """
+    if connection.execute(select(table).limit(1)).first() is not None:
+        raise ValueError(f"The {table.name} table is not empty, keep its indexes (--keep-indexes)")
+
+    dialect = connection.dialect.name
+    indexes = [index for index in table.indexes if not index.unique]
+
+    if dialect == "mysql":
+        connection.exec_driver_sql("SET foreign_key_checks = 0")
+
+    for index in indexes:
+        index.drop(connection)
+    loaded = False
+    try:
+        yield
+        loaded = True
+    finally:
+        failed = []
+        for index in indexes:
+            try:
+                index.create(connection)
+            except Exception:
+                # Logged on its own, a failed load keeps raising its own error
+                logger.exception("Could not rebuild the index %s of %s", index.name, table.name)
+                failed.append(index.name)
+
+        if dialect == "mysql":
+            connection.exec_driver_sql("SET foreign_key_checks = 1")
+
+        if failed and loaded:
+            raise RuntimeError(f"Could not rebuild the indexes {', '.join(failed)} of {table.name}")
+
+
+def insert_batch(connection: Connection, table: Table, batch: List[dict]) -> int:
+    """Insert and commit one batch, returns the rows inserted. With the tweet shards on, the tweets go to the
+    shards of their users, one transaction per shard. With the archive on, the tweets it already holds are
+    skipped (their dump has them too), so restoring next to the same archive does not count them twice."""
+    if table is TweetDB.__table__ and crud.tweet_archive is not None:
+        archived = crud.tweet_archive.get_many([row["tweet_id"] for row in batch])
+        batch = [row for row in batch if row["tweet_id"] not in archived]
+        if not batch:
+            return 0
+
+    if table is TweetDB.__table__ and crud.tweet_shards is not None:
+        by_shard: Dict[str, List[dict]] = {}
+        for row in batch:
+            by_shard.setdefault(crud.tweet_shards.shard_for(row["user_id"]), []).append(row)
+        for name, rows in by_shard.items():
+            with crud.tweet_shards.engines[name].begin() as shard_connection:
+                shard_connection.execute(shard_tweets.insert(), rows)
+        return len(batch)
+
+    # Inside a caller's transaction every batch gets a SAVEPOINT instead
+    with (connection.begin_nested() if connection.in_transaction() else connection.begin()):
+        connection.execute(table.insert(), batch)
+    return len(batch)
+
+
+def restore_table(
+        connection: Connection,
+        table_name: str,
+        stream,
+        fmt: str = "ndjson",
+        batch_size: int = BATCH_SIZE,
+        defer_indexes: bool = False
+) -> dict:
+    """Bulk load a dump made by export_table, committing one transaction per batch.
+
+    `defer_indexes` builds the secondary indexes once at the end, for offline loads into an empty table. The
+    tweets restored into the shards keep their indexes.
+    """
+    table = tables[table_name]
+    rows = 0
+    sharded = table is TweetDB.__table__ and crud.tweet_shards is not None
+
+    start = time.perf_counter()
+    with (deferred_indexes(connection, table) if defer_indexes and not sharded else nullcontext()):
+        for batch in read_batches(stream, table, fmt, batch_size):
+            rows += insert_batch(connection, table, batch)
+
+    report = throughput(table_name, rows, time.perf_counter() - start)
+    logger.info("Restored %(rows)s %(table)s rows in %(seconds)ss (%(rows_per_second)s rows/s)", report)
+    return report
+
+
+def throughput(table_name: str, rows: int, seconds: float) -> dict:
+    return {
+        "table": table_name,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else rows,
+    }
+
+
+# CLI
+def dump_path(directory: Path, table_name: str, fmt: str) -> Path:
+    return directory / f"{table_name}.{fmt}.gz"
+
+
+def parse_dump_path(path: Path):
+    """`users.ndjson.gz` -> ("users", "ndjson")"""
+    table_name, fmt, _ = path.name.split(".", 2)
+    if table_name not in tables or fmt not in formats:
+        raise ValueError(f"Unknown dump file {path.name}, expected <table>.<{'|'.join(formats)}>.gz")
+    return table_name, fmt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or restore the users, tweets, follows and timelines.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Stream tables into compressed dump files")
+    export_parser.add_argument("directory", type=Path)
+    export_parser.add_argument("--format", choices=formats, default="ndjson")
+    export_parser.add_argument("--tables", nargs="+", choices=list(tables), default=list(tables))
+    export_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    restore_parser = subparsers.add_parser("restore", help="Bulk load dump files (users first)")
+    restore_parser.add_argument("files", type=Path, nargs="+")
+    restore_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    restore_parser.add_argument("--keep-indexes", action="store_true", help="Do not defer index maintenance")
+
+    args = parser.parse_args(argv)
+
+    from .database import mysql_engine as engine
+
+    if args.command == "export":
+        args.directory.mkdir(parents=True, exist_ok=True)
+        for table_name in args.tables:
+            path = dump_path(args.directory, table_name, args.format)
+            start = time.perf_counter()
+            with engine.connect() as connection, open(path, "wb") as f:
+                for chunk in export_table(connection, table_name, args.format, args.batch_size):
+                    f.write(chunk)
+            seconds = time.perf_counter() - start
+            print(f"{path}: {path.stat().st_size / 1e6:.1f} MB in {seconds:.2f}s", file=sys.stderr)
+
+    else:
+        files = sorted(args.files, key=lambda path: list(tables).index(parse_dump_path(path)[0]))
+        for path in files:
+            table_name, fmt = parse_dump_path(path)
+            with engine.connect() as connection, open(path, "rb") as f:
+                report = restore_table(
+                    connection, table_name, f, fmt, args.batch_size, defer_indexes=not args.keep_indexes
+                )
+            print(json.dumps(report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
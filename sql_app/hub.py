@@ -0,0 +1,124 @@
+
+# Python
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+HUB_QUEUE_SIZE = int(os.getenv("HUB_QUEUE_SIZE", 100))  # Messages buffered per subscriber
+HUB_MAX_SUBSCRIBERS = int(os.getenv("HUB_MAX_SUBSCRIBERS", 10_000))  # Per worker
+
+# Last message of a subscriber that fell behind
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def sse_message(event: str, data: dict) -> bytes:
+    """Server-Sent Events frame, encoded once and shared by every subscriber."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n".encode()
+
+
+class HubFull(Exception):
+    pass
+
+
+class Subscription:
+    """Bounded queue of one subscriber, only touched from its event loop."""
+
+    def __init__(self, hub: "BroadcastHub", loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.hub = hub
+        self.loop = loop
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def deliver(self, message: bytes):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop what it did not read and tell it to catch up with GET /changes
+            self.overflowed = True
+            self.hub.overflows += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self) -> bytes:
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class BroadcastHub:
+    """In-process fan-out of the committed writes to the open streams (the writes of the other workers of
+    the host come over the cache bus, sql_app/bus.py).
+
+    Writers publish from any thread. Subscribers are grouped by event loop, so one message costs one
+    thread-safe wake-up per loop (not per subscriber), and waiting subscribers hold no thread. Every
+    subscriber has a bounded queue: one that falls `max_queue` messages behind gets a resync message
+    instead of growing the memory of the worker.
+    """
+
+    def __init__(self, max_queue: int = HUB_QUEUE_SIZE, max_subscribers: int = HUB_MAX_SUBSCRIBERS):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._loops: Dict[asyncio.AbstractEventLoop, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.overflows = 0
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._loops.values())
+
+    def subscribe(self) -> Subscription:
+        """Called from the event loop that will read the subscription."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if sum(len(subscriptions) for subscriptions in self._loops.values()) >= self.max_subscribers:
+                raise HubFull()
+            subscription = Subscription(self, loop, self.max_queue)
+            self._loops.setdefault(loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._loops.get(subscription.loop)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._loops[subscription.loop]
+
+    def publish(self, messages: List[bytes]):
+        """Send messages to every subscriber, call it after the commit that made them true."""
+        if not messages:
+            return
+        with self._lock:
+            loops = [(loop, list(subscriptions)) for loop, subscriptions in self._loops.items()]
+            self.published += len(messages)
+
+        for loop, subscriptions in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, subscriptions, messages)
+            except RuntimeError:  # The loop is closed, its streams are gone
+                logger.warning("Dropping the subscribers of a closed event loop")
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+    @staticmethod
+    def _deliver(subscriptions: List[Subscription], messages: List[bytes]):
+        for subscription in subscriptions:
+            for message in messages:
+                subscription.deliver(message)
+
+    def stats(self) -> dict:
+        return {"subscribers": self.subscribers, "published": self.published, "overflows": self.overflows}
+
+
+tweet_hub = BroadcastHub()
@@ -0,0 +1,97 @@
+# Python
+import json
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+
+# SQLAlchemy
+from sqlalchemy import and_, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# SQLAlchemy Models
+from .sqlalchemy_models import IdempotencyKeyDB
+
+# Idempotency Keys
+from idempotency import SharedKeys
+
+CLAIM_ATTEMPTS = 3  # Inserts tried while the row in the way expires or is released
+LEASE = 300.0  # Seconds a key stays in flight without a response, 5 times the default worker timeout
+
+
+def row_filter(key: tuple):
+    path, principal, idempotency_key = key
+    return and_(
+        IdempotencyKeyDB.path == path,
+        IdempotencyKeyDB.principal == principal,
+        IdempotencyKeyDB.idempotency_key == idempotency_key
+    )
+
+
+def encode_headers(headers: list) -> str:
+    return json.dumps([[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers])
+
+
+def decode_headers(text: str) -> list:
+    return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(text)]
+
+
+# Database Keys
+class DatabaseIdempotencyKeys(SharedKeys):
+    """The keys in the idempotency_keys table: its primary key (path, principal, key) lets one worker insert
+    a key, the others read its response from the row. Each call is one short transaction of its own session.
+
+    A claim is leased for `lease` seconds and a completed key kept for the ttl: the key of a worker killed
+    mid-request is taken over once its lease expired, not answered as in progress until the ttl.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], lease: float = LEASE):
+        self.session_factory = session_factory
+        self.lease = lease
+
+    def claim(self, key: tuple, fingerprint: str, ttl: float) -> Optional[Tuple[str, Optional[tuple]]]:
+        path, principal, idempotency_key = key
+        with self.session_factory() as db:
+            for _ in range(CLAIM_ATTEMPTS):
+                now = datetime.utcnow()
+                try:
+                    db.execute(insert(IdempotencyKeyDB).values(
+                        path=path, principal=principal, idempotency_key=idempotency_key,
+                        fingerprint=fingerprint, expires_at=now + timedelta(seconds=min(self.lease, ttl))
+                    ))
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+
+                row = db.execute(select(
+                    IdempotencyKeyDB.fingerprint, IdempotencyKeyDB.status_code, IdempotencyKeyDB.headers,
+                    IdempotencyKeyDB.body, IdempotencyKeyDB.expires_at
+                ).where(row_filter(key))).first()
+                if row is None:  # Released meanwhile
+                    continue
+                if row.expires_at <= now:  # Expired, or its worker died before the response
+                    db.execute(delete(IdempotencyKeyDB).where(
+                        row_filter(key), IdempotencyKeyDB.expires_at == row.expires_at
+                    ))
+                    db.commit()
+                    continue
+                if row.status_code is None:
+                    return row.fingerprint, None
+                return row.fingerprint, (row.status_code, decode_headers(row.headers), row.body)
+
+        # Still in the way, answered as in progress
+        return fingerprint, None
+
+    def complete(self, key: tuple, response: Tuple[int, list, bytes], ttl: float):
+        status_code, headers, body = response
+        with self.session_factory() as db:
+            db.execute(update(IdempotencyKeyDB).where(row_filter(key)).values(
+                status_code=status_code, headers=encode_headers(headers), body=body,
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+            db.commit()
+
+    def forget(self, key: tuple):
+        with self.session_factory() as db:
+            db.execute(delete(IdempotencyKeyDB).where(row_filter(key), IdempotencyKeyDB.status_code.is_(None)))
+            db.commit()
@@ -0,0 +1,385 @@
+
+# Python
+import json
+import argparse
+
+# Python
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Union
+
+# SQLAlchemy
+from sqlalchemy import and_, bindparam, delete, func, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+# SQLAlchemy Models
+from .database import Base
+from .sqlalchemy_models import ChangeDB, FollowDB, IdempotencyKeyDB, TimelineEntryDB, TweetDB, UserDB
+
+# CRUD
+from . import crud
+
+# Name search
+from .search import name_keys
+
+# Archive
+from . import archive as archive_module
+
+
+# Schema
+# Indexes replaced by later versions of the models, dropped when found
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "timeline_entries": ["ix_timeline_entries_user_position"],  # Now (user_id, position, tweet_id)
+}
+
+# Columns whose values are computed from other rows, filled by these jobs once added
+BACKFILLS = {
+    "users.tweets_count": "reconcile-counters",
+    "users.name_key": "index-user-names",
+}
+
+
+def migrate(connection: Connection) -> dict:
+    """Bring an existing database to the schema of the models: the missing tables, then the missing columns
+    and indexes of the existing ones. Only adds what is missing, so it can run on every deploy.
+
+    Base.metadata.create_all creates the missing tables but never alters an existing one, and the SELECTs of
+    the models fail on a table without their columns. New columns get their server defaults, the ones listed
+    in BACKFILLS need their job to run afterwards (the CLI runs them). On MySQL the columns declared with a
+    collation (the name keys) are also changed to it when created with the default one.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    existing = set(inspector.get_table_names())
+    report = {"tables": [], "columns": [], "collations": [], "indexes": [], "dropped_indexes": []}
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(connection)  # With its indexes
+            report["tables"].append(table.name)
+            continue
+
+        columns = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            definition = CreateColumn(column).compile(dialect=connection.dialect)
+            if column.name not in columns:
+                connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}")
+                report["columns"].append(f"{table.name}.{column.name}")
+                continue
+
+            collation = getattr(column.type.dialect_impl(connection.dialect), "collation", None)
+            if collation and getattr(columns[column.name], "collation", None) != collation:
+                connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} MODIFY COLUMN {definition}")
+                report["collations"].append(f"{table.name}.{column.name}")
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for name in OBSOLETE_INDEXES.get(table.name, []):
+            if name in indexes:
+                on_table = f" ON {preparer.format_table(table)}" if connection.dialect.name == "mysql" else ""
+                connection.exec_driver_sql(f"DROP INDEX {preparer.quote(name)}{on_table}")
+                report["dropped_indexes"].append(name)
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                report["indexes"].append(index.name)
+
+    return report
+
+
+# Timelines
+def trim_timelines(db: Session, max_length: int = None) -> dict:
+    """Trim every home timeline longer than `max_length` entries (TIMELINE_MAX_LENGTH by default)."""
+    max_length = crud.TIMELINE_MAX_LENGTH if max_length is None else max_length
+
+    long_timelines = db.query(TimelineEntryDB.user_id).group_by(TimelineEntryDB.user_id).having(
+        func.count() > max_length
+    ).all()
+    deleted = sum(crud.trim_timeline(db, user_id, max_length) for user_id, in long_timelines)
+
+    return {"timelines": len(long_timelines), "deleted_entries": deleted}
+
+
+# Counters
+def reconcile_counters(db: Union[Session, Connection], batch_size: int = 1000) -> dict:
+    """Recount the denormalized user counters and fix the rows that drifted (committed by the caller).
+
+    The writes keep the counters exact, this catches what bypasses them: restores, manual SQL, bugs. Users
+    are walked by primary key in chunks of `batch_size`, each chunk costs one GROUP BY per counter over the
+    user_id indexes and one executemany for the mismatched rows.
+
+    A row is fixed only if its counters still hold the values read: a write that changed them meanwhile is
+    not overwritten, the row is reported as skipped and checked again by the next run.
+    """
+    users = UserDB.__table__
+    fix = update(users).where(
+        users.c.user_id == bindparam("b_user_id"),
+        users.c.tweets_count == bindparam("b_old_tweets_count"),
+        users.c.followers_count == bindparam("b_old_followers_count"),
+        users.c.following_count == bindparam("b_old_following_count"),
+        users.c.last_tweet_at.is_not_distinct_from(bindparam("b_old_last_tweet_at"))
+    ).values(
+        tweets_count=bindparam("b_tweets_count"),
+        followers_count=bindparam("b_followers_count"),
+        following_count=bindparam("b_following_count"),
+        last_tweet_at=bindparam("b_last_tweet_at")
+    )
+
+    checked, fixed, skipped, last_id = 0, 0, 0, None
+    while True:
+        chunk = select(
+            users.c.user_id, users.c.tweets_count, users.c.followers_count,
+            users.c.following_count, users.c.last_tweet_at
+        ).order_by(users.c.user_id).limit(batch_size)
+        if last_id is not None:
+            chunk = chunk.where(users.c.user_id > last_id)
+        rows = db.execute(chunk).all()
+        if not rows:
+            break
+        last_id = rows[-1].user_id
+        user_ids = [row.user_id for row in rows]
+
+        tweet_stats = select(TweetDB.user_id, func.count(), func.max(TweetDB.created_at)).where(
+            TweetDB.user_id.in_(user_ids)
+        ).group_by(TweetDB.user_id)
+        if crud.tweet_shards is not None:
+            shards = crud.tweet_shards.scatter(lambda shard_db: shard_db.execute(tweet_stats).all())
+        else:
+            shards = [db.execute(tweet_stats).all()]
+        tweets = {user_id: (count, newest) for rows in shards for user_id, count, newest in rows}
+        if crud.tweet_archive is not None:  # Archived tweets still count, read from the segment footers
+            for user_id, (count, newest) in crud.tweet_archive.user_stats(user_ids).items():
+                hot_count, hot_newest = tweets.get(user_id, (0, None))
+                tweets[user_id] = (hot_count + count, max(filter(None, (hot_newest, newest))))
+        followers = dict(db.execute(
+            select(FollowDB.followed_id, func.count())
+            .where(FollowDB.followed_id.in_(user_ids)).group_by(FollowDB.followed_id)
+        ).all())
+        following = dict(db.execute(
+            select(FollowDB.follower_id, func.count())
+            .where(FollowDB.follower_id.in_(user_ids)).group_by(FollowDB.follower_id)
+        ).all())
+
+        drifted = []
+        for row in rows:
+            tweets_count, last_tweet_at = tweets.get(row.user_id, (0, None))
+            actual = (tweets_count, followers.get(row.user_id, 0), following.get(row.user_id, 0), last_tweet_at)
+            if actual != (row.tweets_count, row.followers_count, row.following_count, row.last_tweet_at):
+                drifted.append({
+                    "b_user_id": row.user_id,
+                    "b_tweets_count": actual[0],
+                    "b_followers_count": actual[1],
+                    "b_following_count": actual[2],
+                    "b_last_tweet_at": actual[3],
+                    "b_old_tweets_count": row.tweets_count,
+                    "b_old_followers_count": row.followers_count,
+                    "b_old_following_count": row.following_count,
+                    "b_old_last_tweet_at": row.last_tweet_at
+                })
+        if drifted:
+            result = db.execute(fix, drifted)
+            updated = result.rowcount if result.supports_sane_multi_rowcount() else len(drifted)
+            fixed += updated
+            skipped += len(drifted) - updated
+
+        checked += len(rows)
+
+    return {"users": checked, "fixed": fixed, "skipped": skipped}
+
+
+# Name Search
+def index_user_names(db: Union[Session, Connection], batch_size: int = 1000) -> dict:
+    """Fill the normalized name keys of GET /users/search where they are missing or stale (committed by the
+    caller): databases created before the search, names changed by manual SQL.
+
+    Users are walked by primary key in chunks of `batch_size`, each chunk costs one select and one executemany
+    for the rows that differ.
+    """
+    users = UserDB.__table__
+    fix = update(users).where(users.c.user_id == bindparam("b_user_id")).values(
+        name_key=bindparam("b_name_key"),
+        reverse_name_key=bindparam("b_reverse_name_key")
+    )
+
+    checked, fixed, last_id = 0, 0, None
+    while True:
+        chunk = select(
+            users.c.user_id, users.c.first_name, users.c.last_name, users.c.name_key, users.c.reverse_name_key
+        ).order_by(users.c.user_id).limit(batch_size)
+        if last_id is not None:
+            chunk = chunk.where(users.c.user_id > last_id)
+        rows = db.execute(chunk).all()
+        if not rows:
+            break
+        last_id = rows[-1].user_id
+
+        stale = []
+        for row in rows:
+            keys = name_keys(row.first_name, row.last_name)
+            if (keys["name_key"], keys["reverse_name_key"]) != (row.name_key, row.reverse_name_key):
+                stale.append({
+                    "b_user_id": row.user_id,
+                    "b_name_key": keys["name_key"],
+                    "b_reverse_name_key": keys["reverse_name_key"]
+                })
+        if stale:
+            db.execute(fix, stale)
+
+        checked += len(rows)
+        fixed += len(stale)
+
+    return {"users": checked, "fixed": fixed}
+
+
+# Change Log
+def compact_changes(db: Session, batch_size: int = 1000) -> dict:
+    """Delete the log entries superseded by a later change of the same entity (committed by the caller).
+
+    GET /changes only ever returns the last change of an entity, so any sync token gives the same answer
+    afterwards, the log just stops growing with the number of edits.
+    """
+    latest = select(
+        ChangeDB.entity, ChangeDB.entity_id, func.max(ChangeDB.change_id).label("last_id")
+    ).group_by(ChangeDB.entity, ChangeDB.entity_id).having(func.count() > 1).subquery()
+    superseded = [change_id for change_id, in db.execute(
+        select(ChangeDB.change_id).join(latest, and_(
+            ChangeDB.entity == latest.c.entity,
+            ChangeDB.entity_id == latest.c.entity_id,
+            ChangeDB.change_id < latest.c.last_id
+        ))
+    )]
+
+    for start in range(0, len(superseded), batch_size):
+        db.execute(delete(ChangeDB).where(ChangeDB.change_id.in_(superseded[start:start + batch_size])))
+
+    return {"deleted_changes": len(superseded)}
+
+
+# Idempotency Keys
+def purge_idempotency_keys(db: Session) -> dict:
+    """Delete the expired Idempotency-Keys (committed by the caller). A retry of an expired key replaces its
+    row anyway, this only keeps the keys of the clients that never retried from piling up."""
+    result = db.execute(delete(IdempotencyKeyDB).where(IdempotencyKeyDB.expires_at <= datetime.utcnow()))
+    return {"deleted_keys": result.rowcount}
+
+
+# Archive
+@contextmanager
+def hot_session(db: Session, name: str = None) -> Iterator[Session]:
+    """A session on the tweets table: the main database, or the shard `name`."""
+    if name is None:
+        yield db
+    else:
+        with crud.tweet_shards.session(name) as shard_db:
+            yield shard_db
+
+
+def archive_tweets(db: Session, older_than_days: int = None, segment_size: int = None) -> dict:
+    """Move the tweets created more than `older_than_days` days ago (ARCHIVE_AFTER_DAYS by default) from the
+    tweets table, or every shard, to new archive segments.
+
+    Each segment is written and synced under a pending name, its tweets are deleted in one transaction and
+    only then it is renamed for the readers. A run interrupted between the two is finished by the next one:
+    the pending segment is published if its tweets left the table, dropped otherwise.
+    """
+    archive = crud.tweet_archive
+    if archive is None:
+        raise ValueError("The tweet archive is disabled, set TWEET_ARCHIVE_DIR")
+    older_than_days = archive_module.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    segment_size = archive_module.ARCHIVE_SEGMENT_SIZE if segment_size is None else segment_size
+    cutoff = date.today() - timedelta(days=older_than_days)
+    tweets = TweetDB.__table__
+
+    def still_hot(row: dict) -> bool:
+        name = crud.tweet_shards.shard_for(row["user_id"]) if crud.tweet_shards is not None else None
+        with hot_session(db, name) as hot_db:
+            found = hot_db.execute(select(tweets.c.tweet_id).where(tweets.c.tweet_id == row["tweet_id"])).first()
+            return found is not None
+
+    archive.recover(still_hot)
+
+    report = {"archived": 0, "segments": 0}
+    for name in (list(crud.tweet_shards.engines) if crud.tweet_shards is not None else [None]):
+        with hot_session(db, name) as hot_db:
+            while True:
+                rows = [dict(row) for row in hot_db.execute(
+                    select(tweets).where(tweets.c.created_at < cutoff).order_by(tweets.c.tweet_id).limit(segment_size)
+                ).mappings()]
+                if not rows:
+                    break
+                pending = archive.write_pending(rows)
+                tweet_ids = [row["tweet_id"] for row in rows]
+                for start in range(0, len(tweet_ids), 1000):  # One transaction, bounded IN lists
+                    hot_db.execute(delete(tweets).where(tweets.c.tweet_id.in_(tweet_ids[start:start + 1000])))
+                hot_db.commit()
+                archive.publish(pending)
+
+                report["archived"] += len(rows)
+                report["segments"] += 1
+
+    return report
+
+
+# CLI
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Periodic maintenance jobs, run them from cron or a scheduler.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    trim_parser = subparsers.add_parser("trim-timelines", help="Bound the length of the home timelines")
+    trim_parser.add_argument("--max-length", type=int, default=None)
+
+    counters_parser = subparsers.add_parser("reconcile-counters", help="Recount the denormalized user counters")
+    counters_parser.add_argument("--batch-size", type=int, default=1000)
+
+    subparsers.add_parser("migrate", help="Add the missing tables, columns and indexes, once per deploy")
+
+    names_parser = subparsers.add_parser("index-user-names", help="Fill the normalized name keys of the search")
+    names_parser.add_argument("--batch-size", type=int, default=1000)
+
+    subparsers.add_parser("compact-changes", help="Drop the superseded entries of the change log")
+
+    subparsers.add_parser("purge-idempotency-keys", help="Drop the expired Idempotency-Keys")
+
+    archive_parser = subparsers.add_parser("archive-tweets", help="Move the cold tweets to the archive segments")
+    archive_parser.add_argument("--older-than-days", type=int, default=None)
+    archive_parser.add_argument("--segment-size", type=int, default=None)
+
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "migrate":
+            report = migrate(db.connection())
+            db.commit()
+            for column, job in BACKFILLS.items():
+                if column in report["columns"]:
+                    report[job] = reconcile_counters(db) if job == "reconcile-counters" else index_user_names(db)
+                    db.commit()
+        elif args.command == "trim-timelines":
+            report = trim_timelines(db, args.max_length)
+        elif args.command == "reconcile-counters":
+            report = reconcile_counters(db, args.batch_size)
+            db.commit()
+            crud.clear_caches()  # Of the workers, with CACHE_BUS_DIR
+        elif args.command == "index-user-names":
+            report = index_user_names(db, args.batch_size)
+            db.commit()
+        elif args.command == "compact-changes":
+            report = compact_changes(db)
+            db.commit()
+        elif args.command == "purge-idempotency-keys":
+            report = purge_idempotency_keys(db)
+            db.commit()
+        elif args.command == "archive-tweets":
+            report = archive_tweets(db, args.older_than_days, args.segment_size)
+    finally:
+        db.close()
+
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
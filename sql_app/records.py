@@ -0,0 +1,58 @@
+
+# Python
+from datetime import date
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Type
+
+# SQLAlchemy
+from sqlalchemy import Table
+from sqlalchemy.engine import Row
+
+
+# Read-only Records
+# Rows of the list endpoints as plain tuples: no identity map, instrumented attributes nor relationship state,
+# and the response models read them like ORM objects (orm_mode reads attributes)
+class AuthorRecord(NamedTuple):
+    user_id: str
+    first_name: str
+    last_name: str
+
+
+class TweetRecord(NamedTuple):
+    tweet_id: str
+    content: Optional[str] = None
+    created_at: Optional[date] = None
+    updated_at: Optional[date] = None
+    user_id: Optional[str] = None
+    user: Optional[AuthorRecord] = None  # Only with expand=author
+
+
+class UserRecord(NamedTuple):
+    """The public columns of a user (never the password hash)."""
+    user_id: str
+    email: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    country: Optional[str] = None
+    birth_date: Optional[date] = None
+    creation_account_date: Optional[date] = None
+    tweets_count: Optional[int] = None
+    followers_count: Optional[int] = None
+    following_count: Optional[int] = None
+    last_tweet_at: Optional[date] = None
+
+
+TWEET_COLUMNS = TweetRecord._fields[:-1]
+USER_COLUMNS = UserRecord._fields
+
+
+def record_columns(table: Table, names: Sequence[str], fields: Optional[Iterable[str]] = None) -> list:
+    """The selected columns: every column of the record, or the requested fields and the primary key first."""
+    if fields:
+        names = list(dict.fromkeys([names[0], *fields]))
+    return [table.c[name] for name in names]
+
+
+def make_records(record: Type[NamedTuple], rows: Iterable[Row], fields: Optional[Iterable[str]] = None) -> List:
+    if not fields:  # Columns in the order of the record
+        return [record(*row) for row in rows]
+    return [record(**row._mapping) for row in rows]
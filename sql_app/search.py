@@ -0,0 +1,55 @@
+
+# Python
+import re
+import json
+import base64
+import binascii
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+# Longest key: a first name, a space and a last name (both VARCHAR(20))
+NAME_KEY_LENGTH = 41
+
+_spaces = re.compile(r"\s+")
+
+
+# Name Keys
+# Searched names are stored normalized next to the names, in both orders ("ana garcia" and "garcia ana"), so a
+# typeahead prefix is one range scan of an index whatever the case, accents and the name typed first
+def normalize_name(text: Optional[str]) -> str:
+    """Casefolded, without accents nor repeated spaces: "  José  GARCÍA" gives "jose garcia"."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _spaces.sub(" ", stripped).strip()[:NAME_KEY_LENGTH]
+
+
+def name_keys(first_name: Optional[str], last_name: Optional[str]) -> Dict[str, str]:
+    """The name_key (first name first) and reverse_name_key (last name first) columns of a user."""
+    first, last = normalize_name(first_name), normalize_name(last_name)
+    return {
+        "name_key": normalize_name(f"{first} {last}"),
+        "reverse_name_key": normalize_name(f"{last} {first}"),
+    }
+
+
+def prefix_bounds(prefix: str) -> Tuple[str, str]:
+    """The keys starting with `prefix` are the range [lower, upper), which every index can seek."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# Cursors
+def encode_cursor(key: Tuple[str, str]) -> str:
+    """The (name key, user_id) a page ended on, as an opaque URL-safe token."""
+    return base64.urlsafe_b64encode(json.dumps(list(key), separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        key, user_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, str) or not isinstance(user_id, str):
+        raise ValueError("Invalid cursor")
+    return key, user_id
@@ -0,0 +1,415 @@
+
+# Python
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+from math import log
+from array import array
+from datetime import date, timedelta
+from itertools import accumulate, repeat
+from contextlib import ExitStack, contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# SQLAlchemy
+from sqlalchemy import Table, column, table as table_clause
+from sqlalchemy.engine import Connection
+
+# Dump
+from .dump import tables, deferred_indexes, throughput
+
+# Hashing
+from .hashing import pwd_context
+
+# Maintenance
+from .maintenance import reconcile_counters
+
+# Tweet Shards (crud.tweet_shards, read when called so the tests can swap it)
+from . import crud
+from .sharding import shard_metadata, shard_tweets
+
+# Name search
+from .search import name_keys
+
+BATCH_SIZE = 50_000
+CHUNK_SIZE = 10_000  # Rows generated per random stream
+MAX_ACCOUNT_AGE = 3650  # Days
+SQLITE_CACHE_SIZE = -256_000  # KiB
+MAX_TWEET_LENGTH = 280  # TweetBase.content
+DEFAULT_PASSWORD = "thisistheseedpassword"
+
+first_names = [
+    "Sofia", "Mateo", "Valentina", "Santiago", "Camila", "Sebastian", "Isabella", "Diego", "Lucia", "Nicolas",
+    "Maria", "Alejandro", "Daniela", "Gabriel", "Emma", "Lucas", "Olivia", "Liam", "Ana", "Pedro",
+    "Sergio", "Azucena", "Anthony", "Carmen", "Jose", "Laura", "Miguel", "Paula", "Juan", "Elena",
+]
+last_names = [
+    "Garcia", "Rodriguez", "Martinez", "Lopez", "Gonzalez", "Perez", "Sanchez", "Ramirez", "Torres", "Flores",
+    "Rivera", "Gomez", "Diaz", "Cruz", "Morales", "Reyes", "Gutierrez", "Ortiz", "Chavez", "Ramos",
+    "Smith", "Johnson", "Brown", "Williams", "Jones", "Quispe", "Mamani", "Huaman", "Rojas", "Vargas",
+]
+# Country and relative weight
+countries = [
+    ("Peru", 30), ("Mexico", 20), ("Colombia", 15), ("Argentina", 12), ("Chile", 8),
+    ("Spain", 6), ("United States", 5), ("Brazil", 3), (None, 1),
+]
+words = (
+    "the a to and of in is it you that for on my this with be at just so me are have not was but what "
+    "today good day love time new people know now like can get one go more see think back really want "
+    "work home game night life team music news world best great happy week morning coffee university "
+    "story island travel football weather city friends family book movie code python api"
+).split()
+hashtags = [
+    "#python", "#fastapi", "#peru", "#futbol", "#music", "#news", "#coding", "#travel",
+    "#coffee", "#books", "#weekend", "#tbt", "#ai", "#gaming", "#food", "#photography",
+]
+
+
+# Deterministic values
+def chunk_random(seed: int, table_name: str, chunk: int) -> random.Random:
+    """Every chunk has its own stream, so the rows depend neither on the batch size nor on the jobs."""
+    return random.Random(f"{seed}:{table_name}:{chunk}")
+
+
+def make_uuids(rng: random.Random, size: int) -> List[str]:
+    """Version 4 UUID strings from one big random number, several times faster than str(UUID(...))."""
+    digits = rng.getrandbits(128 * size).to_bytes(16 * size, "little").hex()
+    variants = "89ab"
+    return [
+        f"{digits[i:i + 8]}-{digits[i + 8:i + 12]}-4{digits[i + 13:i + 16]}-"
+        f"{variants[int(digits[i + 16], 16) & 3]}{digits[i + 17:i + 20]}-{digits[i + 20:i + 32]}"
+        for i in range(0, 32 * size, 32)
+    ]
+
+
+def password_hash(rng: random.Random, password: str) -> str:
+    """bcrypt hash shared by every user, with a salt from the seed so the dump is reproducible too."""
+    alphabet = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    # The last salt character only carries 2 bits
+    salt = "".join(rng.choices(alphabet, k=21)) + rng.choice(".Oeu")
+    return pwd_context.handler().using(salt=salt).hash(password)
+
+
+def zipf_cum_weights(size: int, exponent: float) -> array:
+    return array("d", accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+def make_corpus(rng: random.Random, size: int = 1_000_000) -> str:
+    """Random text to slice the tweets from, much faster than building every tweet word by word."""
+    corpus_words = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        corpus_words.append(word)
+        length += len(word) + 1
+    return " ".join(corpus_words)
+
+
+def iso_dates(today: date, days: int) -> List[str]:
+    """ISO date of `today - n days` for every n, dates are inserted as strings."""
+    return [(today - timedelta(days=n)).isoformat() for n in range(days + 1)]
+
+
+# Rows, generated column-wise per chunk and zipped into tuples in the table columns order
+class UserGenerator:
+    columns = ["user_id", "first_name", "last_name", "email", "password", "birth_date", "country",
+               "creation_account_date", "name_key", "reverse_name_key"]
+
+    def __init__(self, seed: int, user_ids: List[str], hashed_password: str, signup_days: array, today: date):
+        self.seed = seed
+        self.user_ids = user_ids
+        self.hashed_password = hashed_password
+        self.signup_days = signup_days
+        self.country_names, weights = zip(*countries)
+        self.country_weights = list(accumulate(weights))
+        self.birth_dates = iso_dates(date(2005, 1, 1), 365 * 45)
+        self.signup_dates = iso_dates(today, MAX_ACCOUNT_AGE)
+
+    def __call__(self, chunk: int, start: int, size: int) -> List[tuple]:
+        rng = chunk_random(self.seed, "users", chunk)
+        first = rng.choices(first_names, k=size)
+        last = rng.choices(last_names, k=size)
+        emails = [
+            f"{first_name}.{last_name}.{number}@example.com".lower()
+            for first_name, last_name, number in zip(first, last, range(start, start + size))
+        ]
+        keys = [name_keys(first_name, last_name) for first_name, last_name in zip(first, last)]
+
+        return list(zip(
+            self.user_ids[start:start + size],
+            first,
+            last,
+            emails,
+            repeat(self.hashed_password, size),
+            rng.choices(self.birth_dates, k=size),
+            rng.choices(self.country_names, cum_weights=self.country_weights, k=size),
+            [self.signup_dates[days] for days in self.signup_days[start:start + size]],
+            [key["name_key"] for key in keys],
+            [key["reverse_name_key"] for key in keys],
+        ))
+
+
+class TweetGenerator:
+    """Authors follow a Zipf law over a shuffled ranking of the users, dates lean to the recent past."""
+
+    columns = ["tweet_id", "content", "created_at", "updated_at", "user_id"]
+
+    def __init__(self, seed: int, user_ids: List[str], exponent: float, signup_days: array, today: date):
+        rng = chunk_random(seed, "tweets", -1)
+        self.seed = seed
+        self.user_ids = user_ids
+        self.signup_days = signup_days
+        self.ranking = list(range(len(user_ids)))
+        rng.shuffle(self.ranking)
+        self.cum_weights = zipf_cum_weights(len(user_ids), exponent)
+        self.corpus = make_corpus(rng)
+        self.dates = iso_dates(today, MAX_ACCOUNT_AGE)
+
+    def contents(self, rng: random.Random, size: int) -> List[str]:
+        """Mostly short texts with a long tail up to the limit, 30% of them with hashtags."""
+        corpus = self.corpus
+        corpus_limit = len(corpus) - MAX_TWEET_LENGTH - 1
+        random_, randrange, lognormvariate = rng.random, rng.randrange, rng.lognormvariate
+
+        contents = []
+        for _ in range(size):
+            length = min(MAX_TWEET_LENGTH, int(lognormvariate(4.0, 0.7)) or 1)
+            tags = " ".join(rng.sample(hashtags, randrange(1, 4))) if random_() < 0.3 else ""
+            if tags:
+                length = max(1, length - len(tags) - 1)
+
+            # Whole words from a random place of the corpus
+            begin = corpus.find(" ", randrange(corpus_limit)) + 1
+            end = corpus.rfind(" ", begin, begin + length + 1)
+            content = corpus[begin:end if end > begin else begin + length]
+            contents.append(f"{content} {tags}" if tags else content)
+        return contents
+
+    def __call__(self, chunk: int, start: int, size: int) -> List[tuple]:
+        rng = chunk_random(self.seed, "tweets", chunk)
+        random_, signup_days, dates = rng.random, self.signup_days, self.dates
+
+        authors = rng.choices(self.ranking, cum_weights=self.cum_weights, k=size)
+        contents = self.contents(rng, size)
+        # Exponential ages (mean 60 days) bounded by the author's signup, 10% edited later on
+        created = [min(signup_days[author], int(-60 * log(1 - random_()))) for author in authors]
+        updated = [age if random_() < 0.9 else int(age * random_()) for age in created]
+
+        return list(zip(
+            make_uuids(rng, size),
+            contents,
+            [dates[age] for age in created],
+            [dates[age] for age in updated],
+            [self.user_ids[author] for author in authors],
+        ))
+
+
+# Parallel generation
+_generator = None
+
+
+def _set_generator(generator: Callable):
+    global _generator
+    _generator = generator
+
+
+def _generate(task: Tuple[int, int, int]) -> List[tuple]:
+    return _generator(*task)
+
+
+def generate(generator: Callable, rows: int, jobs: int = 1) -> Iterator[List[tuple]]:
+    """Chunks of rows in order, built by `jobs` processes while the caller inserts the previous ones."""
+    tasks = [(chunk, start, min(CHUNK_SIZE, rows - start)) for chunk, start in enumerate(range(0, rows, CHUNK_SIZE))]
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield generator(*task)
+        return
+
+    # The generator is shipped once per process, not once per chunk
+    with multiprocessing.Pool(jobs, initializer=_set_generator, initargs=(generator,)) as pool:
+        yield from pool.imap(_generate, tasks)
+
+
+def batches(chunks: Iterator[List[tuple]], batch_size: int) -> Iterator[List[tuple]]:
+    batch = []
+    for chunk in chunks:
+        batch.extend(chunk)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+# Loading
+def insert_statement(connection: Connection, table: Table, columns: List[str]) -> str:
+    """INSERT compiled once in the driver paramstyle, rows go straight to cursor.executemany.
+
+    Other columns are left to their server defaults.
+    """
+    statement = table_clause(table.name, *[column(name) for name in columns]).insert()
+    compiled = statement.compile(dialect=connection.dialect, column_keys=columns)
+    # The rows are tuples in the order of `columns`, the driver must bind them by position in that order
+    if not compiled.positional or list(compiled.positiontup) != columns:
+        raise RuntimeError(
+            f"The {connection.dialect.name} insert of {table.name} does not bind {', '.join(columns)} by position"
+        )
+    return str(compiled)
+
+
+@contextmanager
+def fast_load(connection: Connection):
+    """On SQLite skip the fsync of every batch (the dataset can always be generated again) and keep
+    more of the primary key pages in cache."""
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+
+    pragmas = {"synchronous": "OFF", "cache_size": SQLITE_CACHE_SIZE}
+    previous = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in pragmas}
+    for name, value in pragmas.items():
+        connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+
+
+def load_shards(
+        generator: Callable,
+        rows: int,
+        batch_size: int,
+        jobs: int,
+        defer_indexes: bool,
+        progress=None
+) -> int:
+    """Insert the generated tweets into the shards of their users (crud.tweet_shards), one executemany per
+    shard and batch, as the tweets of the API are."""
+    shards = crud.tweet_shards
+    user_column = generator.columns.index("user_id")
+    inserted = 0
+
+    with ExitStack() as stack:
+        connections, statements = {}, {}
+        for name, engine in shards.engines.items():
+            connection = connections[name] = stack.enter_context(engine.connect())
+            stack.enter_context(fast_load(connection))
+            if defer_indexes:
+                stack.enter_context(deferred_indexes(connection, shard_tweets))
+            statements[name] = insert_statement(connection, shard_tweets, generator.columns)
+
+        for batch in batches(generate(generator, rows, jobs), batch_size):
+            by_shard: Dict[str, List[tuple]] = {}
+            for row in sorted(batch):
+                by_shard.setdefault(shards.shard_for(row[user_column]), []).append(row)
+            for name, shard_rows in by_shard.items():
+                with connections[name].begin():
+                    connections[name].exec_driver_sql(statements[name], shard_rows)
+            inserted += len(batch)
+            if progress is not None:
+                progress("tweets", inserted)
+
+    return inserted
+
+
+def seed_database(
+        connection: Connection,
+        users: int,
+        tweets: int,
+        seed: int = 42,
+        exponent: float = 1.1,
+        password: str = DEFAULT_PASSWORD,
+        batch_size: int = BATCH_SIZE,
+        jobs: int = 1,
+        today: date = None,
+        defer_indexes: bool = True,
+        progress=None
+) -> dict:
+    """Insert `users` users and `tweets` tweets, the same seed, sizes and date always give the same rows.
+
+    With the tweet shards on, the tweets go to the shards of their users instead of `connection`.
+    """
+    today = today or date.today()
+
+    rng = chunk_random(seed, "users", -1)
+    hashed_password = password_hash(rng, password)
+    user_ids = make_uuids(rng, users)
+    signup_days = array("H", (randrange(1, MAX_ACCOUNT_AGE + 1) for randrange in repeat(rng.randrange, users)))
+
+    plan = [("users", UserGenerator(seed, user_ids, hashed_password, signup_days, today), users)]
+    if users:
+        plan.append(("tweets", TweetGenerator(seed, user_ids, exponent, signup_days, today), tweets))
+
+    report = {"seed": seed}
+    with fast_load(connection):
+        for table_name, generator, rows in plan:
+            table = tables[table_name]
+            start = time.perf_counter()
+            if table_name == "tweets" and crud.tweet_shards is not None:
+                inserted = load_shards(generator, rows, batch_size, jobs, defer_indexes, progress)
+                report[table_name] = throughput(table_name, inserted, time.perf_counter() - start)
+                continue
+
+            statement = insert_statement(connection, table, generator.columns)
+            inserted = 0
+            with (deferred_indexes(connection, table) if defer_indexes else nullcontext()):
+                for batch in batches(generate(generator, rows, jobs), batch_size):
+                    # Random UUIDs in key order touch far fewer B-tree pages
+                    batch.sort()
+                    # One executemany per batch, MySQLdb rewrites it into multi-row INSERTs
+                    with (connection.begin_nested() if connection.in_transaction() else connection.begin()):
+                        connection.exec_driver_sql(statement, batch)
+                    inserted += len(batch)
+                    if progress is not None:
+                        progress(table_name, inserted)
+
+            report[table_name] = throughput(table_name, inserted, time.perf_counter() - start)
+
+        # The bulk insert bypasses crud, fill the user counters in one pass
+        with (connection.begin_nested() if connection.in_transaction() else connection.begin()):
+            report["counters"] = reconcile_counters(connection)
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with a realistic synthetic dataset.")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--tweets", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exponent of the tweets per user distribution")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="Password of every generated user")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per INSERT transaction")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count(), help="Generator processes")
+    parser.add_argument("--keep-indexes", action="store_true", help="Do not defer index maintenance")
+    parser.add_argument("--reset", action="store_true", help="Drop and create the tables first")
+    args = parser.parse_args(argv)
+
+    from .database import Base, mysql_engine as engine
+
+    if args.reset:
+        Base.metadata.drop_all(engine)
+        for shard_engine in (crud.tweet_shards.engines.values() if crud.tweet_shards is not None else []):
+            shard_metadata.drop_all(shard_engine)
+    Base.metadata.create_all(engine)
+    if crud.tweet_shards is not None:
+        crud.tweet_shards.create_all()
+
+    def progress(name, rows):
+        print(f"\r{name}: {rows}", end="", file=sys.stderr)
+
+    with engine.connect() as connection:
+        report = seed_database(
+            connection, args.users, args.tweets, args.seed, args.zipf, args.password, args.batch_size, args.jobs,
+            defer_indexes=not args.keep_indexes, progress=progress
+        )
+    print(file=sys.stderr)
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+
+# Python
+import os
+import sys
+import json
+import heapq
+import bisect
+import hashlib
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+# SQLAlchemy
+from sqlalchemy import Column, MetaData, Table, create_engine, delete, func, select
+from sqlalchemy.orm import Session, load_only, sessionmaker
+
+# Database
+from .database import engine_options
+
+# SQLAlchemy Models
+from .sqlalchemy_models import TweetDB
+
+# Read-only Records
+from .records import TweetRecord, TWEET_COLUMNS, record_columns, make_records
+
+T = TypeVar("T")
+
+SHARD_VNODES = 64  # Points of every shard on the ring, more points spread the users more evenly
+
+
+def parse_shards(spec: str) -> Dict[str, str]:
+    """'name=url,name=url' (names default to shard0, shard1...). Users are hashed on the names, not the urls,
+    so a shard can move to another server without moving its tweets."""
+    shards = {}
+    for number, item in enumerate(part.strip() for part in spec.split(",") if part.strip()):
+        name, separator, url = item.partition("=")
+        if not separator or "://" in name:
+            name, url = f"shard{number}", item
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+# Consistent Hashing
+class HashRing:
+    """Adding or removing one of N shards only moves about 1/N of the users, all to or from that shard."""
+
+    def __init__(self, names: List[str], vnodes: int = SHARD_VNODES):
+        if not names:
+            raise ValueError("A ring needs at least one shard")
+        self.names = list(names)
+        points = sorted((self.hash(f"{name}#{vnode}"), name) for name in names for vnode in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, self.hash(key)) % len(self._hashes)
+        return self._names[index]
+
+
+# The tweets table of the shards, without the foreign key (users stay in the main database)
+shard_metadata = MetaData()
+shard_tweets = Table("tweets", shard_metadata, *[
+    Column(column.name, column.type, primary_key=column.primary_key, index=column.index)
+    for column in TweetDB.__table__.columns
+])
+
+
+def newest_first(tweet: TweetRecord):
+    return tweet.created_at, tweet.tweet_id
+
+
+# Router
+class ShardRouter:
+    """The tweets of a user live in the shard its user_id hashes to.
+
+    Single-user operations open one session on one shard. Global reads ask every shard in parallel, each
+    returns its rows already sorted and a k-way merge interleaves them without sorting everything again.
+    Rows leave their sessions loaded (no expiry on commit), ready for the response models.
+    """
+
+    def __init__(self, urls: Dict[str, str], vnodes: int = SHARD_VNODES):
+        self.urls = dict(urls)
+        self.ring = HashRing(list(self.urls), vnodes)
+        self.engines = {name: create_engine(url, **engine_options(url)) for name, url in self.urls.items()}
+        self._sessions = {
+            name: sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+            for name, engine in self.engines.items()
+        }
+        # Threads are started on demand, so a router created before a fork is fine
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.engines), thread_name_prefix="tweet-shards")
+
+    def create_all(self):
+        for engine in self.engines.values():
+            shard_metadata.create_all(engine)
+
+    def dispose(self, close: bool = True):
+        for engine in self.engines.values():
+            engine.dispose(close=close)
+
+    def shard_for(self, user_id) -> str:
+        return self.ring.node_for(str(user_id))
+
+    @contextmanager
+    def session(self, name: str) -> Iterator[Session]:
+        db = self._sessions[name]()
+        try:
+            yield db
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def scatter(self, function: Callable[[Session], T], names: Optional[List[str]] = None) -> List[T]:
+        """Run `function` with a session of every shard (or of `names`) in parallel, results in shard order."""
+        names = list(self.engines) if names is None else names
+        return self._parallel(lambda name, db: function(db), names)
+
+    def scatter_with(self, function: Callable[[Session, Any], T], arguments: Dict[str, Any]) -> List[T]:
+        """Like scatter, on the shards of `arguments` with their own argument each."""
+        return self._parallel(lambda name, db: function(db, arguments[name]), list(arguments))
+
+    def _parallel(self, function: Callable[[str, Session], T], names: List[str]) -> List[T]:
+        def run(name):
+            with self.session(name) as db:
+                return function(name, db)
+
+        if len(names) <= 1:
+            return [run(name) for name in names]
+        return list(self._executor.map(run, names))
+
+    # Tweets
+    @staticmethod
+    def query_tweets(db: Session, fields: Optional[List[str]] = None):
+        query = db.query(TweetDB)
+        if fields:
+            # created_at orders the merge of the shards
+            loaded = set(fields) | {"created_at"}
+            query = query.options(load_only(*[getattr(TweetDB, field) for field in loaded]))
+        return query
+
+    def add_tweets(self, db_tweets: List[TweetDB]):
+        """One transaction per shard touched. The ids a shard already has are skipped: a retry of the same
+        rows, after some shards committed and others failed, does not insert them twice."""
+        by_shard: Dict[str, List[TweetDB]] = {}
+        for db_tweet in db_tweets:
+            by_shard.setdefault(self.shard_for(db_tweet.user_id), []).append(db_tweet)
+
+        def add(db: Session, rows: List[TweetDB]):
+            tweet_ids = [row.tweet_id for row in rows]
+            existing = {tweet_id for tweet_id, in db.query(TweetDB.tweet_id).filter(TweetDB.tweet_id.in_(tweet_ids))}
+            db.add_all([row for row in rows if row.tweet_id not in existing])
+            db.commit()
+
+        self.scatter_with(add, by_shard)
+
+    @staticmethod
+    def select_tweets(fields: Optional[List[str]] = None):
+        """Core select of tweet records, for the list reads."""
+        if fields:
+            fields = list(fields) + ["created_at"]  # Orders the merge of the shards
+        return select(*record_columns(TweetDB.__table__, TWEET_COLUMNS, fields))
+
+    def get_tweets(self, fields: Optional[List[str]] = None) -> List[TweetRecord]:
+        """Every tweet, newest first: a sorted read per shard and a k-way merge."""
+        statement = self.select_tweets(fields).order_by(TweetDB.created_at.desc(), TweetDB.tweet_id.desc())
+        shards = self.scatter(lambda db: make_records(TweetRecord, db.execute(statement), fields))
+        return list(heapq.merge(*shards, key=newest_first, reverse=True))
+
+    def get_user_tweets(self, user_id, fields: Optional[List[str]] = None) -> List[TweetRecord]:
+        statement = self.select_tweets(fields).where(TweetDB.user_id == str(user_id))
+        with self.session(self.shard_for(user_id)) as db:
+            return make_records(TweetRecord, db.execute(statement), fields)
+
+    def get_tweets_by_id(self, tweet_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, TweetDB]:
+        """A tweet_id does not tell its shard: one IN query on every shard."""
+        if not tweet_ids:
+            return {}
+        shards = self.scatter(lambda db: self.query_tweets(db, fields).filter(TweetDB.tweet_id.in_(tweet_ids)).all())
+        return {db_tweet.tweet_id: db_tweet for rows in shards for db_tweet in rows}
+
+    def get_authored_tweets(self, authored: Dict[str, str]) -> Dict[str, TweetDB]:
+        """Tweets by id when their authors are known ({tweet_id: user_id}): only the shards that hold them."""
+        by_shard: Dict[str, List[str]] = {}
+        for tweet_id, user_id in authored.items():
+            by_shard.setdefault(self.shard_for(user_id), []).append(tweet_id)
+
+        shards = self.scatter_with(lambda db, ids: db.query(TweetDB).filter(TweetDB.tweet_id.in_(ids)).all(), by_shard)
+        return {db_tweet.tweet_id: db_tweet for rows in shards for db_tweet in rows}
+
+    def update_tweet(self, db_tweet: TweetDB, values: dict) -> TweetDB:
+        with self.session(self.shard_for(db_tweet.user_id)) as db:
+            db.query(TweetDB).filter(TweetDB.tweet_id == db_tweet.tweet_id).update(values)
+            db.commit()
+            return db.query(TweetDB).filter(TweetDB.tweet_id == db_tweet.tweet_id).first()
+
+    def delete_tweets(self, user_id, tweet_ids: Optional[List[str]] = None) -> List[str]:
+        """Delete some (or all) tweets of a user, returns the deleted ids."""
+        with self.session(self.shard_for(user_id)) as db:
+            query = db.query(TweetDB.tweet_id).filter(TweetDB.user_id == str(user_id))
+            if tweet_ids is not None:
+                query = query.filter(TweetDB.tweet_id.in_(tweet_ids))
+            deleted = [tweet_id for tweet_id, in query]
+            if deleted:
+                db.query(TweetDB).filter(TweetDB.tweet_id.in_(deleted)).delete(synchronize_session=False)
+                db.commit()
+            return deleted
+
+    def newest_tweet_date(self, user_id):
+        with self.session(self.shard_for(user_id)) as db:
+            return db.query(func.max(TweetDB.created_at)).filter(TweetDB.user_id == str(user_id)).scalar()
+
+
+def router_from_environment(spec: str) -> Optional[ShardRouter]:
+    if not spec:
+        return None
+    router = ShardRouter(parse_shards(spec))
+    router.create_all()
+    return router
+
+
+# Unset: every tweet stays in the main database
+tweet_shards: Optional[ShardRouter] = router_from_environment(os.getenv("TWEET_SHARDS", ""))
+
+
+# Resharding
+def reshard(source: ShardRouter, target: ShardRouter, batch_size: int = 1000, progress=None) -> dict:
+    """Move every tweet of `source` to its shard in `target`, batch by batch.
+
+    Shards are matched by url: tweets that hash to a shard with the same url stay where they are, so
+    adding a shard to the ring only copies the tweets that now belong to it. Every batch is inserted
+    (skipping rows already there) and committed in its target before being deleted from its source, so an
+    interrupted run loses nothing and can be started again.
+    """
+    report = {"scanned": 0, "moved": 0, "shards": {}}
+
+    for source_name, source_url in source.urls.items():
+        moved = 0
+        with source.session(source_name) as source_db:
+            last_id = None
+            while True:
+                query = select(shard_tweets).order_by(shard_tweets.c.tweet_id).limit(batch_size)
+                if last_id is not None:
+                    query = query.where(shard_tweets.c.tweet_id > last_id)
+                rows = [dict(row) for row in source_db.execute(query).mappings()]
+                if not rows:
+                    break
+                last_id = rows[-1]["tweet_id"]
+                report["scanned"] += len(rows)
+
+                leaving: Dict[str, List[dict]] = {}
+                for row in rows:
+                    name = target.shard_for(row["user_id"])
+                    if target.urls[name] != source_url:
+                        leaving.setdefault(name, []).append(row)
+
+                for name, moving in leaving.items():
+                    with target.session(name) as target_db:
+                        ids = [row["tweet_id"] for row in moving]
+                        present = {tweet_id for tweet_id, in target_db.execute(
+                            select(shard_tweets.c.tweet_id).where(shard_tweets.c.tweet_id.in_(ids))
+                        )}
+                        missing = [row for row in moving if row["tweet_id"] not in present]
+                        if missing:
+                            target_db.execute(shard_tweets.insert(), missing)
+                        target_db.commit()
+                    source_db.execute(delete(shard_tweets).where(shard_tweets.c.tweet_id.in_(ids)))
+                    source_db.commit()
+                    moved += len(moving)
+
+                if progress is not None:
+                    progress(source_name, report["scanned"])
+
+        report["shards"][source_name] = moved
+        report["moved"] += moved
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move the tweets to the shards their users hash to.")
+    parser.add_argument("--source", required=True, help="Current shards, 'name=url,...' or one database url")
+    parser.add_argument("--target", required=True, help="New shards, 'name=url,...'")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    source, target = ShardRouter(parse_shards(args.source)), ShardRouter(parse_shards(args.target))
+    target.create_all()
+    try:
+        report = reshard(
+            source, target, args.batch_size,
+            progress=lambda name, scanned: print(f"{name}: {scanned} tweets scanned", file=sys.stderr)
+        )
+    finally:
+        source.dispose()
+        target.dispose()
+
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,18 @@
 
 # Libraries
-from sqlalchemy import Column, ForeignKey, VARCHAR, DATE, TEXT
+from sqlalchemy import Column, ForeignKey, Index, VARCHAR, DATE, TEXT, BOOLEAN, BigInteger, Integer, DateTime, func
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import expression
 
 # Base from database.py
 from .database import Base
 
+# The name keys compare byte by byte like Python strings (their code points), as the search bounds and cursors
+# expect: MySQL's default collation ignores the case and the accents, and sorts the space and the digits its way
+NameKey = VARCHAR(41).with_variant(mysql.VARCHAR(41, charset="utf8mb4", collation="utf8mb4_bin"), "mysql")
+
 
 # Classes
 class UserDB(Base):
@@ -20,9 +27,27 @@ class UserDB(Base):
     birth_date = Column(DATE)
     country = Column(VARCHAR(20), default=None)
     creation_account_date = Column(DATE)
+    # Too many followers to fan out: followers read this user's tweets at read time (never reset)
+    fanout_on_read = Column(BOOLEAN, default=False, server_default=expression.false(), nullable=False)
+    # Counters updated in the same transactions as the writes, sql_app/maintenance.py reconciles them
+    tweets_count = Column(Integer, default=0, server_default="0", nullable=False)
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
+    last_tweet_at = Column(DATE)
+    # Normalized names for GET /users/search, in both orders (sql_app/search.py), filled by the writes
+    name_key = Column(NameKey)
+    reverse_name_key = Column(NameKey)
 
     tweets = relationship("TweetDB", back_populates="user")
 
+    __table_args__ = (
+        # The user_id ends every index: pages continue after (key, user_id) without sorting
+        Index("ix_users_name_key", "name_key", "user_id"),
+        Index("ix_users_reverse_name_key", "reverse_name_key", "user_id"),
+        Index("ix_users_country_name_key", "country", "name_key", "user_id"),
+        Index("ix_users_country_reverse_name_key", "country", "reverse_name_key", "user_id"),
+    )
+
 
 class TweetDB(Base):
     __tablename__ = "tweets"
@@ -32,6 +57,70 @@ class TweetDB(Base):
     content = Column(TEXT)
     created_at = Column(DATE)
     updated_at = Column(DATE)
-    user_id = Column(VARCHAR(50), ForeignKey("users.user_id"))
+    user_id = Column(VARCHAR(50), ForeignKey("users.user_id"), index=True)
 
     user = relationship("UserDB", back_populates="tweets")
+
+
+class FollowDB(Base):
+    __tablename__ = "follows"
+
+    # Attributes
+    follower_id = Column(VARCHAR(50), ForeignKey("users.user_id"), primary_key=True)
+    followed_id = Column(VARCHAR(50), ForeignKey("users.user_id"), primary_key=True, index=True)
+    created_at = Column(DATE)
+    # Copy of the followed user's fanout_on_read, so a timeline read finds those follows in one range
+    fanout_on_read = Column(BOOLEAN, default=False, server_default=expression.false(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_follows_follower_fanout", "follower_id", "fanout_on_read"),
+    )
+
+
+class TimelineEntryDB(Base):
+    """Precomputed home timeline: one row per tweet and per follower (and one for the author)."""
+    __tablename__ = "timeline_entries"
+
+    # Attributes
+    entry_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(VARCHAR(50), ForeignKey("users.user_id"), nullable=False)  # Timeline owner
+    position = Column(BigInteger, nullable=False)  # Microseconds when posted (clock of the worker), newest first
+    # No foreign key, the tweets may live in shard databases (sql_app/sharding.py)
+    tweet_id = Column(VARCHAR(50), nullable=False, index=True)
+    author_id = Column(VARCHAR(50), nullable=False, index=True)
+
+    __table_args__ = (
+        # Positions may repeat between workers, the tweet_id orders their entries
+        Index("ix_timeline_entries_user_position_tweet", "user_id", "position", "tweet_id"),
+    )
+
+
+class ChangeDB(Base):
+    """Append-only log of the tweet and user writes, change_id is the sync token of GET /changes."""
+    __tablename__ = "changes"
+
+    # Attributes
+    change_id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(VARCHAR(10), nullable=False)  # "tweet" or "user"
+    entity_id = Column(VARCHAR(50), nullable=False)  # No foreign key, deletes are logged too
+    operation = Column(VARCHAR(10), nullable=False)  # "create", "update" or "delete"
+    changed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_changes_entity", "entity", "entity_id", "change_id"),
+    )
+
+
+class IdempotencyKeyDB(Base):
+    """Idempotency-Key of a POST seen by any worker, with its response once stored (idempotency.py)."""
+    __tablename__ = "idempotency_keys"
+
+    # Attributes
+    path = Column(VARCHAR(100), primary_key=True)
+    principal = Column(VARCHAR(64), primary_key=True)  # SHA-256 of the Authorization header
+    idempotency_key = Column(VARCHAR(255), primary_key=True)
+    fingerprint = Column(VARCHAR(64), nullable=False)  # SHA-256 of the body
+    status_code = Column(Integer)  # None while the first request runs
+    headers = Column(TEXT)  # JSON list of [name, value]
+    body = Column(LargeBinary)
+    expires_at = Column(DateTime, nullable=False, index=True)
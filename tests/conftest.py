@@ -1,6 +1,9 @@
-# Signal
-import signal
-from .overtime_signal import TimeOutException, TIMEOUT
+# Database (first, it selects the database used by the app)
+from tests.test_sql_app import override_get_db, test_engine
+from tests.test_sql_app import begin_test_transaction, end_test_transaction
+
+# Python
+from datetime import timedelta
 
 # Testing
 import pytest
@@ -8,12 +11,14 @@ from fastapi.testclient import TestClient
 
 # Database
 from models import UserRegister
-from tests.test_sql_app import override_get_db, mysql_test_engine
 from sql_app.dependencies import get_db
 from sql_app.database import Base
 
 # Others Tools
 from sql_app import crud
+from sql_app.hashing import get_password_hash
+from controllers.token import create_access_token
+from controllers.rate_limit import rate_limits
 
 # App
 from main import app
@@ -40,54 +45,61 @@ user_another_example = UserRegister(
 )
 
 app.dependency_overrides[get_db] = override_get_db
+
+# Rate limits are tested on their own (tests/test_rate_limit.py)
+for rate_limit in rate_limits:
+    app.dependency_overrides[rate_limit] = lambda: None
+
 client = TestClient(app)
 
 
 # Fixtures
+@pytest.fixture(scope="session", autouse=True)
+def database_schema():
+    """Fixture to build the schema once per test session (and per worker)."""
+    Base.metadata.create_all(bind=test_engine)
+
+    yield
+
+    Base.metadata.drop_all(bind=test_engine)
+
+
+@pytest.fixture(scope="session")
+def fixture_password_hash():
+    """Fixture to pay the bcrypt cost once, both test users share the password."""
+    return get_password_hash(user_example.password)
+
+
 @pytest.fixture
 def set_db():
-    try:
-        Base.metadata.create_all(bind=mysql_test_engine)
+    """Fixture to run the test inside a transaction that is rolled back at the end."""
+    transaction = begin_test_transaction()
 
-        # Signal that cancel test if last more than 5 second
-        signal.alarm(TIMEOUT)
+    yield
 
-        yield
-
-    except Exception:
-        raise TimeOutException('Database Error!')
-    finally:
-        Base.metadata.drop_all(bind=mysql_test_engine)
+    end_test_transaction(transaction)
+    crud.clear_local_caches()  # Rows of the rolled back transaction
 
 
 @pytest.fixture(autouse=True)
-def set_up_users(set_db):
+def set_up_users(set_db, fixture_password_hash):
     """Fixture to create test users."""
 
-    # Define User
-    test_user_1 = user_example
-    test_user_2 = user_another_example
-
     # Open DB Session
     test_database = next(override_get_db())
 
     # Add user to database
-    db_user_1 = crud.create_user_if_not_exist(test_database, test_user_1)
-    db_user_2 = crud.create_user_if_not_exist(test_database, test_user_2)
-
-    # Login Users
-    response_user_1 = client.post(
-        "/login",
-        data={"username": db_user_1.email, "password": user_example.password}
-    )
-    response_user_2 = client.post(
-        "/login",
-        data={"username": db_user_2.email, "password": user_another_example.password}
-    )
+    db_user_1 = crud.create_user_if_not_exist(test_database, user_example, fixture_password_hash)
+    db_user_2 = crud.create_user_if_not_exist(test_database, user_another_example, fixture_password_hash)
+
+    # Tokens, as /login would make them
+    access_token_expires = timedelta(minutes=30)
+    token_user_1 = create_access_token(data={"sub": db_user_1.email}, expires_delta=access_token_expires)
+    token_user_2 = create_access_token(data={"sub": db_user_2.email}, expires_delta=access_token_expires)
 
     # Header
-    header_user_1 = {"Authorization": "Bearer " + response_user_1.json()["access_token"]}
-    header_user_2 = {"Authorization": "Bearer " + response_user_2.json()["access_token"]}
+    header_user_1 = {"Authorization": "Bearer " + token_user_1}
+    header_user_2 = {"Authorization": "Bearer " + token_user_2}
 
     # Information to yield
     set_up_info = {
@@ -97,21 +109,14 @@ def set_up_users(set_db):
         "header_2": header_user_2,
     }
 
-    # Here is where the testing happens
+    # Here is where the testing happens (changes are rolled back by set_db)
     yield set_up_info
 
-    # Delete user from database
-    crud.delete_user_if_exists(test_database, db_user_1.user_id)
-    # crud.delete_user_if_exists(test_database, db_user_2.user_id)
-
 
 @pytest.fixture()
 def set_up_tweets(set_up_users):
     """Fixture to create test tweets"""
 
-    # Open DB Session
-    test_database = next(override_get_db())
-
     # Function to make tweets
     def make_tweets_from_user(user_number):
         user_info = set_up_users[f'user_{user_number}']
@@ -142,9 +147,5 @@ def set_up_tweets(set_up_users):
         "user_2": make_tweets_from_user(2)
     }
 
-    # Here is where the testing happens
+    # Here is where the testing happens (changes are rolled back by set_db)
     yield set_up_tweet_info
-
-    # Delete tweets from database
-    crud.delete_tweets_by_user(test_database, set_up_tweet_info["user_1"]["user_info"].user_id)
-    crud.delete_tweets_by_user(test_database, set_up_tweet_info["user_2"]["user_info"].user_id)
@@ -0,0 +1,198 @@
+
+# Libraries
+import csv
+import gzip
+import json
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.pool import StaticPool
+from fastapi import status
+from .conftest import client
+from .test_sql_app import override_get_db
+
+# Admins
+from controllers.oauth2 import ADMIN_EMAILS
+
+# Others Tools
+from sql_app import crud, dump, maintenance
+from sql_app.database import Base
+from sql_app.sqlalchemy_models import FollowDB, TimelineEntryDB
+
+
+# Fixtures
+@pytest.fixture
+def admin_header(set_up_users):
+    """Fixture to give admin privileges to user_1."""
+    email = set_up_users["user_1"].email
+    ADMIN_EMAILS.add(email)
+
+    yield set_up_users["header_1"]
+
+    ADMIN_EMAILS.discard(email)
+
+
+# Export Tests
+@pytest.mark.admin
+def test_export_requires_admin(set_up_users):
+    response = client.get("/admin/export/users", headers=set_up_users["header_2"])
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert response.json()["detail"] == "Admin privileges required"
+
+
+@pytest.mark.admin
+def test_export_users_ndjson(set_up_users, admin_header):
+    response = client.get("/admin/export/users", headers=admin_header)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "application/gzip"
+
+    rows = [json.loads(line) for line in gzip.decompress(response.content).decode().splitlines()]
+    emails = {row["email"] for row in rows}
+
+    assert set_up_users["user_1"].email in emails
+    assert set_up_users["user_2"].email in emails
+    assert all("password" in row for row in rows)
+
+
+@pytest.mark.admin
+def test_export_tweets_csv(set_up_tweets, admin_header):
+    response = client.get("/admin/export/tweets", params={"format": "csv"}, headers=admin_header)
+
+    assert response.status_code == status.HTTP_200_OK
+
+    rows = list(csv.DictReader(gzip.decompress(response.content).decode().splitlines()))
+    tweet_ids = {row["tweet_id"] for row in rows}
+
+    for user in set_up_tweets.values():
+        assert user["tweet_1"]["tweet_id"] in tweet_ids
+        assert user["tweet_2"]["tweet_id"] in tweet_ids
+
+
+# Restore Tests
+@pytest.mark.admin
+@pytest.mark.parametrize("dump_format", ["ndjson", "csv"])
+def test_export_and_restore_tweets(dump_format, set_up_tweets, admin_header):
+    user = set_up_tweets["user_1"]
+    user_info = user["user_info"]
+
+    response = client.get("/admin/export/tweets", params={"format": dump_format}, headers=admin_header)
+    dump_file = response.content
+
+    # Remove the tweets and load them back
+    test_database = next(override_get_db())
+    for user_tweets in set_up_tweets.values():
+        crud.delete_tweets_by_user(test_database, user_tweets["user_info"].user_id)
+
+    response = client.post(
+        "/admin/restore/tweets",
+        params={"format": dump_format},
+        files={"file": (f"tweets.{dump_format}.gz", dump_file, "application/gzip")},
+        headers=admin_header
+    )
+    report = response.json()
+
+    assert response.status_code == status.HTTP_200_OK
+    assert report["table"] == "tweets"
+    assert report["rows"] >= 4
+    assert report["rows_per_second"] > 0
+
+    response = client.get("/tweets/me", headers=user["header"])
+    assert user["tweet_1"] in response.json()
+    assert user["tweet_2"] in response.json()
+    assert len(crud.get_user_tweets(test_database, user_info)) == 2
+
+    # Loading the same rows again is a conflict
+    response = client.post(
+        "/admin/restore/tweets",
+        params={"format": dump_format},
+        files={"file": (f"tweets.{dump_format}.gz", dump_file, "application/gzip")},
+        headers=admin_header
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+
+@pytest.mark.admin
+def test_export_and_restore_follows_and_timelines(set_up_tweets, admin_header):
+    follower, followed = set_up_tweets["user_2"], set_up_tweets["user_1"]
+    client.post(f"/users/{followed['user_info'].user_id}/follow", headers=follower["header"])
+    client.post("/post", json={"content": "after the follow"}, headers=followed["header"])
+    timeline = client.get("/timeline", headers=follower["header"]).json()["tweets"]
+
+    dumps = {
+        table: client.get(f"/admin/export/{table}", headers=admin_header).content
+        for table in ("follows", "timeline_entries")
+    }
+
+    # Lost follows and timelines are loaded back
+    test_database = next(override_get_db())
+    test_database.query(TimelineEntryDB).delete()
+    test_database.query(FollowDB).delete()
+    test_database.commit()
+    crud.clear_caches()
+    assert client.get("/timeline", headers=follower["header"]).json()["tweets"] != timeline
+
+    for table, dump_file in dumps.items():
+        response = client.post(
+            f"/admin/restore/{table}",
+            files={"file": (f"{table}.ndjson.gz", dump_file, "application/gzip")},
+            headers=admin_header
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["rows"] >= 1
+
+    assert client.get("/timeline", headers=follower["header"]).json()["tweets"] == timeline
+    assert maintenance.reconcile_counters(test_database)["fixed"] == 0
+
+
+# Deferred Indexes
+def empty_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.mark.admin
+def test_deferred_indexes_keep_the_unique_ones():
+    engine = empty_database()
+    users = dump.tables["users"]
+
+    with engine.connect() as connection:
+        with dump.deferred_indexes(connection, users):
+            indexes = {index["name"] for index in inspect(connection).get_indexes("users")}
+            assert indexes == {"ix_users_email"}  # Emails stay unique while loading
+            connection.execute(users.insert(), [{"user_id": "1", "email": "someone@example.com"}])
+
+        assert len(inspect(connection).get_indexes("users")) == len(users.indexes)
+
+        # Only into empty tables
+        with pytest.raises(ValueError):
+            with dump.deferred_indexes(connection, users):
+                pass
+    engine.dispose()
+
+
+@pytest.mark.admin
+def test_failed_rebuild_keeps_the_load_error(caplog, monkeypatch):
+    engine = empty_database()
+    users = dump.tables["users"]
+    index = next(index for index in users.indexes if not index.unique)
+
+    def broken_create(connection, *args, **kwargs):
+        raise RuntimeError("rebuild failed")
+
+    with engine.connect() as connection:
+        with pytest.raises(KeyError):
+            with dump.deferred_indexes(connection, users):
+                monkeypatch.setattr(index, "create", broken_create)
+                raise KeyError("load failed")
+        assert f"Could not rebuild the index {index.name}" in caplog.text
+
+        # Without a load error, the failed rebuild raises
+        monkeypatch.undo()
+        index.create(connection)
+        with pytest.raises(RuntimeError):
+            with dump.deferred_indexes(connection, users):
+                monkeypatch.setattr(index, "create", broken_create)
+    monkeypatch.undo()
+    engine.dispose()
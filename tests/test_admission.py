@@ -0,0 +1,169 @@
+
+# Libraries
+import time
+import asyncio
+import threading
+import pytest
+from fastapi import FastAPI, status
+from .conftest import client
+from .test_admin import admin_header
+
+# Admission Control
+from admission import AdmissionMiddleware, ConcurrencyLimit
+
+
+# Small app to check the middleware on its own
+small_app = FastAPI()
+running = {"now": 0, "max": 0}
+
+
+@small_app.get("/work")
+async def work(seconds: float = 0.05):
+    running["now"] += 1
+    running["max"] = max(running["max"], running["now"])
+    await asyncio.sleep(seconds)
+    running["now"] -= 1
+    return {"done": True}
+
+
+def limited(max_concurrency: int, max_wait: float):
+    running.update(now=0, max=0)
+    limit = ConcurrencyLimit("read", max_concurrency, max_wait)
+    return AdmissionMiddleware(small_app, {"read": limit}), limit
+
+
+async def call(app, seconds: float):
+    """One GET /work on the ASGI app, returns (status, headers)."""
+    scope = {
+        "type": "http", "method": "GET", "path": "/work", "raw_path": b"/work",
+        "query_string": f"seconds={seconds}".encode(), "root_path": "", "scheme": "http",
+        "server": ("test", 80), "client": ("test", 1234), "http_version": "1.1", "headers": []
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], dict(sent[0]["headers"])
+
+
+def burst(app, requests: int, seconds: float):
+    async def scenario():
+        return await asyncio.gather(*[call(app, seconds) for _ in range(requests)])
+    return asyncio.run(scenario())
+
+
+# Limit Tests
+@pytest.mark.admission
+def test_waiters_get_the_released_slots():
+    middleware, limit = limited(max_concurrency=2, max_wait=2)
+
+    responses = burst(middleware, 6, seconds=0.05)
+
+    assert [status_code for status_code, _ in responses] == [200] * 6
+    assert running["max"] == 2
+    stats = limit.stats()
+    assert (stats["active"], stats["waiting"], stats["admitted"], stats["rejected"]) == (0, 0, 6, 0)
+    assert stats["wait_max_ms"] >= 50
+    assert all(headers[b"server-timing"].startswith(b"queue;desc=read;dur=") for _, headers in responses)
+
+
+@pytest.mark.admission
+def test_overload_is_shed_with_503():
+    middleware, limit = limited(max_concurrency=2, max_wait=0.1)
+
+    responses = burst(middleware, 5, seconds=0.5)
+
+    statuses = sorted(status_code for status_code, _ in responses)
+    assert statuses == [200, 200, 503, 503, 503]
+    assert all(headers[b"retry-after"] == b"1" for status_code, headers in responses if status_code == 503)
+    stats = limit.stats()
+    assert (stats["active"], stats["admitted"], stats["rejected"]) == (0, 2, 3)
+
+    # Nothing leaked: the next burst gets both slots again
+    assert [status_code for status_code, _ in burst(middleware, 2, seconds=0)] == [200, 200]
+
+
+@pytest.mark.admission
+def test_cancelled_waiters_leak_no_slot():
+    limit = ConcurrencyLimit("read", max_concurrency=1, max_wait=5)
+
+    async def scenario(release_first: bool):
+        await limit.acquire()  # The holder
+        waiter = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0.01)
+        if release_first:  # Cancelled while the slot is on its way to it
+            limit.release()
+            waiter.cancel()
+        else:  # Cancelled while waiting (the client went away)
+            waiter.cancel()
+            limit.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert limit.stats()["active"] == 0
+        assert await asyncio.wait_for(limit.acquire(), 0.1) == 0.0
+        limit.release()
+
+    asyncio.run(scenario(release_first=False))
+    asyncio.run(scenario(release_first=True))
+    assert (limit.stats()["active"], limit.stats()["waiting"], limit.stats()["rejected"]) == (0, 0, 0)
+
+
+@pytest.mark.admission
+def test_limit_shared_by_event_loops():
+    # One event loop per thread, like the test client
+    middleware, limit = limited(max_concurrency=1, max_wait=5)
+    results = []
+
+    def request():
+        results.append(asyncio.run(call(middleware, 0.05))[0])
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [200] * 4
+    assert running["max"] == 1
+    assert time.perf_counter() - start >= 0.2
+    assert limit.stats()["active"] == 0
+
+
+@pytest.mark.admission
+def test_route_classes():
+    limits = {name: ConcurrencyLimit(name, 1, 1) for name in ("auth", "write", "read")}
+    middleware = AdmissionMiddleware(small_app, limits, routes={"/login": "auth"}, exempt={"/stream"})
+
+    def limit_name(method, path):
+        limit = middleware.limit_for({"method": method, "path": path})
+        return limit.name if limit else None
+
+    assert limit_name("POST", "/login") == "auth"
+    assert limit_name("POST", "/post") == "write"
+    assert limit_name("DELETE", "/tweets/1/delete") == "write"
+    assert limit_name("GET", "/users") == "read"
+    assert limit_name("GET", "/stream") is None
+    assert limit_name("OPTIONS", "/post") is None
+
+
+# App Tests
+@pytest.mark.admission
+@pytest.mark.admin
+def test_admission_measurements(set_up_users, admin_header):
+    response = client.get("/users/me", headers=set_up_users["header_1"])
+    assert response.headers["Server-Timing"].startswith("queue;desc=read;dur=")
+
+    response = client.get("/admin/admission", headers=admin_header)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()["limits"]) == {"auth", "write", "read"}
+    assert response.json()["limits"]["read"]["admitted"] >= 1
+    thread_pool = response.json()["thread_pool"]
+    assert thread_pool["size"] >= 1 and thread_pool["busy"] >= 0
@@ -0,0 +1,244 @@
+# Libraries
+import os
+import gzip
+import json
+import pytest
+from uuid import uuid4
+from datetime import date, timedelta
+from fastapi import status
+from .conftest import client
+from .test_sql_app import override_get_db
+from .test_admin import admin_header
+
+# Others Tools
+from sql_app import crud, maintenance
+from sql_app.archive import TweetArchive, PENDING
+from sql_app.sqlalchemy_models import TweetDB
+
+
+# Fixtures
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """The app with an archive directory for its cold tweets."""
+    tweet_archive = TweetArchive(str(tmp_path / "archive"), block_cache=4)
+    monkeypatch.setattr(crud, "tweet_archive", tweet_archive)
+    yield tweet_archive
+    tweet_archive.close()
+
+
+# Helpers
+def archive_rows(count, users=3, created_at=date(2022, 1, 1)):
+    user_ids = [str(uuid4()) for _ in range(users)]
+    return [
+        {"tweet_id": str(uuid4()), "user_id": user_ids[number % users], "content": f"tweet {number}",
+         "created_at": created_at + timedelta(days=number), "updated_at": created_at}
+        for number in range(count)
+    ]
+
+
+def post(header, content, created_at=None):
+    response = client.post("/post", json={"content": content, "created_at": created_at}, headers=header)
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+def hot_tweet_ids():
+    return {tweet_id for tweet_id, in next(override_get_db()).query(TweetDB.tweet_id)}
+
+
+# Segment Tests
+@pytest.mark.archive
+def test_segments(archive):
+    rows = archive_rows(300)
+    archive.publish(archive.write_pending(rows[:200]))
+    archive.publish(archive.write_pending(rows[200:]))
+
+    # Every tweet is found by reading one block
+    for row in rows:
+        assert archive.get(row["tweet_id"]) == row
+    assert archive.get(str(uuid4())) is None
+
+    user_id = rows[0]["user_id"]
+    by_user = [row for row in rows if row["user_id"] == user_id]
+    assert sorted(archive.user_tweets(user_id), key=lambda row: row["content"]) == sorted(
+        by_user, key=lambda row: row["content"]
+    )
+    assert archive.user_stats([user_id]) == {user_id: (100, max(row["created_at"] for row in by_user))}
+
+    # Deletes are appended to the tombstone log
+    archive.bury([(by_user[-1]["tweet_id"], user_id)])
+    assert archive.get(by_user[-1]["tweet_id"]) is None
+    assert archive.user_stats([user_id]) == {user_id: (99, by_user[-2]["created_at"])}
+
+    assert archive.stats()["segments"] == 2
+    assert archive.stats()["cached_blocks"] <= 4
+
+
+@pytest.mark.archive
+def test_workers_see_new_segments(archive):
+    # Another worker, opened on the same directory before the archival job
+    worker = TweetArchive(archive.directory)
+    rows = archive_rows(10)
+
+    archive.publish(archive.write_pending(rows))
+    archive.bury([(rows[0]["tweet_id"], rows[0]["user_id"])])
+
+    assert worker.get(rows[1]["tweet_id"]) == rows[1]
+    assert worker.get(rows[0]["tweet_id"]) is None
+    worker.close()
+
+
+@pytest.mark.archive
+def test_recover_interrupted_archival(archive):
+    committed, rolled_back = archive_rows(5), archive_rows(5)
+    archive.write_pending(committed)
+    archive.write_pending(rolled_back)
+    hot = {row["tweet_id"] for row in rolled_back}
+
+    archive.recover(lambda row: row["tweet_id"] in hot)
+
+    assert not [name for name in os.listdir(archive.directory) if name.endswith(PENDING)]
+    assert archive.get(committed[0]["tweet_id"]) == committed[0]
+    assert archive.get(rolled_back[0]["tweet_id"]) is None
+
+
+# Archived Tweets in the App
+@pytest.mark.archive
+@pytest.mark.tweet
+def test_archived_tweets_are_read_through(archive, set_up_users, admin_header):
+    header_1, header_2 = set_up_users["header_1"], set_up_users["header_2"]
+    client.post(f"/users/{set_up_users['user_1'].user_id}/follow", headers=header_2)
+    old = post(header_1, "old", "2022-01-01")
+    recent = post(header_1, "recent", str(date.today()))
+
+    response = client.post("/admin/tweets/archive", params={"older_than_days": 30}, headers=admin_header)
+    assert response.json() == {"archived": 1, "segments": 1}
+
+    # The hot table keeps the recent tweets only
+    assert hot_tweet_ids() == {recent["tweet_id"]}
+    assert [tweet["content"] for tweet in client.get("/").json()] == ["recent"]
+
+    # Reads fall through to the archive
+    assert client.get(f"/tweets/{old['tweet_id']}").json() == old
+    response = client.get(f"/tweets/{old['tweet_id']}", params={"fields": "content", "expand": "author"})
+    assert response.json()["by"]["first_name"] == "UserTest1"
+    assert sorted(tweet["content"] for tweet in client.get("/tweets/me", headers=header_1).json()) == ["old", "recent"]
+    assert [tweet["content"] for tweet in client.get("/timeline", headers=header_2).json()["tweets"]] == [
+        "recent", "old"
+    ]
+
+    # Archived tweets still count
+    assert maintenance.reconcile_counters(next(override_get_db()))["fixed"] == 0
+    assert client.get("/users/me", headers=header_1).json()["tweets_count"] == 2
+
+    # Nothing left to archive
+    assert maintenance.archive_tweets(next(override_get_db()), 30) == {"archived": 0, "segments": 0}
+
+
+@pytest.mark.archive
+@pytest.mark.update
+@pytest.mark.delete
+def test_archived_tweets_writes(archive, set_up_users):
+    header = set_up_users["header_1"]
+    edited, deleted = post(header, "edited", "2022-01-01"), post(header, "deleted", "2022-02-01")
+    maintenance.archive_tweets(next(override_get_db()), 30)
+
+    # An edit moves the tweet back to the hot table
+    response = client.put(f"/tweets/{edited['tweet_id']}/update", json={"content": "edited again"}, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    assert hot_tweet_ids() == {edited["tweet_id"]}
+    assert archive.get(edited["tweet_id"]) is None
+    assert client.get(f"/tweets/{edited['tweet_id']}").json()["content"] == "edited again"
+
+    response = client.delete(f"/tweets/{deleted['tweet_id']}/delete", headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get(f"/tweets/{deleted['tweet_id']}").status_code == status.HTTP_404_NOT_FOUND
+
+    user = client.get("/users/me", headers=header).json()
+    # The edit also set created_at to today
+    assert (user["tweets_count"], user["last_tweet_at"]) == (1, str(date.today()))
+    assert maintenance.reconcile_counters(next(override_get_db()))["fixed"] == 0
+
+
+@pytest.mark.archive
+@pytest.mark.delete
+def test_failed_deletes_keep_the_archived_tweets(archive, set_up_users, monkeypatch):
+    tweet = post(set_up_users["header_1"], "kept", "2022-01-01")
+    maintenance.archive_tweets(next(override_get_db()), 30)
+
+    def fail():
+        raise RuntimeError("commit failed")
+
+    for delete in (
+        lambda db: crud.delete_tweet(db, tweet["tweet_id"]),
+        lambda db: crud.delete_tweets_by_user(db, set_up_users["user_1"].user_id)
+    ):
+        db = next(override_get_db())
+        monkeypatch.setattr(db, "commit", fail)
+        with pytest.raises(RuntimeError):
+            delete(db)
+        db.rollback()
+        assert archive.get(tweet["tweet_id"])["content"] == "kept"
+
+
+@pytest.mark.archive
+@pytest.mark.update
+def test_edited_tweets_are_archived_again(archive, set_up_users, admin_header):
+    header = set_up_users["header_1"]
+    tweet = post(header, "first", "2022-01-01")
+    maintenance.archive_tweets(next(override_get_db()), 30)
+
+    # Edited but still old, the tweet goes to a newer segment
+    response = client.put(
+        f"/tweets/{tweet['tweet_id']}/update", json={"content": "second", "created_at": "2022-01-01"}, headers=header
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert maintenance.archive_tweets(next(override_get_db()), 30) == {"archived": 1, "segments": 1}
+    assert hot_tweet_ids() == set()
+    crud.clear_caches()
+
+    # The tombstone of the first copy does not hide the second one
+    assert archive.get(tweet["tweet_id"])["content"] == "second"
+    assert client.get(f"/tweets/{tweet['tweet_id']}").json()["content"] == "second"
+    assert [tweet["content"] for tweet in client.get("/tweets/me", headers=header).json()] == ["second"]
+    assert maintenance.reconcile_counters(next(override_get_db()))["fixed"] == 0
+    assert client.get("/users/me", headers=header).json()["tweets_count"] == 1
+    exported = gzip.decompress(client.get("/admin/export/tweets", headers=admin_header).content).decode().splitlines()
+    assert [json.loads(line)["content"] for line in exported] == ["second"]
+
+    # Deleted, no copy is left
+    assert client.delete(f"/tweets/{tweet['tweet_id']}/delete", headers=header).status_code == status.HTTP_200_OK
+    assert archive.get(tweet["tweet_id"]) is None
+    assert client.get("/tweets/me", headers=header).json() == []
+
+
+@pytest.mark.archive
+@pytest.mark.admin
+def test_dumps_include_the_archive(archive, set_up_users, admin_header):
+    hot = {post(set_up_users["header_1"], f"hot {number}", "2022-06-01")["tweet_id"] for number in range(2)}
+    rows = archive_rows(5)
+    archive.publish(archive.write_pending(rows))
+    archive.bury([(rows[0]["tweet_id"], rows[0]["user_id"])])
+
+    response = client.get("/admin/export/tweets", headers=admin_header)
+    dump_file = response.content
+    exported = [json.loads(line) for line in gzip.decompress(dump_file).decode().splitlines()]
+    assert sorted(row["tweet_id"] for row in exported) == sorted(hot | {row["tweet_id"] for row in rows[1:]})
+    assert {row["tweet_id"]: row["content"] for row in exported}[rows[1]["tweet_id"]] == "tweet 1"
+
+    # Restored next to the same archive, only the hot tweets come back to the table
+    crud.delete_tweets_by_user(next(override_get_db()), set_up_users["user_1"].user_id)
+    response = client.post(
+        "/admin/restore/tweets",
+        files={"file": ("tweets.ndjson.gz", dump_file, "application/gzip")},
+        headers=admin_header
+    )
+    assert response.json()["rows"] == 2
+    assert hot_tweet_ids() == hot
+
+
+@pytest.mark.archive
+@pytest.mark.admin
+def test_archive_disabled(set_up_users, admin_header):
+    response = client.post("/admin/tweets/archive", headers=admin_header)
+    assert response.status_code == status.HTTP_409_CONFLICT
@@ -0,0 +1,121 @@
+
+# Libraries
+import pytest
+from uuid import uuid4
+from datetime import date
+from fastapi import status
+from .conftest import client
+from .test_sql_app import override_get_db
+from .test_archive import archive
+
+# Others Tools
+from sql_app import maintenance
+from models import BATCH_MAX_IDS
+
+
+# Tweet Tests
+@pytest.mark.batch
+@pytest.mark.tweet
+@pytest.mark.show
+def test_tweets_by_ids(set_up_tweets):
+    first = set_up_tweets["user_1"]["tweet_1"]
+    second = set_up_tweets["user_2"]["tweet_2"]
+    unknown = str(uuid4())
+
+    ids = [second["tweet_id"], unknown, first["tweet_id"], second["tweet_id"]]
+    response = client.get("/tweets", params={"ids": ",".join(ids)})
+
+    assert response.status_code == status.HTTP_200_OK
+    # In the requested order, once each
+    assert [tweet["tweet_id"] for tweet in response.json()["tweets"]] == [second["tweet_id"], first["tweet_id"]]
+    assert response.json()["missing"] == [unknown]
+
+
+@pytest.mark.batch
+@pytest.mark.tweet
+@pytest.mark.show
+def test_tweets_by_ids_fields_and_expand(set_up_tweets):
+    tweet = set_up_tweets["user_1"]["tweet_1"]
+
+    response = client.get("/tweets", params={"ids": tweet["tweet_id"], "fields": "content"})
+    assert response.json() == {"tweets": [{"content": tweet["content"]}], "missing": []}
+
+    response = client.get("/tweets", params={"ids": tweet["tweet_id"], "expand": "author"})
+    assert response.json()["tweets"][0]["by"]["first_name"] == "UserTest1"
+
+
+@pytest.mark.batch
+@pytest.mark.tweet
+@pytest.mark.show
+def test_tweets_lookup(set_up_tweets):
+    ids = [set_up_tweets[user][tweet]["tweet_id"] for user in ("user_1", "user_2") for tweet in ("tweet_1", "tweet_2")]
+
+    response = client.post("/tweets/lookup", json={"ids": ids})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [tweet["tweet_id"] for tweet in response.json()["tweets"]] == ids
+
+
+@pytest.mark.batch
+@pytest.mark.tweet
+@pytest.mark.show
+def test_tweets_batch_limits(set_up_users):
+    assert client.get("/tweets").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.get("/tweets", params={"ids": "not-a-uuid"}).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    too_many = [str(uuid4()) for _ in range(BATCH_MAX_IDS + 1)]
+    response = client.get("/tweets", params={"ids": ",".join(too_many)})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.post("/tweets/lookup", json={"ids": too_many})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.post("/tweets/lookup", json={"ids": []})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.batch
+@pytest.mark.archive
+@pytest.mark.tweet
+def test_archived_tweets_by_ids(archive, set_up_users):
+    header = set_up_users["header_1"]
+    cold = client.post("/post", json={"content": "cold", "created_at": "2022-01-01"}, headers=header).json()
+    hot = client.post("/post", json={"content": "hot"}, headers=header).json()
+    maintenance.archive_tweets(next(override_get_db()), 30)
+
+    response = client.post("/tweets/lookup", json={"ids": [cold["tweet_id"], hot["tweet_id"]]})
+
+    assert [tweet["content"] for tweet in response.json()["tweets"]] == ["cold", "hot"]
+    assert response.json()["missing"] == []
+
+
+# User Tests
+@pytest.mark.batch
+@pytest.mark.user
+@pytest.mark.show
+def test_users_by_ids(set_up_users):
+    header = set_up_users["header_1"]
+    ids = [set_up_users["user_2"].user_id, set_up_users["user_1"].user_id]
+    unknown = str(uuid4())
+
+    response = client.get("/users", params={"ids": ",".join(ids + [unknown])}, headers=header)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [user["user_id"] for user in response.json()["users"]] == ids
+    assert response.json()["missing"] == [unknown]
+
+    response = client.post("/users/lookup", params={"fields": "email"}, json={"ids": ids}, headers=header)
+    assert response.json()["users"] == [
+        {"email": set_up_users["user_2"].email}, {"email": set_up_users["user_1"].email}
+    ]
+
+    # Without ids, every user as before
+    assert len(client.get("/users", headers=header).json()) == 2
+
+
+@pytest.mark.batch
+@pytest.mark.user
+@pytest.mark.show
+def test_users_by_ids_need_auth(set_up_users):
+    ids = [set_up_users["user_1"].user_id]
+
+    assert client.get("/users", params={"ids": ids[0]}).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post("/users/lookup", json={"ids": ids}).status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,190 @@
+
+# Libraries
+import time
+import threading
+import pytest
+from uuid import uuid4
+from fastapi import status
+from .conftest import client
+from .test_admin import admin_header
+
+# Others Tools
+from sql_app import crud
+from sql_app.cache import EntityCache
+
+
+# Fixtures
+@pytest.fixture
+def caches(monkeypatch):
+    """Empty caches of the app, to read their measurements."""
+    tweet_cache = EntityCache("tweets", max_entries=100, ttl=60, negative_ttl=60)
+    user_cache = EntityCache("users", max_entries=100, ttl=60, negative_ttl=60)
+    monkeypatch.setattr(crud, "tweet_cache", tweet_cache)
+    monkeypatch.setattr(crud, "user_cache", user_cache)
+    return {"tweets": tweet_cache, "users": user_cache}
+
+
+# Helpers
+class Loader:
+    """Slow loader counting its calls."""
+
+    def __init__(self, seconds=0.0, fail=False):
+        self.seconds = seconds
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, keys):
+        self.calls.append(keys)
+        fail = self.fail
+        time.sleep(self.seconds)
+        if fail:
+            raise RuntimeError("database unavailable")
+        return {key: {"id": key, "call": len(self.calls)} for key in keys if key != "missing"}
+
+
+def in_threads(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Cache Tests
+@pytest.mark.cache
+def test_concurrent_misses_load_once():
+    cache = EntityCache("tweets", max_entries=10, ttl=60, negative_ttl=60)
+    load = Loader(seconds=0.1)
+
+    results = in_threads(8, lambda: cache.get("viral", load))
+
+    assert load.calls == [["viral"]]
+    assert results == [{"id": "viral", "call": 1}] * 8
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["loads"]) == (1, 7, 1)
+
+
+@pytest.mark.cache
+def test_ttl_lru_and_missing_ids():
+    cache = EntityCache("tweets", max_entries=2, ttl=60, negative_ttl=0)
+    load = Loader()
+
+    assert cache.get_many(["a", "b", "missing"], load) == {
+        "a": {"id": "a", "call": 1}, "b": {"id": "b", "call": 1}, "missing": None
+    }
+    # The missing id expired at once, "a" was evicted by it
+    assert cache.get_many(["b", "missing", "a"], load)["a"] == {"id": "a", "call": 2}
+    assert load.calls[1] == ["missing", "a"]
+    assert cache.stats()["evictions"] >= 1
+
+    cache.negative_ttl = 60
+    cache.get("missing", load)
+    assert cache.get("missing", load) is None
+    assert cache.stats()["negative_hits"] == 1
+
+    cache.ttl = 0
+    cache.invalidate(["b"])
+    cache.get("b", load)
+    cache.get("b", load)
+    assert load.calls[-2:] == [["b"], ["b"]]
+
+
+@pytest.mark.cache
+def test_invalidated_load_is_not_stored():
+    cache = EntityCache("tweets", max_entries=10, ttl=60, negative_ttl=60)
+    load = Loader(seconds=0.1)
+
+    reader = threading.Thread(target=lambda: cache.get("edited", load))
+    reader.start()
+    time.sleep(0.03)
+    cache.invalidate(["edited"])  # Committed while the reader loads the old row
+    reader.join()
+
+    assert cache.get("edited", load) == {"id": "edited", "call": 2}
+
+
+@pytest.mark.cache
+def test_failed_load_is_not_shared():
+    cache = EntityCache("tweets", max_entries=10, ttl=60, negative_ttl=60)
+    load = Loader(seconds=0.1, fail=True)
+
+    def get():
+        try:
+            return cache.get("key", load)
+        except RuntimeError as error:
+            return str(error)
+
+    leader = threading.Thread(target=get)
+    leader.start()
+    time.sleep(0.03)
+    load.fail = False  # The waiting reader queries on its own
+    assert get() == {"id": "key", "call": 2}
+    leader.join()
+    assert cache.stats()["entries"] == 0
+
+
+# App Tests
+@pytest.mark.cache
+@pytest.mark.tweet
+def test_tweets_are_read_through(caches, set_up_tweets):
+    tweet = set_up_tweets["user_1"]["tweet_1"]
+    header = set_up_tweets["user_1"]["header"]
+
+    for _ in range(3):
+        response = client.get(f'/tweets/{tweet["tweet_id"]}')
+        assert response.json() == tweet
+    assert (caches["tweets"].stats()["misses"], caches["tweets"].stats()["hits"]) == (1, 2)
+
+    # Authors come from the user cache
+    response = client.get(f'/tweets/{tweet["tweet_id"]}', params={"expand": "author", "fields": "content"})
+    assert response.json() == {"content": tweet["content"], "by": {
+        "user_id": tweet["user_id"], "first_name": "UserTest1", "last_name": "SomeLastName"
+    }}
+
+    response = client.put(f'/tweets/{tweet["tweet_id"]}/update', json={"content": "edited"}, headers=header)
+    assert response.json()["content"] == "edited"
+    assert client.get(f'/tweets/{tweet["tweet_id"]}').json()["content"] == "edited"
+
+    client.delete(f'/tweets/{tweet["tweet_id"]}/delete', headers=header)
+    for _ in range(2):
+        assert client.get(f'/tweets/{tweet["tweet_id"]}').status_code == status.HTTP_404_NOT_FOUND
+    assert caches["tweets"].stats()["negative_hits"] == 1
+
+
+@pytest.mark.cache
+@pytest.mark.user
+def test_users_are_read_through(caches, set_up_users):
+    header = set_up_users["header_1"]
+    user_id = set_up_users["user_2"].user_id
+
+    assert client.get(f'/users/{user_id}', headers=header).json()["followers_count"] == 0
+
+    # Counters written by other path operations
+    client.post(f'/users/{user_id}/follow', headers=header)
+    assert client.get(f'/users/{user_id}', headers=header).json()["followers_count"] == 1
+
+    data = {
+        "first_name": "Renamed", "last_name": "User", "email": "renamed@example.com",
+        "password": "thisisthetestpassword", "creation_account_date": "2022-01-01"
+    }
+    client.put(f'/users/{user_id}/update', json=data, headers=header)
+    assert client.get(f'/users/{user_id}', headers=header).json()["first_name"] == "Renamed"
+
+    client.delete(f'/users/{user_id}/delete', headers=header)
+    assert client.get(f'/users/{user_id}', headers=header).status_code == status.HTTP_404_NOT_FOUND
+    # The follower counts one account less
+    assert client.get("/users/me", headers=header).json()["following_count"] == 0
+
+
+@pytest.mark.cache
+@pytest.mark.admin
+def test_cache_measurements(caches, set_up_users, admin_header):
+    client.get(f"/tweets/{uuid4()}")
+
+    response = client.get("/admin/cache", headers=admin_header)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()) == {"tweets", "users"}
+    assert response.json()["tweets"]["misses"] == 1
@@ -0,0 +1,145 @@
+
+# Libraries
+import os
+import time
+import socket
+import pytest
+from fastapi import status
+from .conftest import client
+
+# Others Tools
+from sql_app import crud
+from sql_app.bus import InvalidationBus
+from sql_app.cache import EntityCache
+from sql_app.hub import RESYNC
+
+
+# Fixtures
+class Worker:
+    """Invalidations and stream events received by a bus, like the caches and the hub of another worker."""
+
+    def __init__(self, directory):
+        self.evicted = []
+        self.clears = 0
+        self.events = []
+        self.bus = InvalidationBus(directory, evict=self.evict, clear=self.clear, deliver=self.events.extend)
+
+    def evict(self, tweet_ids, user_ids):
+        self.evicted.append((tweet_ids, user_ids))
+
+    def clear(self):
+        self.clears += 1
+
+
+@pytest.fixture
+def workers(tmp_path):
+    started = [Worker(str(tmp_path / "bus")) for _ in range(2)]
+    for worker in started:
+        worker.bus.start()
+    yield started
+    for worker in started:
+        worker.bus.stop()
+
+
+# Helpers
+def wait_for(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+# Bus Tests
+@pytest.mark.cache
+def test_writes_reach_the_other_workers(workers):
+    first, second = workers
+
+    first.bus.publish(["tweet"], ["user"])
+
+    assert wait_for(lambda: second.evicted == [(["tweet"], ["user"])])
+    assert first.evicted == []  # Its own caches are evicted by the writer
+
+    second.bus.publish(clear=True)
+    assert wait_for(lambda: first.clears == 1)
+    assert first.bus.stats()["received"] == 1 and first.bus.stats()["peers"] == 1
+
+
+@pytest.mark.cache
+def test_large_writes_are_split(workers):
+    first, second = workers
+    tweet_ids = [f"tweet-{number}" for number in range(1200)]
+
+    first.bus.publish(tweet_ids, ["user"])
+
+    assert wait_for(lambda: len(second.evicted) == 3)
+    assert [tweet_id for tweets, _ in second.evicted for tweet_id in tweets] == tweet_ids
+    assert second.clears == 0
+
+
+@pytest.mark.cache
+def test_missed_message_clears_the_caches(tmp_path):
+    worker = Worker(str(tmp_path))
+
+    worker.bus.handle({"sender": "a", "version": 1, "tweets": ["t1"], "users": []})
+    worker.bus.handle({"sender": "a", "version": 3, "tweets": ["t3"], "users": []})  # Version 2 was lost
+
+    assert worker.evicted == [(["t1"], [])]
+    assert (worker.clears, worker.bus.stats()["gaps"]) == (1, 1)
+    # The streams that missed events resync too
+    assert worker.events == [RESYNC] and worker.events[0] is RESYNC
+
+
+@pytest.mark.cache
+@pytest.mark.stream
+def test_stream_events_reach_the_other_workers(workers):
+    first, second = workers
+    events = [f"event: create\ndata: {{\"number\":{number}}}\n\n".encode() for number in range(120)]
+
+    first.bus.publish(["tweet"], events=events)
+
+    assert wait_for(lambda: len(second.events) == 120)
+    assert second.events == events
+    assert second.evicted == [(["tweet"], [])]
+    assert (first.events, second.clears) == ([], 0)
+
+
+@pytest.mark.cache
+def test_sockets_of_dead_workers_are_removed(workers):
+    first, second = workers
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead_path = os.path.join(first.bus.directory, "1-dead.sock")
+    dead.bind(dead_path)
+    dead.close()  # The file stays, nobody reads it
+
+    first.bus.publish(["tweet"])
+
+    assert not os.path.exists(dead_path)
+    assert wait_for(lambda: second.evicted == [(["tweet"], [])])
+
+
+# App Tests
+@pytest.mark.cache
+@pytest.mark.tweet
+def test_crud_writes_are_published(workers, set_up_tweets, monkeypatch):
+    other = workers[0]
+    app_bus = InvalidationBus(other.bus.directory, evict=crud.evict, clear=crud.clear_local_caches)
+    app_bus.start()
+    monkeypatch.setattr(crud, "tweet_cache", EntityCache("tweets", 100, ttl=60, negative_ttl=60))
+    monkeypatch.setattr(crud, "cache_bus", app_bus)
+    tweet = set_up_tweets["user_1"]["tweet_1"]
+
+    response = client.put(
+        f'/tweets/{tweet["tweet_id"]}/update', json={"content": "edited"}, headers=set_up_tweets["user_1"]["header"]
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert wait_for(lambda: ([tweet["tweet_id"]], [tweet["user_id"]]) in other.evicted)
+    # And the streams of the other workers get the edit
+    assert wait_for(lambda: any(event.startswith(b"event: update") for event in other.events))
+
+    # What the other workers write is evicted here
+    assert client.get(f'/tweets/{tweet["tweet_id"]}').json()["content"] == "edited"
+    invalidations = crud.tweet_cache.stats()["invalidations"]
+    other.bus.publish([tweet["tweet_id"]])
+    assert wait_for(lambda: crud.tweet_cache.stats()["invalidations"] == invalidations + 1)
+    app_bus.stop()
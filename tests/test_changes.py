@@ -0,0 +1,108 @@
+# Libraries
+import pytest
+from fastapi import status
+from .conftest import client
+from .test_sql_app import override_get_db
+
+# Models
+from models import Changes
+
+# Others Tools
+from sql_app import maintenance
+
+
+# Helpers
+def changes(header, **params):
+    response = client.get("/changes", params=params, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    return Changes(**response.json())
+
+
+def summary(page: Changes):
+    return [(change.entity, str(change.entity_id), change.operation) for change in page.changes]
+
+
+def post(header, content):
+    response = client.post("/post", json={"content": content}, headers=header)
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+# Changes Tests
+@pytest.mark.show
+@pytest.mark.tweet
+def test_changes_since_token(set_up_tweets, set_up_users):
+    header = set_up_users["header_1"]
+    token = changes(header).next_token
+    assert changes(header).changes == []
+
+    edited = post(header, "first version")
+    client.put(f"/tweets/{edited['tweet_id']}/update", json={"content": "second version"}, headers=header)
+    deleted = set_up_tweets["user_2"]["tweet_1"]["tweet_id"]
+    client.delete(f"/tweets/{deleted}/delete", headers=set_up_users["header_2"])
+
+    page = changes(header, since=token)
+
+    # The create and the update of the same tweet are compacted into one change
+    assert summary(page) == [("tweet", edited["tweet_id"], "update"), ("tweet", deleted, "delete")]
+    assert page.changes[0].tweet.content == "second version"
+    assert page.changes[1].tweet is None
+    assert page.has_more is False
+
+    # Nothing new since the last token
+    assert changes(header, since=page.next_token).changes == []
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_changes_pagination(set_up_users):
+    header = set_up_users["header_1"]
+    token = changes(header).next_token
+    first, second = post(header, "first"), post(header, "second")
+    client.put(f"/tweets/{first['tweet_id']}/update", json={"content": "first, edited"}, headers=header)
+
+    page = changes(header, since=token, limit=2)
+    # The first tweet changes again later, it is left for the next page
+    assert summary(page) == [("tweet", second["tweet_id"], "create")]
+    assert page.has_more is True
+
+    page = changes(header, since=page.next_token, limit=2)
+    assert summary(page) == [("tweet", first["tweet_id"], "update")]
+    assert page.has_more is False
+
+
+@pytest.mark.show
+@pytest.mark.user
+def test_user_changes(set_up_users):
+    header = set_up_users["header_1"]
+    user = set_up_users["user_1"]
+
+    page = changes(header, since=0)
+    assert ("user", str(user.user_id), "create") in summary(page)
+
+    user_change = next(change for change in client.get(
+        "/changes", params={"since": 0}, headers=header
+    ).json()["changes"] if change["entity_id"] == str(user.user_id))
+    assert user_change["user"]["email"] == user.email
+    assert "password" not in user_change["user"]
+
+
+@pytest.mark.admin
+def test_compact_changes(set_up_users):
+    header = set_up_users["header_1"]
+    tweet = post(header, "version 0")
+    for version in range(1, 4):
+        client.put(f"/tweets/{tweet['tweet_id']}/update", json={"content": f"version {version}"}, headers=header)
+    before = changes(header, since=0)
+
+    report = maintenance.compact_changes(next(override_get_db()))
+
+    assert report == {"deleted_changes": 3}
+    # Same answer for any token
+    assert changes(header, since=0) == before
+
+
+@pytest.mark.show
+def test_changes_require_login():
+    response = client.get("/changes")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,107 @@
+# Libraries
+import pytest
+from uuid import uuid4
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+# Database
+from sql_app.database import Base
+from sql_app.sqlalchemy_models import TweetDB
+
+# Others Tools
+from sql_app import crud
+from sql_app.coalescer import WriteCoalescer
+from models import NewTweet, UserRegister
+
+
+# Fixtures
+@pytest.fixture
+def session_factory(tmp_path):
+    """Own file database: the writer thread cannot share the connection of the test transaction."""
+    engine = create_engine(f"sqlite:///{tmp_path}/coalescer.db", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys = ON")
+
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, expire_on_commit=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def author_id(session_factory):
+    user = UserRegister(
+        first_name="Writer",
+        last_name="Coalesced",
+        email="writer@example.com",
+        password="thisisthewriterpassword",
+        birth_date=date(1995, 5, 5),
+        creation_account_date=date(2022, 1, 1)
+    )
+    db = session_factory()
+    user_id = crud.create_user(db, user, hashed_password="not-a-real-hash").user_id
+    db.close()
+    return user_id
+
+
+# Coalescer Tests
+@pytest.mark.tweet
+@pytest.mark.create
+def test_concurrent_inserts_share_commits(session_factory, author_id):
+    writer = WriteCoalescer(session_factory, max_batch=32, max_wait=0.01)
+    tweets = [NewTweet(content=f"coalesced tweet {number}", user_id=author_id) for number in range(64)]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        db_tweets = list(executor.map(writer.submit, tweets))
+
+    # Every caller gets its own row back
+    assert [db_tweet.content for db_tweet in db_tweets] == [tweet.content for tweet in tweets]
+    assert len({db_tweet.tweet_id for db_tweet in db_tweets}) == 64
+
+    stats = writer.stats()
+    assert stats["rows"] == 64
+    assert stats["batches"] < 64
+
+    db = session_factory()
+    assert db.execute(select(func.count()).select_from(TweetDB)).scalar() == 64
+    db.close()
+
+
+@pytest.mark.tweet
+@pytest.mark.create
+def test_failed_row_does_not_fail_the_batch(session_factory, author_id):
+    writer = WriteCoalescer(session_factory, max_batch=8, max_wait=0.05)
+    good = NewTweet(content="good tweet", user_id=author_id)
+    bad = NewTweet(content="tweet of nobody", user_id=uuid4())
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(writer.submit, tweet) for tweet in (good, bad, good)]
+
+    assert futures[0].result().content == "good tweet"
+    assert futures[2].result().content == "good tweet"
+    with pytest.raises(IntegrityError):
+        futures[1].result()
+
+
+@pytest.mark.tweet
+@pytest.mark.create
+def test_retries_keep_the_tweet_ids(session_factory, author_id, monkeypatch):
+    writer = WriteCoalescer(session_factory, max_batch=8, max_wait=0.05)
+    calls = []
+    create_tweets = crud.create_tweets
+
+    def failing_batch(db, tweets, tweet_ids=None):
+        calls.append(list(tweet_ids))
+        if len(calls) == 1:
+            raise RuntimeError("batch failed")
+        return create_tweets(db, tweets, tweet_ids)
+
+    monkeypatch.setattr(crud, "create_tweets", failing_batch)
+    db_tweet = writer.submit(NewTweet(content="retried tweet", user_id=author_id))
+
+    # The row-by-row retry writes the id queued with the tweet
+    assert calls == [[db_tweet.tweet_id], [db_tweet.tweet_id]]
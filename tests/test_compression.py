@@ -0,0 +1,187 @@
+
+# Libraries
+import pytest
+from fastapi import FastAPI, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from .conftest import client
+
+# App
+from main import app
+
+# Compression
+from compression import CompressionMiddleware, negotiate_encoding, preferred_encodings
+
+
+# Small app to check the middleware on its own
+small_app = FastAPI()
+compression = CompressionMiddleware(small_app, minimum_size=100, route_minimum_sizes={"/big": 10_000})
+
+big_text = "tweet " * 1000
+
+
+@small_app.get("/text")
+def text():
+    return PlainTextResponse(big_text)
+
+
+@small_app.get("/big")
+def big():
+    return PlainTextResponse(big_text)
+
+
+@small_app.get("/stream")
+def stream():
+    def chunks():
+        for number in range(5):
+            yield f"chunk {number} ".encode() * 50
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+@small_app.get("/small-stream")
+def small_stream():
+    def chunks():
+        for number in range(3):
+            yield f"chunk {number} ".encode()
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+small_client = TestClient(compression)
+
+
+def app_compression() -> CompressionMiddleware:
+    """The middleware instance of the app, found down its middleware stack."""
+    client.get("/openapi.json")  # Builds the stack
+    layer = app.middleware_stack
+    while not isinstance(layer, CompressionMiddleware):
+        layer = layer.app
+    return layer
+
+
+# Negotiation Tests
+@pytest.mark.compression
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("*", preferred_encodings[0]),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+# Middleware Tests
+@pytest.mark.compression
+def test_compress_app_responses():
+    response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.json()["info"]["title"] == "TwitterLike"
+
+
+@pytest.mark.compression
+def test_app_thresholds_and_cache():
+    # The middlewares inside the compression send whole bodies in one message
+    response = client.post("/login", data={}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "Content-Encoding" not in response.headers
+    assert int(response.headers["Content-Length"]) == len(response.content)
+    assert "X-Process-Time" in response.headers
+
+    cache = app_compression().cache
+    hits, lookups = cache.hits, cache.hits + cache.misses
+    for _ in range(2):
+        response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" in response.headers
+    assert cache.hits + cache.misses == lookups + 2
+    assert cache.hits >= hits + 1
+
+
+@pytest.mark.compression
+def test_skip_identity_and_small_responses():
+    response = small_client.get("/text", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+    # Route threshold bigger than the body
+    response = small_client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text == big_text
+
+
+@pytest.mark.compression
+def test_compressed_bodies_are_cached():
+    hits = compression.cache.hits
+
+    for _ in range(3):
+        response = small_client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert int(response.headers["Content-Length"]) < len(big_text)
+        assert response.text == big_text
+
+    assert compression.cache.hits == hits + 2
+
+
+@pytest.mark.compression
+def test_stream_compression():
+    response = small_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.text.startswith("chunk 0 ")
+    assert response.text.endswith("chunk 4 ")
+
+    # Streamed bodies that end below the threshold are sent as they are
+    response = small_client.get("/small-stream", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text == "chunk 0 chunk 1 chunk 2 "
+
+
+optional_encodings = pytest.mark.parametrize("encoding, module_name", [("br", "brotli"), ("zstd", "zstandard")])
+
+
+def decoded(response, module) -> str:
+    # The client already decodes brotli, not zstd
+    if response.headers["Content-Encoding"] == "br":
+        return response.text
+    return module.ZstdDecompressor().decompressobj().decompress(response.content).decode()
+
+
+@pytest.mark.compression
+@optional_encodings
+def test_optional_encodings(encoding, module_name):
+    module = pytest.importorskip(module_name)
+
+    response = small_client.get("/text", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    assert decoded(response, module) == big_text
+
+    # Preferred over gzip when installed
+    assert negotiate_encoding(f"gzip, {encoding}") == encoding
+
+
+@pytest.mark.compression
+@optional_encodings
+def test_optional_stream_compression(encoding, module_name):
+    module = pytest.importorskip(module_name)
+
+    response = small_client.get("/stream", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    assert "Content-Length" not in response.headers
+    assert decoded(response, module) == "".join(f"chunk {number} " * 50 for number in range(5))
+
+
+@pytest.mark.compression
+@optional_encodings
+def test_optional_encodings_in_the_app(encoding, module_name):
+    module = pytest.importorskip(module_name)
+
+    response = client.get("/openapi.json", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    assert '"title":"TwitterLike"' in decoded(response, module)
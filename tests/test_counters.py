@@ -0,0 +1,102 @@
+# Libraries
+import pytest
+from fastapi import status
+from .conftest import client
+from sqlalchemy import event
+from .test_sql_app import override_get_db, test_engine
+from .test_admin import admin_header
+
+# Others Tools
+from sql_app import crud, maintenance
+from sql_app.sqlalchemy_models import UserDB
+
+
+# Helpers
+def counters(set_up_users, number):
+    user_id = set_up_users[f"user_{number}"].user_id
+    response = client.get(f"/users/{user_id}", headers=set_up_users["header_1"])
+    assert response.status_code == status.HTTP_200_OK
+
+    user = response.json()
+    return user["tweets_count"], user["followers_count"], user["following_count"], user["last_tweet_at"]
+
+
+# Counters Tests
+@pytest.mark.user
+@pytest.mark.tweet
+def test_tweet_counters(set_up_tweets, set_up_users):
+    tweet_1 = set_up_tweets["user_1"]["tweet_1"]
+    assert counters(set_up_users, 1) == (2, 0, 0, tweet_1["created_at"])
+
+    response = client.delete(f"/tweets/{tweet_1['tweet_id']}/delete", headers=set_up_users["header_1"])
+    assert response.status_code == status.HTTP_200_OK
+    assert counters(set_up_users, 1)[0] == 1
+
+    crud.delete_tweets_by_user(next(override_get_db()), set_up_users["user_1"].user_id)
+    assert counters(set_up_users, 1) == (0, 0, 0, None)
+    # The other user is untouched
+    assert counters(set_up_users, 2)[0] == 2
+
+
+@pytest.mark.user
+def test_follow_counters(set_up_users):
+    user_id = set_up_users["user_1"].user_id
+    for _ in range(2):  # Following twice counts once
+        client.post(f"/users/{user_id}/follow", headers=set_up_users["header_2"])
+
+    assert counters(set_up_users, 1)[1:3] == (1, 0)
+    assert counters(set_up_users, 2)[1:3] == (0, 1)
+
+    client.delete(f"/users/{user_id}/follow", headers=set_up_users["header_2"])
+
+    assert counters(set_up_users, 1)[1:3] == (0, 0)
+    assert counters(set_up_users, 2)[1:3] == (0, 0)
+
+
+@pytest.mark.admin
+def test_reconcile_counters(set_up_tweets, set_up_users, admin_header):
+    test_db = next(override_get_db())
+    user_id = set_up_users["user_2"].user_id
+    client.post(f"/users/{user_id}/follow", headers=set_up_users["header_1"])
+    expected = counters(set_up_users, 2)
+
+    # Drift, as a restore or a manual fix would leave it
+    test_db.query(UserDB).filter(UserDB.user_id == str(user_id)).update(
+        {"tweets_count": 40, "followers_count": 0, "last_tweet_at": None}
+    )
+    test_db.commit()
+
+    response = client.post("/admin/counters/reconcile", params={"batch_size": 1}, headers=admin_header)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"users": 2, "fixed": 1, "skipped": 0}
+    assert counters(set_up_users, 2) == expected
+    assert maintenance.reconcile_counters(test_db)["fixed"] == 0
+
+
+@pytest.mark.admin
+def test_reconcile_keeps_concurrent_writes(set_up_users):
+    test_db = next(override_get_db())
+    user_id = str(set_up_users["user_2"].user_id)
+    test_db.query(UserDB).filter(UserDB.user_id == user_id).update({"followers_count": 40})
+    test_db.commit()
+
+    # A follow commits between the recount and the fix
+    def concurrent_follow(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE USERS"):
+            conn.connection.cursor().execute(
+                "UPDATE users SET followers_count = followers_count + 1 WHERE user_id = ?", (user_id,)
+            )
+
+    event.listen(test_engine, "before_cursor_execute", concurrent_follow)
+    try:
+        assert maintenance.reconcile_counters(test_db) == {"users": 2, "fixed": 0, "skipped": 1}
+    finally:
+        event.remove(test_engine, "before_cursor_execute", concurrent_follow)
+    assert counters(set_up_users, 2)[1] == 41
+
+    # The next run fixes it
+    assert maintenance.reconcile_counters(test_db)["fixed"] == 1
+    test_db.commit()
+    crud.clear_caches()
+    assert counters(set_up_users, 2)[1] == 0
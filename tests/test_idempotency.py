@@ -0,0 +1,245 @@
+
+# Libraries
+import time
+import asyncio
+import pytest
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .conftest import client
+from .test_sql_app import override_get_db
+
+# Idempotency
+from idempotency import IdempotencyMiddleware, IdempotencyStore
+from sql_app.idempotency_keys import DatabaseIdempotencyKeys
+
+# Others Tools
+from sql_app import maintenance
+from sql_app.database import Base
+from sql_app.sqlalchemy_models import IdempotencyKeyDB, TweetDB, UserDB
+
+
+# Small app to check the middleware on its own
+small_app = FastAPI()
+calls = {"slow": 0, "flaky": 0}
+
+
+@small_app.post("/slow")
+async def slow():
+    calls["slow"] += 1
+    await asyncio.sleep(0.2)
+    return {"call": calls["slow"]}
+
+
+@small_app.post("/flaky")
+async def flaky():
+    calls["flaky"] += 1
+    if calls["flaky"] == 1:
+        return JSONResponse({"detail": "database unavailable"}, status_code=500)
+    return {"call": calls["flaky"]}
+
+
+async def call(app, path: str, key: str, body: bytes = b"{}", client_host: str = "test"):
+    """One POST on the ASGI app, returns (status, headers, body)."""
+    scope = {
+        "type": "http", "method": "POST", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("test", 80), "client": (client_host, 1234),
+        "http_version": "1.1", "headers": [(b"idempotency-key", key.encode()), (b"content-type", b"application/json")]
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    return sent[0]["status"], headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+# Fixtures
+@pytest.fixture
+def shared_keys(tmp_path):
+    """The keys table in a database of its own, shared by the workers of a test."""
+    engine = create_engine(f"sqlite:///{tmp_path}/keys.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[IdempotencyKeyDB.__table__])
+    yield DatabaseIdempotencyKeys(sessionmaker(bind=engine))
+    engine.dispose()
+
+
+def workers(shared_keys, path, count=2):
+    return [IdempotencyMiddleware(small_app, paths={path}, shared=shared_keys, poll_interval=0.01)
+            for _ in range(count)]
+
+
+# Helpers
+def post(header, content, key):
+    return client.post("/post", json={"content": content}, headers={**header, "Idempotency-Key": key})
+
+
+# Middleware Tests
+@pytest.mark.idempotency
+def test_concurrent_duplicates_wait_for_the_original():
+    middleware = IdempotencyMiddleware(small_app, paths={"/slow"})
+    calls["slow"] = 0
+
+    async def scenario():
+        return await asyncio.gather(*[call(middleware, "/slow", "retry-storm") for _ in range(5)])
+
+    responses = asyncio.run(scenario())
+
+    assert calls["slow"] == 1
+    assert {body for _, _, body in responses} == {b'{"call":1}'}
+    assert sum(headers.get(b"idempotent-replayed") == b"true" for _, headers, _ in responses) == 4
+    assert middleware.store.stats() == {"keys": 1, "replays": 4, "conflicts": 0}
+
+
+@pytest.mark.idempotency
+def test_server_errors_are_not_stored():
+    middleware = IdempotencyMiddleware(small_app, paths={"/flaky"})
+    calls["flaky"] = 0
+
+    assert asyncio.run(call(middleware, "/flaky", "key"))[0] == 500
+    status_code, _, body = asyncio.run(call(middleware, "/flaky", "key"))
+    assert (status_code, body) == (200, b'{"call":2}')
+    # Stored now
+    assert asyncio.run(call(middleware, "/flaky", "key"))[2] == b'{"call":2}'
+
+
+@pytest.mark.idempotency
+def test_expired_and_evicted_keys():
+    store = IdempotencyStore(ttl=0, max_keys=2)
+    middleware = IdempotencyMiddleware(small_app, paths={"/slow"}, store=store)
+    calls["slow"] = 0
+
+    asyncio.run(call(middleware, "/slow", "key"))
+    asyncio.run(call(middleware, "/slow", "key"))
+    assert calls["slow"] == 2
+
+    store.ttl = 60
+    for key in ("a", "b", "c"):
+        asyncio.run(call(middleware, "/slow", key))
+    assert store.stats()["keys"] == 2
+
+
+@pytest.mark.idempotency
+def test_anonymous_keys_are_scoped_to_the_client():
+    middleware = IdempotencyMiddleware(small_app, paths={"/slow"})
+    calls["slow"] = 0
+
+    # Two anonymous clients picking the same key both run
+    first = asyncio.run(call(middleware, "/slow", "1", client_host="10.0.0.1"))
+    second = asyncio.run(call(middleware, "/slow", "1", b'{"other": 1}', client_host="10.0.0.2"))
+    assert (first[2], second[2]) == (b'{"call":1}', b'{"call":2}')
+    assert asyncio.run(call(middleware, "/slow", "1", client_host="10.0.0.1"))[2] == b'{"call":1}'
+
+
+# Shared Keys Tests
+@pytest.mark.idempotency
+def test_retries_on_another_worker_are_replayed(shared_keys):
+    first, second = workers(shared_keys, "/slow")
+    calls["slow"] = 0
+
+    status_code, _, body = asyncio.run(call(first, "/slow", "moved"))
+    _, headers, replayed = asyncio.run(call(second, "/slow", "moved"))
+    assert (status_code, replayed, calls["slow"]) == (200, body, 1)
+    assert headers[b"idempotent-replayed"] == b"true"
+
+    # Duplicates in flight on two workers, only one runs
+    async def scenario():
+        return await asyncio.gather(call(first, "/slow", "storm"), call(second, "/slow", "storm"))
+
+    assert {body for _, _, body in asyncio.run(scenario())} == {b'{"call":2}'}
+    assert calls["slow"] == 2
+
+    # Another body on the other worker
+    assert asyncio.run(call(second, "/slow", "moved", b'{"other": 1}'))[0] == 422
+
+
+@pytest.mark.idempotency
+def test_shared_keys_of_failed_and_expired_requests(shared_keys):
+    first, second = workers(shared_keys, "/flaky")
+    calls["flaky"] = 0
+
+    # The server error released the key, the retry runs on the other worker
+    assert asyncio.run(call(first, "/flaky", "key"))[0] == 500
+    assert asyncio.run(call(second, "/flaky", "key"))[2] == b'{"call":2}'
+    assert asyncio.run(call(first, "/flaky", "key"))[2] == b'{"call":2}'
+
+    # Expired keys run again and are purged
+    expired = workers(shared_keys, "/flaky")
+    for middleware in expired:
+        middleware.store.ttl = 0
+    asyncio.run(call(expired[0], "/flaky", "short"))
+    asyncio.run(call(expired[1], "/flaky", "short"))
+    assert calls["flaky"] == 4
+
+    with shared_keys.session_factory() as db:
+        assert maintenance.purge_idempotency_keys(db) == {"deleted_keys": 1}
+        db.commit()
+        assert db.query(IdempotencyKeyDB).count() == 1
+
+
+@pytest.mark.idempotency
+def test_stale_claims_are_taken_over(shared_keys):
+    shared_keys.lease = 0.05
+    key, response = ("/slow", "principal", "killed"), (200, [(b"content-type", b"application/json")], b"{}")
+
+    # The worker that claimed the key died, its lease expires long before the ttl
+    assert shared_keys.claim(key, "fingerprint", 60) is None
+    assert shared_keys.claim(key, "fingerprint", 60) == ("fingerprint", None)
+    time.sleep(0.1)
+    assert shared_keys.claim(key, "fingerprint", 60) is None
+
+    # A completed key is kept for the ttl
+    shared_keys.complete(key, response, 60)
+    time.sleep(0.1)
+    assert shared_keys.claim(key, "fingerprint", 60) == ("fingerprint", response)
+
+
+# App Tests
+@pytest.mark.idempotency
+@pytest.mark.tweet
+@pytest.mark.create
+def test_post_retries_insert_once(set_up_users):
+    header = set_up_users["header_1"]
+    first = post(header, "only once", "3f2c9a")
+    retry = post(header, "only once", "3f2c9a")
+
+    assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert next(override_get_db()).query(TweetDB).filter(TweetDB.content == "only once").count() == 1
+
+    # Keys belong to their user
+    other = post(set_up_users["header_2"], "only once", "3f2c9a")
+    assert other.json()["tweet_id"] != first.json()["tweet_id"]
+
+    # Another body with the same key
+    response = post(header, "something else", "3f2c9a")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.idempotency
+@pytest.mark.user
+@pytest.mark.create
+def test_signup_retry_is_replayed(set_up_users):
+    user = {
+        "first_name": "Retry", "last_name": "Storm", "email": "retry@example.com",
+        "password": "thisisthetestpassword", "country": "Peru", "creation_account_date": "2022-01-01"
+    }
+    first = client.post("/signup", json=user, headers={"Idempotency-Key": "signup-1"})
+    retry = client.post("/signup", json=user, headers={"Idempotency-Key": "signup-1"})
+
+    # Not "Email already registered"
+    assert retry.status_code == first.status_code == status.HTTP_201_CREATED
+    assert retry.json() == first.json()
+    assert next(override_get_db()).query(UserDB).filter(UserDB.email == user["email"]).count() == 1
+
+    # Without a key the request runs again
+    response = client.post("/signup", json=user)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,98 @@
+
+# Libraries
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import StaticPool
+
+# Others Tools
+from sql_app import maintenance
+from sql_app.database import Base
+from sql_app.sqlalchemy_models import UserDB
+
+# The tables of the first versions, before the counters, the name keys, the follows and the changes
+OLD_SCHEMA = [
+    """CREATE TABLE users (
+        user_id VARCHAR(50) NOT NULL PRIMARY KEY,
+        first_name VARCHAR(20),
+        last_name VARCHAR(20),
+        email VARCHAR(50),
+        password VARCHAR(100),
+        birth_date DATE,
+        country VARCHAR(20),
+        creation_account_date DATE
+    )""",
+    "CREATE INDEX ix_users_user_id ON users (user_id)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    """CREATE TABLE tweets (
+        tweet_id VARCHAR(50) NOT NULL PRIMARY KEY,
+        content TEXT,
+        created_at DATE,
+        updated_at DATE,
+        user_id VARCHAR(50) REFERENCES users (user_id)
+    )""",
+    "CREATE INDEX ix_tweets_tweet_id ON tweets (tweet_id)",
+    """CREATE TABLE timeline_entries (
+        entry_id INTEGER NOT NULL PRIMARY KEY,
+        user_id VARCHAR(50) NOT NULL REFERENCES users (user_id),
+        position BIGINT NOT NULL,
+        tweet_id VARCHAR(50) NOT NULL,
+        author_id VARCHAR(50) NOT NULL
+    )""",
+    "CREATE INDEX ix_timeline_entries_user_position ON timeline_entries (user_id, position)",
+    "CREATE INDEX ix_timeline_entries_tweet_id ON timeline_entries (tweet_id)",
+    "CREATE INDEX ix_timeline_entries_author_id ON timeline_entries (author_id)",
+    "INSERT INTO users (user_id, first_name, last_name, email) VALUES ('1', 'Ana', 'García', 'ana@example.com')",
+]
+
+
+def schema(connection):
+    inspector = inspect(connection)
+    return {
+        name: (
+            {column["name"] for column in inspector.get_columns(name)},
+            {index["name"] for index in inspector.get_indexes(name)},
+        )
+        for name in inspector.get_table_names()
+    }
+
+
+# Migration Tests
+@pytest.mark.migrate
+def test_migrate_an_old_database():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA:
+            connection.exec_driver_sql(statement)
+
+        report = maintenance.migrate(connection)
+        assert sorted(report["tables"]) == ["changes", "follows", "idempotency_keys"]
+        assert "users.tweets_count" in report["columns"] and "users.reverse_name_key" in report["columns"]
+        assert "ix_users_country_name_key" in report["indexes"]
+        assert "ix_timeline_entries_user_position_tweet" in report["indexes"]
+        assert report["dropped_indexes"] == ["ix_timeline_entries_user_position"]
+
+        # Same columns and indexes as a new database, the old rows get the server defaults
+        migrated = schema(connection)
+        expected = create_engine("sqlite://")
+        Base.metadata.create_all(expected)
+        with expected.connect() as new_connection:
+            assert migrated == schema(new_connection)
+        expected.dispose()
+        row = connection.exec_driver_sql("SELECT tweets_count, fanout_on_read, name_key FROM users").one()
+        assert tuple(row) == (0, 0, None)
+
+        # Nothing left to do the second time
+        assert maintenance.migrate(connection) == {
+            "tables": [], "columns": [], "collations": [], "indexes": [], "dropped_indexes": []
+        }
+    engine.dispose()
+
+
+@pytest.mark.migrate
+@pytest.mark.search
+def test_name_keys_compare_binary_on_mysql():
+    name_key = UserDB.__table__.c.name_key
+    assert "COLLATE utf8mb4_bin" in str(CreateColumn(name_key).compile(dialect=mysql.dialect()))
+    assert str(CreateColumn(name_key).compile(dialect=sqlite.dialect())) == "name_key VARCHAR(41)"
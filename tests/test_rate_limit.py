@@ -0,0 +1,94 @@
+
+# Libraries
+import pytest
+from fastapi import status
+from .conftest import client, user_example
+
+# App
+from main import app
+
+# Rate Limits
+from controllers import rate_limit
+from controllers.rate_limit import RateLimitBackend, MemoryBackend, login_rate_limit, write_rate_limit
+
+
+# Fixtures
+@pytest.fixture
+def enable_rate_limits(monkeypatch):
+    """Fixture to turn on the policies (conftest disables them) with full buckets and no refill."""
+    for policy in (login_rate_limit, write_rate_limit):
+        monkeypatch.setattr(policy, "rate", 1e-6)
+
+    previous_backend = rate_limit.backend
+    rate_limit.set_backend(MemoryBackend())
+    overrides = {policy: app.dependency_overrides.pop(policy) for policy in (login_rate_limit, write_rate_limit)}
+
+    yield
+
+    app.dependency_overrides.update(overrides)
+    rate_limit.set_backend(previous_backend)
+
+
+# Backend Tests
+@pytest.mark.rate_limit
+def test_memory_backend_refills():
+    backend = MemoryBackend()
+
+    assert backend.consume("key", rate=1, capacity=2) == 0
+    assert backend.consume("key", rate=1, capacity=2) == 0
+    assert 0 < backend.consume("key", rate=1, capacity=2) <= 1
+    assert backend.consume("another_key", rate=1, capacity=2) == 0
+
+
+@pytest.mark.rate_limit
+def test_backends_implement_consume():
+    class Incomplete(RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.rate_limit
+def test_memory_backend_is_bounded():
+    backend = MemoryBackend(max_keys=3)
+
+    for number in range(10):
+        backend.consume(f"key_{number}", rate=1, capacity=1)
+
+    assert len(backend._buckets) == 3
+
+
+# Path Operations Tests
+@pytest.mark.rate_limit
+@pytest.mark.auth
+def test_login_rate_limit(enable_rate_limits):
+    credentials = {"username": "notindatabase@example.com", "password": user_example.password}
+
+    for _ in range(login_rate_limit.capacity):
+        response = client.post("/login", data=credentials)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.post("/login", data=credentials)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) > 60
+
+
+@pytest.mark.rate_limit
+@pytest.mark.tweet
+def test_write_rate_limit_by_user(set_up_users, enable_rate_limits):
+    header_1 = set_up_users["header_1"]
+    header_2 = set_up_users["header_2"]
+
+    # Exhaust the write bucket of user_1 with failed deletes
+    tweet_id = "00000000-0000-0000-0000-000000000000"
+    for _ in range(write_rate_limit.capacity):
+        client.delete(f'/tweets/{tweet_id}/delete', headers=header_1)
+
+    response = client.delete(f'/tweets/{tweet_id}/delete', headers=header_1)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert "Retry-After" in response.headers
+
+    # Other users keep their own budget
+    response = client.delete(f'/tweets/{tweet_id}/delete', headers=header_2)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,88 @@
+
+# Libraries
+import pytest
+from sqlalchemy import event
+from fastapi import status
+from .conftest import client
+from .test_sql_app import override_get_db
+
+# Others Tools
+from sql_app import crud
+from sql_app.records import TweetRecord, UserRecord, AuthorRecord
+
+
+# Helpers
+class Statements:
+    """SQL statements run on the test database."""
+
+    def __init__(self, db):
+        self.engine = db.get_bind()
+        self.executed = []
+
+    def record(self, connection, cursor, statement, parameters, context, executemany):
+        self.executed.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self.record)
+        return self.executed
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self.record)
+
+
+# CRUD Tests
+@pytest.mark.records
+@pytest.mark.tweet
+def test_tweets_are_records(set_up_tweets):
+    db = next(override_get_db())
+    db.expunge_all()
+
+    tweets = crud.get_tweets(db)
+
+    assert len(tweets) == 4 and all(type(tweet) is TweetRecord for tweet in tweets)
+    assert len(db.identity_map) == 0  # Nothing hydrated
+    tweet = set_up_tweets["user_1"]["tweet_1"]
+    assert next(record for record in tweets if record.tweet_id == tweet["tweet_id"])._asdict() == {
+        **tweet, "created_at": crud.date.fromisoformat(tweet["created_at"]),
+        "updated_at": crud.date.fromisoformat(tweet["updated_at"]), "user": None
+    }
+
+
+@pytest.mark.records
+@pytest.mark.tweet
+def test_records_select_the_requested_columns(set_up_tweets):
+    db = next(override_get_db())
+    user = set_up_tweets["user_1"]["user_info"]
+    user_id = user.user_id
+
+    with Statements(db) as executed:
+        tweets = crud.get_user_tweets(db, user, fields=["content"], expand_author=True)
+
+    assert "tweets.created_at" not in executed[0] and "tweets.content" in executed[0]
+    assert {tweet.created_at for tweet in tweets} == {None}
+    assert {tweet.user for tweet in tweets} == {AuthorRecord(user_id, "UserTest1", "SomeLastName")}
+    assert len(executed) == 2  # The tweets, then their authors
+
+
+@pytest.mark.records
+@pytest.mark.user
+def test_users_are_records(set_up_users):
+    db = next(override_get_db())
+    db.expunge_all()
+
+    users = crud.get_users(db)
+
+    assert {type(user) for user in users} == {UserRecord}
+    assert len(db.identity_map) == 0
+    assert "password" not in UserRecord._fields
+
+
+# App Tests
+@pytest.mark.records
+@pytest.mark.tweet
+@pytest.mark.show
+def test_home_expands_authors_of_records(set_up_tweets):
+    response = client.get("/", params={"fields": "content", "expand": "author"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {tweet["by"]["first_name"] for tweet in response.json()} == {"UserTest1", "UserTest2"}
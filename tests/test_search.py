@@ -0,0 +1,163 @@
+
+# Libraries
+import pytest
+from uuid import uuid4
+from fastapi import status
+from sqlalchemy import select, update
+from .conftest import client
+from .test_sql_app import override_get_db
+
+# Others Tools
+from models import UserRegister
+from sql_app import crud, maintenance
+from sql_app.sqlalchemy_models import UserDB
+from sql_app.search import normalize_name, name_keys, encode_cursor, decode_cursor
+
+
+def add_users(password_hash, *names):
+    """Users named (first_name, last_name, country), their user_id by "first last"."""
+    db = next(override_get_db())
+    user_ids = {}
+    for first_name, last_name, country in names:
+        user = UserRegister(
+            first_name=first_name,
+            last_name=last_name,
+            email=f"search{uuid4().hex[:12]}@example.com",
+            password="thisisthetestpassword",
+            country=country,
+            creation_account_date="2022-01-01"
+        )
+        user_ids[f"{first_name} {last_name}"] = crud.create_user(db, user, password_hash).user_id
+    return user_ids
+
+
+def search(header, **params):
+    response = client.get("/users/search", params=params, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+
+def full_names(page):
+    return [f'{user["first_name"]} {user["last_name"]}' for user in page["users"]]
+
+
+# Name Keys
+@pytest.mark.search
+def test_name_keys():
+    assert normalize_name("  José \t GARCÍA ") == "jose garcia"
+    assert normalize_name("Straße") == "strasse"
+    assert name_keys("Ana", "García") == {"name_key": "ana garcia", "reverse_name_key": "garcia ana"}
+    assert decode_cursor(encode_cursor(("ana garcia", "some-id"))) == ("ana garcia", "some-id")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+# Search Tests
+@pytest.mark.search
+@pytest.mark.user
+@pytest.mark.show
+def test_search_by_first_or_last_name(set_up_users, fixture_password_hash):
+    add_users(
+        fixture_password_hash,
+        ("Ana", "García", "Peru"),
+        ("Andrés", "Lopez", "Chile"),
+        ("Lucia", "Anaya", "Peru"),
+        ("Ana", "Anaya", "Chile"),
+        ("Bruno", "Diaz", "Peru"),
+    )
+    header = set_up_users["header_1"]
+
+    # By the matching name, case and accents ignored, a user matching by both names comes once
+    assert full_names(search(header, prefix="AN")) == ["Ana Anaya", "Ana García", "Lucia Anaya", "Andrés Lopez"]
+    assert full_names(search(header, prefix="andre")) == ["Andrés Lopez"]
+    assert full_names(search(header, prefix="garcia a")) == ["Ana García"]
+    assert full_names(search(header, prefix="ana g")) == ["Ana García"]
+    assert search(header, prefix="zz") == {"users": [], "next_cursor": None}
+
+    # Country filter
+    assert full_names(search(header, prefix="an", country="Chile")) == ["Ana Anaya", "Andrés Lopez"]
+    # Without a prefix, every user of the country by name
+    assert full_names(search(header, country="Peru")) == [
+        "Ana García", "Bruno Diaz", "Lucia Anaya", "UserTest1 SomeLastName", "UserTest2 SomeLastName"
+    ]
+
+
+@pytest.mark.search
+@pytest.mark.user
+@pytest.mark.show
+def test_search_pages(set_up_users, fixture_password_hash):
+    add_users(fixture_password_hash, *[(f"Name{number}", f"Last{number}", "Peru") for number in range(7)])
+    header = set_up_users["header_1"]
+
+    found, after, pages = [], None, 0
+    while True:
+        params = {"prefix": "name", "limit": 3}
+        if after is not None:
+            params["after"] = after
+        page = search(header, **params)
+        found += full_names(page)
+        pages += 1
+        after = page["next_cursor"]
+        if after is None:
+            break
+
+    assert found == [f"Name{number} Last{number}" for number in range(7)]
+    assert pages == 3
+
+    # Both name orders page together: "name zed" comes before "name0 last0"
+    add_users(fixture_password_hash, ("Zed", "Name", "Peru"))
+    first = search(header, prefix="name", limit=7)
+    assert full_names(first) == ["Zed Name"] + [f"Name{number} Last{number}" for number in range(6)]
+    assert full_names(search(header, prefix="name", limit=7, after=first["next_cursor"])) == ["Name6 Last6"]
+
+
+@pytest.mark.search
+@pytest.mark.user
+@pytest.mark.show
+def test_search_fields_and_errors(set_up_users):
+    header = set_up_users["header_1"]
+
+    page = search(header, prefix="usertest2", fields="first_name")
+    assert page == {"users": [{"first_name": "UserTest2"}], "next_cursor": None}
+
+    response = client.get("/users/search", params={"after": "###"}, headers=header)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.get("/users/search", params={"prefix": "user"}).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.search
+@pytest.mark.user
+@pytest.mark.update
+def test_search_follows_updates(set_up_users):
+    header = set_up_users["header_1"]
+    user = set_up_users["user_1"]
+
+    response = client.put(
+        f"/users/{user.user_id}/update",
+        json={
+            "first_name": "Renamed",
+            "last_name": "Person",
+            "email": user.email,
+            "password": "thisisthetestpassword",
+            "creation_account_date": "2022-01-01"
+        },
+        headers=header
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    assert full_names(search(header, prefix="person")) == ["Renamed Person"]
+    assert search(header, prefix="usertest1")["users"] == []
+
+
+@pytest.mark.search
+@pytest.mark.user
+def test_index_user_names(set_up_users):
+    db = next(override_get_db())
+    # Rows written before the search, or by manual SQL
+    db.execute(update(UserDB).values(name_key=None, reverse_name_key=None))
+
+    assert maintenance.index_user_names(db, batch_size=1) == {"users": 2, "fixed": 2}
+    assert maintenance.index_user_names(db) == {"users": 2, "fixed": 0}
+    user_id = set_up_users["user_2"].user_id
+    reverse_name_key = db.execute(select(UserDB.reverse_name_key).where(UserDB.user_id == user_id)).scalar()
+    assert reverse_name_key == "somelastname usertest2"
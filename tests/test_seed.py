@@ -0,0 +1,80 @@
+# Libraries
+import pytest
+from datetime import date
+from collections import Counter
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+
+# Database
+from sql_app.database import Base
+from sql_app.sqlalchemy_models import UserDB, TweetDB
+
+# Others Tools
+from sql_app.hashing import verify_password
+from sql_app.seed import seed_database, insert_statement, DEFAULT_PASSWORD, MAX_TWEET_LENGTH
+
+TODAY = date(2022, 10, 1)
+
+
+# Helpers
+def seeded_rows(seed: int, batch_size: int):
+    """Seed a brand new in-memory database and read every row back."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    with engine.connect() as connection:
+        report = seed_database(connection, users=200, tweets=3000, seed=seed, batch_size=batch_size, today=TODAY)
+        users = connection.execute(select(UserDB.__table__).order_by(UserDB.user_id)).all()
+        tweets = connection.execute(select(TweetDB.__table__).order_by(TweetDB.tweet_id)).all()
+
+    engine.dispose()
+    return report, users, tweets
+
+
+# Seeder Tests
+@pytest.mark.seed
+def test_seed_is_deterministic():
+    report, users, tweets = seeded_rows(seed=1, batch_size=1000)
+    _, same_users, same_tweets = seeded_rows(seed=1, batch_size=700)
+    _, other_users, _ = seeded_rows(seed=2, batch_size=1000)
+
+    assert report["users"]["rows"] == len(users) == 200
+    assert report["tweets"]["rows"] == len(tweets) == 3000
+    assert users == same_users
+    assert tweets == same_tweets
+    assert users != other_users
+
+
+@pytest.mark.seed
+def test_seed_dataset_shape():
+    _, users, tweets = seeded_rows(seed=1, batch_size=1000)
+
+    assert len({user.email for user in users}) == len(users)
+    assert verify_password(DEFAULT_PASSWORD, users[0].password)
+    assert all(0 < len(tweet.content) <= MAX_TWEET_LENGTH for tweet in tweets)
+    assert any("#" in tweet.content for tweet in tweets)
+
+    # Zipf: the most active user writes far more than an average one
+    tweets_per_user = Counter(tweet.user_id for tweet in tweets)
+    assert tweets_per_user.most_common(1)[0][1] > 10 * len(tweets) / len(users)
+
+    signups = {user.user_id: user.creation_account_date for user in users}
+    assert all(signups[tweet.user_id] <= tweet.created_at <= tweet.updated_at <= TODAY for tweet in tweets)
+
+    # The bulk load fills the denormalized counters too
+    assert all(user.tweets_count == tweets_per_user[user.user_id] for user in users)
+
+
+@pytest.mark.seed
+def test_insert_statement_binds_by_position():
+    columns = ["user_id", "email"]
+
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        assert insert_statement(connection, UserDB.__table__, columns) == "INSERT INTO users (user_id, email) VALUES (?, ?)"
+
+    # Rows are tuples, a driver binding by name cannot take them
+    engine = create_engine("sqlite://", paramstyle="named")
+    with engine.connect() as connection:
+        with pytest.raises(RuntimeError):
+            insert_statement(connection, UserDB.__table__, columns)
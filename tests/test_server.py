@@ -0,0 +1,59 @@
+# Libraries
+import pytest
+from anyio.to_thread import current_default_thread_limiter
+from fastapi.testclient import TestClient
+
+# App
+import main
+from server import parse_args, gunicorn_options, post_fork, cache_bus_directory
+
+
+# Launcher Tests
+@pytest.mark.server
+def test_gunicorn_options_from_environment(monkeypatch):
+    monkeypatch.setenv("PORT", "9000")
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("MAX_REQUESTS", "500")
+    monkeypatch.setenv("REUSE_PORT", "0")
+
+    options = gunicorn_options(parse_args([]))
+
+    assert options["bind"] == "0.0.0.0:9000"
+    assert options["workers"] == 3
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert options["max_requests"] == 500
+    assert options["preload_app"] is True
+    assert options["reuse_port"] is False
+    assert options["post_fork"] is post_fork
+
+
+@pytest.mark.server
+def test_command_line_overrides_environment(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+
+    options = gunicorn_options(parse_args(["--workers", "5", "--no-preload", "--max-requests", "0"]))
+
+    assert options["workers"] == 5
+    assert options["preload_app"] is False
+    assert options["max_requests"] == 0
+
+
+@pytest.mark.server
+def test_cache_bus_with_several_workers(monkeypatch):
+    monkeypatch.delenv("CACHE_BUS_DIR", raising=False)
+
+    assert cache_bus_directory(parse_args(["--workers", "1"])) is None
+    assert cache_bus_directory(parse_args(["--workers", "4", "--port", "9000"])).endswith("twitter-api-9000-cache-bus")
+
+    monkeypatch.setenv("CACHE_BUS_DIR", "/run/twitter-api")
+    assert cache_bus_directory(parse_args(["--workers", "4"])) == "/run/twitter-api"
+
+
+@pytest.mark.server
+def test_thread_pool_size_on_startup(monkeypatch):
+    monkeypatch.setattr(main, "THREAD_POOL_SIZE", 7)
+
+    with TestClient(main.app) as client:
+        total_tokens = client.portal.call(lambda: current_default_thread_limiter().total_tokens)
+
+    assert total_tokens == 7
@@ -0,0 +1,246 @@
+# Libraries
+import gzip
+import json
+import pytest
+from uuid import uuid4
+from datetime import date
+from fastapi import status
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import StaticPool
+from .conftest import client
+from .test_sql_app import override_get_db
+from .test_admin import admin_header
+
+# Others Tools
+from models import NewTweet
+from sql_app import crud, maintenance
+from sql_app.database import Base
+from sql_app.seed import seed_database
+from sql_app.sharding import HashRing, ShardRouter, parse_shards, reshard
+from sql_app.sqlalchemy_models import TweetDB, UserDB
+
+
+# Fixtures
+def sqlite_shards(tmp_path, *names):
+    return {name: f"sqlite:///{tmp_path}/{name}.db" for name in names}
+
+
+@pytest.fixture
+def shards(tmp_path):
+    router = ShardRouter(sqlite_shards(tmp_path, "shard0", "shard1", "shard2"))
+    router.create_all()
+    yield router
+    router.dispose()
+
+
+@pytest.fixture
+def sharded(shards, monkeypatch):
+    """The app with its tweets in three SQLite files."""
+    monkeypatch.setattr(crud, "tweet_shards", shards)
+    return shards
+
+
+# Helpers
+def shard_tweet_ids(router: ShardRouter, name: str):
+    with router.session(name) as db:
+        return {tweet_id for tweet_id, in db.query(TweetDB.tweet_id)}
+
+
+def post(header, content, created_at):
+    response = client.post("/post", json={"content": content, "created_at": created_at}, headers=header)
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+# Ring Tests
+@pytest.mark.sharding
+def test_ring_moves_only_the_users_of_a_new_shard():
+    user_ids = [str(uuid4()) for _ in range(4000)]
+    before = HashRing(["shard0", "shard1", "shard2"])
+    after = HashRing(["shard0", "shard1", "shard2", "shard3"])
+
+    moved = [user_id for user_id in user_ids if before.node_for(user_id) != after.node_for(user_id)]
+
+    assert all(after.node_for(user_id) == "shard3" for user_id in moved)
+    assert 0.15 < len(moved) / len(user_ids) < 0.35  # About 1/4
+    for name in before.names:
+        assert 0.2 < sum(before.node_for(user_id) == name for user_id in user_ids) / len(user_ids) < 0.47
+
+
+@pytest.mark.sharding
+def test_parse_shards():
+    assert parse_shards("a=sqlite:///a.db, b=mysql://root:pw@db/twitter?charset=utf8") == {
+        "a": "sqlite:///a.db", "b": "mysql://root:pw@db/twitter?charset=utf8"
+    }
+    assert parse_shards("sqlite:///one.db") == {"shard0": "sqlite:///one.db"}
+
+
+@pytest.mark.sharding
+def test_add_tweets_skips_the_ids_already_there(shards):
+    user_id = str(uuid4())
+
+    def rows():
+        return [TweetDB(tweet_id=tweet_id, content="same row", created_at=date(2022, 1, 1), user_id=user_id)
+                for tweet_id in ("tweet-a", "tweet-b")]
+
+    shards.add_tweets(rows()[:1])
+    shards.add_tweets(rows())  # A retry after a partial write
+
+    assert shard_tweet_ids(shards, shards.shard_for(user_id)) == {"tweet-a", "tweet-b"}
+
+
+# Sharded App Tests
+@pytest.mark.sharding
+@pytest.mark.tweet
+def test_tweets_on_shards(sharded, set_up_users):
+    tweets = [
+        post(set_up_users["header_1"], "oldest", "2022-01-01"),
+        post(set_up_users["header_2"], "newest", "2022-03-01"),
+        post(set_up_users["header_1"], "middle", "2022-02-01"),
+    ]
+
+    # Each tweet is only in the shard of its author, none in the main database
+    for tweet in tweets:
+        holders = [name for name in sharded.engines if tweet["tweet_id"] in shard_tweet_ids(sharded, name)]
+        assert holders == [sharded.shard_for(tweet["user_id"])]
+    assert next(override_get_db()).query(TweetDB).count() == 0
+
+    # Scatter-gather, newest first
+    response = client.get("/")
+    assert [tweet["content"] for tweet in response.json()] == ["newest", "middle", "oldest"]
+    response = client.get("/", params={"fields": "content", "expand": "author"})
+    assert response.json()[0]["by"]["first_name"] == "UserTest2"
+
+    # Single user reads
+    response = client.get("/tweets/me", headers=set_up_users["header_1"])
+    assert sorted(tweet["content"] for tweet in response.json()) == ["middle", "oldest"]
+    response = client.get(f"/tweets/{tweets[1]['tweet_id']}")
+    assert response.json() == tweets[1]
+
+    # Home timeline entries are read from the main database, their tweets from the shards
+    user_id = str(set_up_users["user_1"].user_id)
+    entries, _ = crud.get_home_timeline(next(override_get_db()), user_id)
+    assert [db_tweet.content for _, db_tweet in entries] == ["middle", "oldest"]
+
+
+@pytest.mark.sharding
+@pytest.mark.delete
+def test_writes_on_shards(sharded, set_up_users):
+    header = set_up_users["header_1"]
+    first = post(header, "first", "2022-01-01")
+    second = post(header, "second", "2022-02-01")
+
+    response = client.put(f"/tweets/{first['tweet_id']}/update", json={"content": "edited"}, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["content"] == "edited"
+
+    response = client.delete(f"/tweets/{second['tweet_id']}/delete", headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get(f"/tweets/{second['tweet_id']}").status_code == status.HTTP_404_NOT_FOUND
+
+    user = client.get("/users/me", headers=header).json()
+    assert (user["tweets_count"], user["last_tweet_at"]) == (1, str(date.today()))
+    # Recounted from the shards
+    assert maintenance.reconcile_counters(next(override_get_db()))["fixed"] == 0
+
+    crud.delete_tweets_by_user(next(override_get_db()), str(set_up_users["user_1"].user_id))
+    assert client.get("/").json() == []
+
+
+@pytest.mark.sharding
+@pytest.mark.create
+def test_failed_writes_leave_no_tweet_on_shards(sharded, set_up_users, monkeypatch):
+    user_id = set_up_users["user_1"].user_id
+    db = next(override_get_db())
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("main database down")
+
+    monkeypatch.setattr(crud, "record_changes", broken)
+    with pytest.raises(RuntimeError):
+        crud.create_tweet(db, NewTweet(content="lost tweet", user_id=user_id))
+    with pytest.raises(RuntimeError):
+        crud.create_tweets(db, [NewTweet(content=f"lost tweet {number}", user_id=user_id) for number in range(3)])
+
+    assert sharded.get_tweets() == []
+    assert client.get("/users/me", headers=set_up_users["header_1"]).json()["tweets_count"] == 0
+
+
+@pytest.mark.sharding
+@pytest.mark.admin
+def test_export_and_restore_on_shards(sharded, set_up_users, admin_header):
+    tweets = [post(set_up_users[f"header_{number}"], f"tweet {number}", "2022-01-01") for number in (1, 2)]
+
+    response = client.get("/admin/export/tweets", headers=admin_header)
+    assert response.status_code == status.HTTP_200_OK
+    rows = [json.loads(line) for line in gzip.decompress(response.content).decode().splitlines()]
+    assert sorted(row["tweet_id"] for row in rows) == sorted(tweet["tweet_id"] for tweet in tweets)
+
+    for number in (1, 2):
+        sharded.delete_tweets(str(set_up_users[f"user_{number}"].user_id))
+    response = client.post(
+        "/admin/restore/tweets",
+        files={"file": ("tweets.ndjson.gz", response.content, "application/gzip")},
+        headers=admin_header
+    )
+    assert response.json()["rows"] == 2
+
+    # Back in the shards of their authors, none in the main database
+    for tweet in tweets:
+        assert tweet["tweet_id"] in shard_tweet_ids(sharded, sharded.shard_for(tweet["user_id"]))
+    assert next(override_get_db()).query(TweetDB).count() == 0
+
+
+@pytest.mark.sharding
+@pytest.mark.seed
+def test_seed_on_shards(sharded):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    with engine.connect() as connection:
+        report = seed_database(connection, users=50, tweets=600, batch_size=100, today=date(2022, 10, 1))
+        assert connection.execute(select(TweetDB.__table__)).first() is None
+        counts = dict(connection.execute(select(UserDB.user_id, UserDB.tweets_count)).all())
+    engine.dispose()
+
+    assert report["tweets"]["rows"] == 600
+    tweets = sharded.get_tweets()
+    assert len(tweets) == 600
+    assert all(tweet.tweet_id in shard_tweet_ids(sharded, sharded.shard_for(tweet.user_id)) for tweet in tweets)
+    assert sum(counts.values()) == 600  # Counted from the shards
+
+
+# Resharding Tests
+@pytest.mark.sharding
+def test_reshard_to_a_new_shard(tmp_path):
+    # From one database to two shards, then to three
+    single = ShardRouter(sqlite_shards(tmp_path, "main"))
+    two = ShardRouter(sqlite_shards(tmp_path, "shard0", "shard1"))
+    three = ShardRouter(sqlite_shards(tmp_path, "shard0", "shard1", "shard2"))
+    for router in (single, two, three):
+        router.create_all()
+
+    user_ids = [str(uuid4()) for _ in range(50)]
+    single.add_tweets([
+        TweetDB(tweet_id=str(uuid4()), content=f"tweet {number}", created_at=date(2022, 1, 1),
+                updated_at=date(2022, 1, 1), user_id=user_ids[number % 50])
+        for number in range(300)
+    ])
+    assert reshard(single, two, batch_size=64)["moved"] == 300
+
+    before = {name: shard_tweet_ids(two, name) for name in two.engines}
+    report = reshard(two, three, batch_size=64)
+
+    after = {name: shard_tweet_ids(three, name) for name in three.engines}
+    assert sum(len(tweet_ids) for tweet_ids in after.values()) == 300
+    assert report["moved"] == len(after["shard2"]) > 0
+    # Nothing moved between the shards that were already there
+    assert after["shard0"] <= before["shard0"] and after["shard1"] <= before["shard1"]
+    for tweet in three.get_tweets():
+        assert tweet.tweet_id in after[three.shard_for(tweet.user_id)]
+
+    # Nothing left to move
+    assert reshard(two, three)["moved"] == 0
+
+    for router in (single, two, three):
+        router.dispose()
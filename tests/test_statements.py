@@ -0,0 +1,58 @@
+
+# Libraries
+import pytest
+from uuid import uuid4
+from .test_sql_app import override_get_db
+
+# Others Tools
+from sql_app import crud
+
+
+# Fixtures
+@pytest.fixture
+def no_caches(monkeypatch):
+    """Lookups straight to the database."""
+    monkeypatch.setattr(crud, "tweet_cache", None)
+    monkeypatch.setattr(crud, "user_cache", None)
+
+
+# Statement Tests
+@pytest.mark.statements
+@pytest.mark.user
+def test_user_lookups_bind_every_call(no_caches, set_up_users):
+    db = next(override_get_db())
+    first, second = set_up_users["user_1"], set_up_users["user_2"]
+
+    # Same statement, new values each time
+    assert crud.get_user_by_email(db, first.email).user_id == first.user_id
+    assert crud.get_user_by_email(db, second.email).user_id == second.user_id
+    assert crud.get_user_by_email(db, "nobody@example.com") is None
+
+    assert crud.get_user_by_id(db, second.user_id).email == second.email
+    assert crud.get_user_by_id(db, first.user_id).email == first.email
+    assert set(crud.load_users(db, [first.user_id, second.user_id])) == {first.user_id, second.user_id}
+    assert set(crud.load_users(db, [second.user_id, str(uuid4())])) == {second.user_id}
+
+
+@pytest.mark.statements
+@pytest.mark.tweet
+def test_tweet_lookups_bind_every_call(no_caches, set_up_tweets):
+    db = next(override_get_db())
+    tweets = [set_up_tweets[user][tweet] for user in ("user_1", "user_2") for tweet in ("tweet_1", "tweet_2")]
+
+    for tweet in tweets:
+        assert crud.get_tweet_by_id(db, tweet["tweet_id"]).content == tweet["content"]
+    assert crud.get_tweet_by_id(db, str(uuid4())) is None
+
+    tweet_ids = [tweet["tweet_id"] for tweet in tweets]
+    assert set(crud.load_tweets(db, tweet_ids[:1])) == set(tweet_ids[:1])
+    assert set(crud.load_tweets(db, tweet_ids)) == set(tweet_ids)
+
+
+@pytest.mark.statements
+def test_statements_are_cached():
+    # One construct per call site, whatever the values
+    first, second = crud.user_by_email("a@example.com"), crud.user_by_email("b@example.com")
+
+    assert first._generate_cache_key().key == second._generate_cache_key().key
+    assert crud.tweet_by_id("a")._generate_cache_key().key != first._generate_cache_key().key
@@ -0,0 +1,136 @@
+# Libraries
+import json
+import asyncio
+import threading
+import pytest
+from fastapi import status
+from .conftest import client
+
+# App
+from main import app
+
+# Others Tools
+from sql_app.hub import BroadcastHub, HubFull, RESYNC, sse_message, tweet_hub
+
+
+# Helpers
+def in_thread(function, *args):
+    """Run a blocking call (a request, a write) outside of the event loop, like a worker thread would."""
+    thread = threading.Thread(target=function, args=args)
+    thread.start()
+    return thread
+
+
+def parse(message: bytes):
+    event, data = message.decode().strip().split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+async def open_stream(header: dict, on_start, events: int):
+    """Drive GET /stream as an ASGI server would, until `events` events arrived, then disconnect."""
+    disconnected = asyncio.Event()
+    chunks, start, requests = [], {}, [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message.get("body"):
+            chunks.append(message["body"])
+            if len(chunks) == 1:
+                on_start()
+            elif len(chunks) > events:
+                disconnected.set()
+
+    headers = [(key.lower().encode(), value.encode()) for key, value in header.items()]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/stream", "raw_path": b"/stream", "query_string": b"", "root_path": "",
+        "headers": headers + [(b"host", b"testserver"), (b"accept-encoding", b"gzip")],
+        "client": ("testclient", 50000), "server": ("testserver", 80)
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    return start, chunks
+
+
+# Hub Tests
+@pytest.mark.stream
+def test_publish_from_threads():
+    hub = BroadcastHub(max_queue=10)
+
+    async def scenario():
+        first, second = hub.subscribe(), hub.subscribe()
+        in_thread(hub.publish, [sse_message("create", {"tweet_id": 1})]).join()
+        received = [await asyncio.wait_for(subscription.get(), 1) for subscription in (first, second)]
+        first.close()
+        return received
+
+    assert [parse(message) for message in asyncio.run(scenario())] == [("create", {"tweet_id": 1})] * 2
+    assert hub.stats() == {"subscribers": 1, "published": 1, "overflows": 0}
+
+
+@pytest.mark.stream
+def test_slow_consumer_gets_resync():
+    hub = BroadcastHub(max_queue=2)
+
+    async def scenario():
+        subscription = hub.subscribe()
+        hub.publish([sse_message("create", {"tweet_id": number}) for number in range(3)])
+        await asyncio.sleep(0)  # Let the loop deliver
+        hub.publish([sse_message("create", {"tweet_id": 3})])  # Ignored after the overflow
+        await asyncio.sleep(0)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+    assert asyncio.run(scenario()) == [RESYNC]
+    assert hub.overflows == 1
+
+
+@pytest.mark.stream
+def test_subscribers_limit():
+    hub = BroadcastHub(max_subscribers=1)
+
+    async def scenario():
+        hub.subscribe()
+        with pytest.raises(HubFull):
+            hub.subscribe()
+
+    asyncio.run(scenario())
+
+
+# Stream Tests
+@pytest.mark.stream
+@pytest.mark.tweet
+def test_stream_pushes_tweet_writes(set_up_users):
+    header = set_up_users["header_1"]
+    posted = {}
+
+    def write():
+        posted.update(client.post("/post", json={"content": "live tweet"}, headers=header).json())
+        client.delete(f"/tweets/{posted['tweet_id']}/delete", headers=header)
+
+    writers = []
+    start, chunks = asyncio.run(open_stream(header, on_start=lambda: writers.append(in_thread(write)), events=2))
+    writers[0].join()  # The events are published before the responses are sent
+
+    headers = dict(start["headers"])
+    assert start["status"] == status.HTTP_200_OK
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    assert b"content-encoding" not in headers  # Never buffered by the compression
+    assert chunks[0].startswith(b"retry:")
+
+    (created, tweet), (deleted, tweet_id) = [parse(chunk) for chunk in chunks[1:]]
+    assert (created, tweet["content"], tweet["tweet_id"]) == ("create", "live tweet", posted["tweet_id"])
+    assert (deleted, tweet_id) == ("delete", {"tweet_id": posted["tweet_id"]})
+    # The stream unsubscribed when the client left
+    assert tweet_hub.subscribers == 0
+
+
+@pytest.mark.stream
+def test_stream_requires_login():
+    response = client.get("/stream")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,219 @@
+# Libraries
+import pytest
+from fastapi import status
+from sqlalchemy import insert
+from .conftest import client
+from .test_sql_app import override_get_db
+from .test_archive import archive
+
+# Models
+from models import Timeline
+
+# Others Tools
+from sql_app import crud, maintenance
+from sql_app.sqlalchemy_models import TimelineEntryDB
+
+
+# Helpers
+def post(header, content):
+    response = client.post("/post", json={"content": content}, headers=header)
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()
+
+
+def timeline(header, **params):
+    response = client.get("/timeline", params=params, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    return Timeline(**response.json())
+
+
+def timeline_contents(header, **params):
+    return [tweet.content for tweet in timeline(header, **params).tweets]
+
+
+def follow(set_up_users, follower, followed):
+    user_id = set_up_users[f"user_{followed}"].user_id
+    return client.post(f"/users/{user_id}/follow", headers=set_up_users[f"header_{follower}"])
+
+
+# Follow Tests
+@pytest.mark.user
+@pytest.mark.create
+def test_follow_user(set_up_users):
+    response = follow(set_up_users, follower=2, followed=1)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"user_id": set_up_users["user_1"].user_id, "following": True}
+
+    # Following twice changes nothing
+    assert follow(set_up_users, follower=2, followed=1).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.user
+@pytest.mark.create
+def test_follow_failed(set_up_users):
+    response = follow(set_up_users, follower=1, followed=1)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "You can't follow yourself!"
+
+    response = client.post(f"/users/{'0' * 36}/follow", headers=set_up_users["header_1"])
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.user
+@pytest.mark.delete
+def test_unfollow_user(set_up_tweets, set_up_users):
+    follow(set_up_users, follower=2, followed=1)
+    user_id = set_up_users["user_1"].user_id
+
+    response = client.delete(f"/users/{user_id}/follow", headers=set_up_users["header_2"])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["following"] is False
+
+    # The tweets of user_1 leave the timeline of user_2
+    assert all("User_1" not in content for content in timeline_contents(set_up_users["header_2"]))
+
+    response = client.delete(f"/users/{user_id}/follow", headers=set_up_users["header_2"])
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Timeline Tests
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_fan_out_on_write(set_up_users):
+    header_1, header_2 = set_up_users["header_1"], set_up_users["header_2"]
+    follow(set_up_users, follower=2, followed=1)
+
+    post(header_2, "user_2 own tweet")
+    post(header_1, "user_1 tweet for its followers")
+
+    assert timeline_contents(header_2) == ["user_1 tweet for its followers", "user_2 own tweet"]
+    # user_1 does not follow user_2
+    assert timeline_contents(header_1) == ["user_1 tweet for its followers"]
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_backfill_on_follow(set_up_tweets, set_up_users):
+    follow(set_up_users, follower=2, followed=1)
+
+    contents = timeline_contents(set_up_users["header_2"])
+
+    assert len(contents) == 4
+    assert contents[0].startswith("Second Test Tweet Text from User_2")
+    assert sum("User_1" in content for content in contents) == 2
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_pagination(set_up_users):
+    header = set_up_users["header_1"]
+    for number in range(5):
+        post(header, f"tweet {number}")
+
+    contents = []
+    page = timeline(header, limit=2)
+    contents += [tweet.content for tweet in page.tweets]
+    while page.next_cursor is not None:
+        page = timeline(header, limit=2, before=page.next_cursor)
+        contents += [tweet.content for tweet in page.tweets]
+
+    assert contents == [f"tweet {number}" for number in reversed(range(5))]
+
+
+def pages(header, limit):
+    """Every page of the timeline, following next_cursor."""
+    result = [timeline(header, limit=limit)]
+    while result[-1].next_cursor is not None:
+        result.append(timeline(header, limit=limit, before=result[-1].next_cursor))
+    return result
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_pagination_with_equal_positions(set_up_users):
+    header = set_up_users["header_1"]
+    user_id = set_up_users["user_1"].user_id
+    tweets = [post(header, f"tweet {number}") for number in range(3)]
+
+    # Entries written by two workers in the same microsecond
+    db = next(override_get_db())
+    db.query(TimelineEntryDB).filter(TimelineEntryDB.user_id == user_id).update({"position": 1000})
+    db.commit()
+
+    contents = [tweet.content for page in pages(header, limit=1) for tweet in page.tweets]
+    expected = sorted(tweets, key=lambda tweet: tweet["tweet_id"], reverse=True)
+    assert contents == [tweet["content"] for tweet in expected]
+
+    # Cursors of the position alone still work
+    assert timeline_contents(header, before="1001") == contents
+    response = client.get("/timeline", params={"before": "not-a-cursor"}, headers=header)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_pages_of_missing_tweets(set_up_users, archive):
+    header = set_up_users["header_1"]
+    user_id = set_up_users["user_1"].user_id
+    for number in range(2):
+        post(header, f"tweet {number}")
+
+    # Newer entries whose tweets are nowhere (neither hot nor archived)
+    db = next(override_get_db())
+    db.execute(insert(TimelineEntryDB.__table__), [
+        {"user_id": user_id, "position": 2 ** 62 + number, "tweet_id": f"gone-{number}", "author_id": user_id}
+        for number in range(2)
+    ])
+    db.commit()
+
+    result = pages(header, limit=2)
+
+    assert result[0].tweets == [] and result[0].next_cursor is not None
+    assert [tweet.content for page in result for tweet in page.tweets] == ["tweet 1", "tweet 0"]
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_timeline_fan_out_on_read(set_up_users, monkeypatch):
+    # Any follower makes user_1 too popular to copy its tweets
+    monkeypatch.setattr(crud, "TIMELINE_FANOUT_LIMIT", 1)
+    header_1, header_2 = set_up_users["header_1"], set_up_users["header_2"]
+    test_db = next(override_get_db())
+
+    early = post(header_1, "tweet before the follow")
+    follow(set_up_users, follower=2, followed=1)
+    late = post(header_1, "tweet after the follow")
+
+    # Only the author's own entry was written
+    entries = test_db.query(TimelineEntryDB).filter(TimelineEntryDB.tweet_id == late["tweet_id"]).all()
+    assert [entry.user_id for entry in entries] == [set_up_users["user_1"].user_id]
+
+    # Still merged in the follower's timeline, without duplicates
+    assert [str(tweet.tweet_id) for tweet in timeline(set_up_users["header_2"]).tweets] == [
+        late["tweet_id"], early["tweet_id"]
+    ]
+
+
+@pytest.mark.delete
+@pytest.mark.tweet
+def test_deleted_tweet_leaves_timelines(set_up_users):
+    follow(set_up_users, follower=2, followed=1)
+    tweet = post(set_up_users["header_1"], "short lived tweet")
+
+    response = client.delete(f"/tweets/{tweet['tweet_id']}/delete", headers=set_up_users["header_1"])
+    assert response.status_code == status.HTTP_200_OK
+
+    assert timeline_contents(set_up_users["header_2"]) == []
+
+
+@pytest.mark.tweet
+def test_trim_timelines(set_up_users):
+    header = set_up_users["header_1"]
+    for number in range(4):
+        post(header, f"tweet {number}")
+
+    report = maintenance.trim_timelines(next(override_get_db()), max_length=3)
+
+    assert report == {"timelines": 1, "deleted_entries": 1}
+    assert timeline_contents(header) == ["tweet 3", "tweet 2", "tweet 1"]
@@ -1,13 +1,19 @@
 
 # Libraries
 import pytest
-from uuid import UUID
+from uuid import UUID, uuid4
 from datetime import date
 from fastapi import status
+from sqlalchemy import event
 from .conftest import client
+from .test_sql_app import test_engine, override_get_db
 
 # Models
-from models import Tweet
+from models import Tweet, TweetWithAuthor
+
+# Others Tools
+from sql_app import crud
+from sql_app.sqlalchemy_models import TweetDB
 
 
 # Show tweets Tests
@@ -74,6 +80,97 @@ def test_show_tweet_by_id_failed(set_up_tweets):
     assert response_info['detail'] == "Tweet not found!"
 
 
+@pytest.mark.show
+@pytest.mark.tweet
+def test_show_tweets_with_fields(set_up_tweets):
+    user = set_up_tweets['user_1']
+    header = user['header']
+    tweet = user['tweet_1']
+
+    fields = ["tweet_id", "content", "created_at"]
+
+    response = client.get('/', params={"fields": ",".join(fields)})
+    assert response.status_code == status.HTTP_200_OK
+    for tweet_dict_info in response.json():
+        assert list(tweet_dict_info) == fields
+
+    response = client.get('/tweets/me', params={"fields": "content"}, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    assert {"content": tweet["content"]} in response.json()
+
+    response = client.get(f'/tweets/{tweet["tweet_id"]}', params={"fields": ",".join(fields)})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {field: tweet[field] for field in fields}
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+@pytest.mark.parametrize("fields", ["password", "content,by", ","])
+def test_show_tweets_with_invalid_fields(fields):
+    response = client.get('/', params={"fields": fields})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_show_tweets_expand_author(set_up_tweets):
+    user = set_up_tweets['user_1']
+    user_info = user['user_info']
+    header = user['header']
+
+    # Count the SELECTs issued while serving the page
+    statements = []
+
+    def count_selects(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", count_selects)
+    try:
+        response = client.get('/', params={"expand": "author"})
+    finally:
+        event.remove(test_engine, "before_cursor_execute", count_selects)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) >= 4
+    assert len(statements) == 2  # Tweets page + one IN query for all the authors
+
+    for tweet_dict_info in response.json():
+        TweetWithAuthor(**tweet_dict_info)
+
+    response = client.get('/tweets/me', params={"expand": "author", "fields": "content"}, headers=header)
+    assert response.status_code == status.HTTP_200_OK
+    for tweet_dict_info in response.json():
+        assert tweet_dict_info["by"] == {
+            "user_id": user_info.user_id,
+            "first_name": user_info.first_name,
+            "last_name": user_info.last_name
+        }
+
+    tweet_id = user['tweet_1']["tweet_id"]
+    response = client.get(f'/tweets/{tweet_id}', params={"expand": "author"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == dict(user['tweet_1'], by=response.json()["by"])
+    assert response.json()["by"]["user_id"] == user_info.user_id
+
+
+@pytest.mark.show
+@pytest.mark.tweet
+def test_show_orphaned_tweets_expand_author(set_up_tweets):
+    db = next(override_get_db())
+    tweet_id = str(uuid4())
+    db.add(TweetDB(tweet_id=tweet_id, content="orphan", created_at=date.today(), user_id=str(uuid4())))
+    db.commit()
+    crud.clear_caches()
+
+    response = client.get('/', params={"expand": "author"})
+    assert response.status_code == status.HTTP_200_OK
+    assert {tweet["tweet_id"]: tweet["by"] for tweet in response.json()}[tweet_id] is None
+
+    response = client.get(f'/tweets/{tweet_id}', params={"expand": "author", "fields": "content"})
+    assert response.json() == {"content": "orphan", "by": None}
+
+
 @pytest.mark.create
 @pytest.mark.tweet
 def test_post_tweet(set_up_tweets):
@@ -11,6 +11,9 @@ from uuid import UUID
 # Models
 from models import User
 
+# Counters of a user without any activity
+no_activity = {"tweets_count": 0, "followers_count": 0, "following_count": 0, "last_tweet_at": None}
+
 
 # Fixtures
 @pytest.fixture
@@ -30,7 +33,8 @@ def test_register_user(hashed_password):
         "password": hashed_password,
         "country": "Peru",
         "birth_date": "2001-01-01",
-        "creation_account_date": "2022-09-09"
+        "creation_account_date": "2022-09-09",
+        **no_activity
     }
 
     data_to_send = {
@@ -114,7 +118,8 @@ def test_show_user(user, show_test, set_up_users):
         "last_name": user_to_search.last_name,
         "country": user_to_search.country,
         "birth_date": user_to_search.birth_date,
-        "creation_account_date": user_to_search.creation_account_date
+        "creation_account_date": user_to_search.creation_account_date,
+        **no_activity
     }
 
     assert response.status_code == status.HTTP_200_OK
@@ -132,6 +137,25 @@ def test_show_nonexistent_user(set_up_users):
     assert response.json()["detail"] == "User not found!"
 
 
+@pytest.mark.show
+@pytest.mark.user
+def test_show_users_with_fields(set_up_users):
+    dummy_header = set_up_users["header_1"]
+    user_to_search = set_up_users["user_2"]
+
+    response = client.get('/users', params={"fields": "user_id,first_name"}, headers=dummy_header)
+    assert response.status_code == status.HTTP_200_OK
+    for user_dict_info in response.json():
+        assert list(user_dict_info) == ["user_id", "first_name"]
+
+    response = client.get(f"/users/{user_to_search.user_id}", params={"fields": "email"}, headers=dummy_header)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"email": user_to_search.email}
+
+    response = client.get("/users/me", params={"fields": "password"}, headers=dummy_header)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 # Delete users Tests
 @pytest.mark.delete
 @pytest.mark.user
@@ -209,7 +233,7 @@ def test_update_user(set_up_users):
     response = client.put(f'/users/{user_id}/update', json=jsonable_encoder(data_to_send), headers=dummy_header)
 
     expected_response = data_to_send.copy()
-    expected_response.update({'user_id': user_id})
+    expected_response.update({'user_id': user_id, **no_activity})
     expected_response.pop("password")
 
     assert response.status_code == status.HTTP_200_OK